@@ -0,0 +1,114 @@
+"""
+Benchmark group membership resolution in AdobeConsoleConnector.
+
+Builds a synthetic Admin Console population and times load_users_and_groups()
+end-to-end, plus group member lookups against the legacy per-group scan.
+"""
+import argparse
+import logging
+import random
+import time
+from collections import defaultdict
+
+from user_sync.connector.directory_adobe_console import AdobeConsoleConnector
+
+
+class FakeConnection:
+    """
+    Minimal stand-in for umapi_client.Connection that serves users and groups from memory
+    """
+
+    def __init__(self, users, groups, page_size=2000, latency=0.0):
+        self.objects = {'user': users, 'group': groups}
+        self.page_size = page_size
+        self.latency = latency
+
+    def query_multiple(self, object_type, page=0, url_params=None, query_params=None):
+        if self.latency:
+            time.sleep(self.latency)
+        objects = self.objects[object_type]
+        start = page * self.page_size
+        values = objects[start:start + self.page_size]
+        last_page = start + self.page_size >= len(objects)
+        page_count = (len(objects) + self.page_size - 1) // self.page_size
+        return values, last_page, len(objects), page_count, page + 1, self.page_size
+
+
+def make_population(user_count, group_count, groups_per_user, seed=0):
+    rand = random.Random(seed)
+    group_names = ['Group {:04d}'.format(i) for i in range(group_count)]
+    groups = [{'groupName': g} for g in group_names]
+    users = []
+    for i in range(user_count):
+        users.append({
+            'username': 'user{}@example.com'.format(i),
+            'email': 'user{}@example.com'.format(i),
+            'domain': 'example.com',
+            'type': 'federatedID',
+            'firstname': 'First{}'.format(i),
+            'lastname': 'Last{}'.format(i),
+            'country': 'US',
+            'groups': rand.sample(group_names, groups_per_user),
+        })
+    return users, groups, group_names
+
+
+def make_connector(connection, page_prefetch=0):
+    connector = AdobeConsoleConnector.__new__(AdobeConsoleConnector)
+    connector.logger = logging.getLogger('bench')
+    connector.options = {}
+    connector.connection = connection
+    connector.filter_by_identity_type = 'all'
+    connector.page_prefetch = page_prefetch
+    connector.user_by_usr_key = {}
+    connector.user_keys_by_group = defaultdict(list)
+    return connector
+
+
+def legacy_group_members(connector, umapi_users, group):
+    """The pre-index implementation: a full scan of all users for every group"""
+    members = filter(lambda u: ('groups' in u and group.lower() in [g.lower() for g in u['groups']]), umapi_users)
+    for member in members:
+        yield connector.generate_user_key(member['type'], member['username'], member['domain'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--groups', type=int, default=500)
+    parser.add_argument('--groups-per-user', type=int, default=5)
+    parser.add_argument('--page-latency', type=float, default=0.0,
+                        help='simulated seconds per UMAPI page request')
+    parser.add_argument('--page-prefetch', type=int, default=0,
+                        help='number of user pages to request ahead of the one being processed')
+    parser.add_argument('--legacy-groups', type=int, default=10,
+                        help='number of groups to time with the legacy scan (it is slow)')
+    args = parser.parse_args()
+
+    users, groups, group_names = make_population(args.users, args.groups, args.groups_per_user)
+    connector = make_connector(FakeConnection(users, groups, latency=args.page_latency), args.page_prefetch)
+
+    start = time.perf_counter()
+    loaded = connector.load_users_and_groups(group_names, [], False)
+    elapsed = time.perf_counter() - start
+    print('load_users_and_groups: {} users, {} groups, {} grouped users in {:.2f}s'.format(
+        args.users, args.groups, len(loaded), elapsed))
+
+    start = time.perf_counter()
+    indexed_count = sum(1 for g in group_names for _ in connector.iter_group_members(g))
+    indexed = time.perf_counter() - start
+    print('indexed lookup, all {} groups: {} memberships in {:.4f}s'.format(args.groups, indexed_count, indexed))
+
+    sample = group_names[:args.legacy_groups]
+    start = time.perf_counter()
+    for g in sample:
+        for _ in legacy_group_members(connector, users, g):
+            pass
+    legacy = time.perf_counter() - start
+    projected = legacy / max(len(sample), 1) * args.groups
+    print('legacy scan, {} groups: {:.2f}s (projected {:.1f}s for all {} groups)'.format(
+        len(sample), legacy, projected, args.groups))
+
+
+if __name__ == '__main__':
+    main()
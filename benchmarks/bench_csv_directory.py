@@ -0,0 +1,96 @@
+"""
+Benchmark CSVDirectoryConnector.read_users throughput.
+
+Writes a synthetic user file and reports rows per second for the connector,
+with and without source attributes, and for the legacy csv.DictReader approach.
+"""
+import argparse
+import csv
+import os
+import tempfile
+import time
+
+from user_sync.connector.directory_csv import CSVDirectoryConnector
+from user_sync.connector.helper import create_blank_user
+from user_sync.helper import CSVAdapter
+from user_sync.identity_type import parse_identity_type
+
+COLUMNS = ['email', 'firstname', 'lastname', 'country', 'groups', 'type', 'username', 'domain']
+
+
+def write_users_file(path, row_count, groups_per_user=3):
+    with open(path, 'w', newline='', encoding='utf8') as f:
+        writer = csv.writer(f)
+        writer.writerow(COLUMNS)
+        for i in range(row_count):
+            groups = ','.join('Group {}'.format((i + g) % 200) for g in range(groups_per_user))
+            writer.writerow(['user{}@example.com'.format(i), 'First{}'.format(i), 'Last{}'.format(i), 'us',
+                             groups, 'federatedID', '', ''])
+
+
+def legacy_read(connector, path):
+    """The row-dict implementation read_users used before header-resolved column reads"""
+    get = connector.get_column_value
+    users = {}
+    for row in CSVAdapter.read_csv_rows(path, recognized_column_names=COLUMNS, logger=connector.logger):
+        email = get(row, 'email')
+        user = users.get(email)
+        if user is None:
+            user = users[email] = create_blank_user()
+            user['email'] = email
+        first_name = get(row, 'firstname')
+        if first_name is not None:
+            user['firstname'] = first_name
+        last_name = get(row, 'lastname')
+        if last_name is not None:
+            user['lastname'] = last_name
+        country = get(row, 'country')
+        if country is not None:
+            user['country'] = country.upper()
+        groups = get(row, 'groups')
+        if groups is not None:
+            user['groups'].extend(groups.split(','))
+            user['member_groups'] = user['groups']
+        user['username'] = get(row, 'username') or email
+        identity_type = get(row, 'type')
+        user['identity_type'] = parse_identity_type(identity_type) if identity_type else None
+        domain = get(row, 'domain')
+        if domain:
+            user['domain'] = domain
+        user['source_attributes'] = {col: get(row, col) for col in COLUMNS}
+    return users
+
+
+def timed(label, row_count, func):
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    print('{:<32} {:>10,} rows in {:6.2f}s  ({:>9,.0f} rows/s)'.format(label, row_count, elapsed, row_count / elapsed))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--file', help='existing CSV file to read instead of generating one')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.file
+        row_count = args.rows
+        if path is None:
+            path = os.path.join(tmp, 'users.csv')
+            write_users_file(path, row_count)
+        else:
+            with open(path, encoding='utf8') as f:
+                row_count = sum(1 for _ in f) - 1
+
+        connector = CSVDirectoryConnector({'file_path': path})
+        timed('legacy DictReader', row_count, lambda: legacy_read(connector, path))
+        timed('read_users (source attributes)', row_count, lambda: connector.read_users(path, []))
+        connector.set_source_attributes_required(False)
+        timed('read_users (no source attributes)', row_count, lambda: connector.read_users(path, []))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""
+Benchmark SignCache rebuild time.
+
+Fills a fresh cache with synthetic users, groups and group assignments the way
+SignConnector.refresh_all does, using the batch APIs and, optionally, the
+one-row-per-commit APIs for comparison.  Then times reading the users back as
+DetailedUserInfo objects and as lightweight records, and building the user index
+the sync engine works from.
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+from sign_client.model import DetailedUserInfo, GroupInfo, UserGroupInfo
+from user_sync.cache.sign import SignCache, SignUserIndex
+
+
+def make_users(count):
+    for i in range(count):
+        yield DetailedUserInfo(accountType='GLOBAL', email='user{}@example.com'.format(i), id='id{}'.format(i),
+                               isAccountAdmin=False, status='ACTIVE', firstName='First{}'.format(i),
+                               lastName='Last{}'.format(i))
+
+
+def make_user_groups(count, group_count):
+    for i in range(count):
+        yield 'id{}'.format(i), UserGroupInfo(id='group{}'.format(i % group_count), isGroupAdmin=False,
+                                              isPrimaryGroup=True, status='ACTIVE')
+
+
+def rebuild_batched(cache, user_count, groups):
+    cache.clear_all()
+    cache.cache_users(make_users(user_count))
+    cache.cache_groups(groups)
+    cache.cache_user_groups(make_user_groups(user_count, len(groups)))
+
+
+def rebuild_per_row(cache, user_count, groups):
+    cache.clear_all()
+    for user in make_users(user_count):
+        cache.cache_user(user)
+    for group in groups:
+        cache.cache_group(group)
+    for user_id, user_group in make_user_groups(user_count, len(groups)):
+        cache.cache_user_group(user_id, user_group)
+
+
+def legacy_user_index(cache):
+    """What update_sign_users did before SignUserIndex: split full users by status, then all groups by user"""
+    users = cache.get_users()
+    active = {u.email: u for u in users if u.status != 'INACTIVE'}
+    inactive = {u.email: u for u in users if u.status == 'INACTIVE'}
+    primary_groups = {user_id: [g for g in groups if g.isPrimaryGroup][0] for user_id, groups in cache.get_user_groups()}
+    return active, inactive, primary_groups
+
+
+def user_index(cache):
+    return SignUserIndex(cache.get_user_records(), cache.get_primary_user_groups())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=60000)
+    parser.add_argument('--groups', type=int, default=100)
+    parser.add_argument('--per-row', action='store_true', help='also time the one-row-per-commit APIs (slow)')
+    args = parser.parse_args()
+
+    groups = [GroupInfo(groupId='group{}'.format(i), groupName='Group {}'.format(i)) for i in range(args.groups)]
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = SignCache(Path(tmp), 'bench')
+        runs = [('batched', rebuild_batched)]
+        if args.per_row:
+            runs.append(('per row', rebuild_per_row))
+        for label, rebuild in runs:
+            start = time.perf_counter()
+            rebuild(cache, args.users, groups)
+            elapsed = time.perf_counter() - start
+            print('{:<8} rebuild of {:,} users: {:.2f}s'.format(label, args.users, elapsed))
+        reads = [('get_users', cache.get_users), ('get_user_records', cache.get_user_records),
+                 ('legacy index', lambda: legacy_user_index(cache)), ('SignUserIndex', lambda: user_index(cache))]
+        for label, read in reads:
+            start = time.perf_counter()
+            read()
+            elapsed = time.perf_counter() - start
+            print('{:<16} {:,} users: {:.3f}s'.format(label, args.users, elapsed))
+        cache.db_conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""
+Benchmark sign_client against a local stand-in for the Sign API.
+
+Starts a FakeSignServer with a synthetic account, then times a full cache
+rebuild with SignConnector.refresh_all and a SignSyncEngine.run against a
+synthetic directory that matches most Sign users, moves some to other groups
+and adds new ones.  Reports the requests the server handled, by route and status.
+"""
+import argparse
+import logging
+import tempfile
+import time
+from collections import Counter
+from copy import deepcopy
+
+from benchmarks.sign_server import ADMIN_EMAIL, add_server_arguments, server_from_arguments
+from user_sync.connector.connector_sign import SignConnector
+from user_sync.connector.directory import DirectoryConnector
+from user_sync.engine.sign import SignSyncEngine
+from user_sync.engine.umapi import AdobeGroup
+
+
+class SyntheticDirectory(DirectoryConnector):
+
+    def __init__(self, users):
+        super().__init__()
+        self.users = users
+
+    def load_users_and_groups(self, groups, extended_attributes=None, all_users=True):
+        return iter(self.users)
+
+
+def make_directory(sign_user_count, group_count, matched, moved, new):
+    """
+    Directory users for the first `matched` Sign users, of which every `moved`th is in the next group over,
+    and `new` users that aren't in Sign yet
+    """
+    users = []
+    for i in range(matched):
+        group = (i + 1 if moved and i % moved == 0 else i) % group_count
+        users.append({'email': 'user{}@example.com'.format(i), 'firstname': 'First', 'lastname': 'u{}'.format(i),
+                      'groups': ['Directory Group {}'.format(group)]})
+    for i in range(sign_user_count, sign_user_count + new):
+        users.append({'email': 'user{}@example.com'.format(i), 'firstname': 'First', 'lastname': 'u{}'.format(i),
+                      'groups': ['Directory Group {}'.format(i % group_count)]})
+    mappings = {}
+    for i in range(group_count):
+        mappings['Directory Group {}'.format(i)] = {'priority': i, 'roles': set(),
+                                                    'groups': [AdobeGroup('Group {}'.format(i), 'primary')]}
+    return users, mappings
+
+
+def report_requests(server, since):
+    counts = server.stats - since
+    for (method, route, status), count in sorted(counts.items()):
+        print('    {:>7,}  {:<4} {:<40} {}'.format(count, method, route, status))
+    return Counter(server.stats)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_server_arguments(parser)
+    parser.add_argument('--request-concurrency', type=int, default=10)
+    parser.add_argument('--max-request-concurrency', type=int)
+    parser.add_argument('--retry-count', type=int, default=5)
+    parser.add_argument('--matched', type=float, default=0.9, help='fraction of Sign users in the directory')
+    parser.add_argument('--move-every', type=int, default=20,
+                        help='every nth matched user is moved to another group (0 for none)')
+    parser.add_argument('--new-users', type=int, default=1000, help='directory users to create in Sign')
+    parser.add_argument('--log-level', default='WARNING')
+    args = parser.parse_args()
+    logging.basicConfig(level=args.log_level)
+
+    connection = {
+        'request_concurrency': args.request_concurrency,
+        'max_request_concurrency': args.max_request_concurrency,
+        'retry_count': args.retry_count,
+    }
+    server = server_from_arguments(args)
+    with server, tempfile.TemporaryDirectory() as tmp:
+        target = {'host': server.url, 'admin_email': ADMIN_EMAIL, 'integration_key': 'bench',
+                  'create_users': True, 'deactivate_users': False}
+        stats = Counter()
+
+        connector = SignConnector(dict(target), 'primary', False, connection, {'path': tmp})
+        start = time.perf_counter()
+        try:
+            connector.refresh_all()
+        finally:
+            connector.close()
+        elapsed = time.perf_counter() - start
+        print('refresh_all: {:,} users in {:.2f}s ({:,.0f} users/s)'.format(args.users, elapsed,
+                                                                           args.users / elapsed))
+        stats = report_requests(server, stats)
+
+        directory_users, mappings = make_directory(args.users, args.groups, int(args.users * args.matched),
+                                                   args.move_every, args.new_users)
+        options = deepcopy(SignSyncEngine.default_options)
+        options.update({
+            'test_mode': False,
+            'full_refresh': False,
+            'directory_group_filter': None,
+            'connection': connection,
+            'cache': {'path': tmp},
+        })
+        options['user_sync']['sign_only_limit'] = args.users + 1
+        engine = SignSyncEngine(options, {'primary': dict(target)})
+        start = time.perf_counter()
+        engine.run(mappings, SyntheticDirectory(directory_users))
+        elapsed = time.perf_counter() - start
+        summary = engine.org_action_summary(['primary'])
+        print('SignSyncEngine.run: {:,} directory users in {:.2f}s; {}'.format(
+            len(directory_users), elapsed, ', '.join('{} {}'.format(k, v) for k, v in summary.items())))
+        report_requests(server, stats)
+
+
+if __name__ == '__main__':
+    main()
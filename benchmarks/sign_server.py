@@ -0,0 +1,244 @@
+"""
+A local stand-in for the Sign v6 REST API, for load testing sign_client.
+
+Serves the endpoints sign_client uses (baseUris, users, users/{id},
+users/{id}/groups, users/{id}/state and groups) from an in-memory population,
+with configurable latency, page size, and injected 429 and 5xx responses.
+
+Run it on its own and point a connector's host at the printed URL, or start it
+in-process with FakeSignServer.start(), as bench_sign_server does.
+"""
+import argparse
+import asyncio
+import random
+import threading
+import uuid
+from collections import Counter
+
+from aiohttp import web
+
+ENDPOINT = '/api/rest/v6/'
+ADMIN_EMAIL = 'admin@example.com'
+
+
+class FakeSignServer:
+    """
+    In-memory Sign account served over http.  User i has the email user{i}@example.com and id u{i}, and
+    is in group g{i % group_count}.  The admin user is not counted in user_count.
+    """
+
+    def __init__(self, user_count=10000, group_count=50, page_size=1000, latency=0.0, throttle_rate=0.0,
+                 error_rate=0.0, retry_after=None, seed=0):
+        """
+        :param page_size: the most users or groups returned per page, whatever the client asks for
+        :param latency: seconds added to every response
+        :param throttle_rate: fraction of API calls answered with 429
+        :param error_rate: fraction of API calls answered with 503
+        :param retry_after: seconds sent in the Retry-After header of 429s, if any
+        """
+        self.page_size = page_size
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        # requests handled, by (method, route, status)
+        self.stats = Counter()
+        self.groups = {}
+        self.users = {}
+        self.user_ids_by_email = {}
+        self.user_groups = {}
+        for i in range(group_count):
+            self.groups[f'g{i}'] = {'groupId': f'g{i}', 'groupName': f'Group {i}', 'createdDate': '2020-01-01T00:00:00Z',
+                                    'isDefaultGroup': i == 0}
+        self.add_user('admin', ADMIN_EMAIL, 'g0', is_admin=True)
+        for i in range(user_count):
+            self.add_user(f'u{i}', f'user{i}@example.com', f'g{i % group_count}')
+        self.url = None
+        self._loop = None
+        self._runner = None
+        self._thread = None
+
+    def add_user(self, user_id, email, group_id, is_admin=False):
+        self.users[user_id] = {
+            'id': user_id, 'email': email, 'accountType': 'GLOBAL', 'isAccountAdmin': is_admin, 'status': 'ACTIVE',
+            'accountId': 'account', 'firstName': 'First', 'lastName': user_id, 'initials': 'FL', 'locale': 'en_US',
+            'createdDate': '2020-01-01T00:00:00Z', 'primaryGroupId': group_id,
+        }
+        self.user_ids_by_email[email] = user_id
+        self.user_groups[user_id] = [self.user_group(group_id)]
+
+    def user_group(self, group_id, is_group_admin=False):
+        return {'id': group_id, 'name': self.groups[group_id]['groupName'], 'isGroupAdmin': is_group_admin,
+                'isPrimaryGroup': True, 'status': 'ACTIVE', 'createdDate': '2020-01-01T00:00:00Z'}
+
+    def app(self):
+        app = web.Application(middlewares=[self.inject])
+        app.router.add_get(ENDPOINT + 'baseUris', self.base_uris)
+        app.router.add_get(ENDPOINT + 'users', self.list_users)
+        app.router.add_post(ENDPOINT + 'users', self.insert_user)
+        app.router.add_get(ENDPOINT + 'users/{user_id}', self.get_user)
+        app.router.add_put(ENDPOINT + 'users/{user_id}', self.update_user)
+        app.router.add_get(ENDPOINT + 'users/{user_id}/groups', self.get_user_groups)
+        app.router.add_put(ENDPOINT + 'users/{user_id}/groups', self.update_user_groups)
+        app.router.add_put(ENDPOINT + 'users/{user_id}/state', self.update_user_state)
+        app.router.add_get(ENDPOINT + 'groups', self.list_groups)
+        app.router.add_post(ENDPOINT + 'groups', self.create_group)
+        return app
+
+    @web.middleware
+    async def inject(self, request, handler):
+        route = request.match_info.route.resource.canonical if request.match_info.route.resource else request.path
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        # baseUris is called without retries, so it is never failed
+        if not route.endswith('baseUris'):
+            roll = self.random.random()
+            if roll < self.throttle_rate:
+                headers = {'Retry-After': str(self.retry_after)} if self.retry_after is not None else None
+                response = web.json_response({'code': 'THROTTLING', 'message': 'Too many requests'}, status=429,
+                                             headers=headers)
+                self.stats[request.method, route, response.status] += 1
+                return response
+            if roll < self.throttle_rate + self.error_rate:
+                self.stats[request.method, route, 503] += 1
+                return web.json_response({'code': 'SERVICE_UNAVAILABLE', 'message': 'Try again'}, status=503)
+        response = await handler(request)
+        self.stats[request.method, route, response.status] += 1
+        return response
+
+    def page(self, request, objects):
+        page_size = min(int(request.query.get('pageSize', self.page_size)), self.page_size)
+        start = int(request.query.get('cursor', 0))
+        page = {'nextCursor': str(start + page_size)} if start + page_size < len(objects) else {}
+        return objects[start:start + page_size], page
+
+    def not_found(self, user_id):
+        return web.json_response({'code': 'INVALID_USER_ID', 'message': f'No user {user_id}'}, status=404)
+
+    async def base_uris(self, request):
+        return web.json_response({'apiAccessPoint': self.url, 'webAccessPoint': self.url})
+
+    async def list_users(self, request):
+        # listing returns a few fields per user, in a stable order so cursors stay valid
+        users, page = self.page(request, list(self.users.values()))
+        fields = ('id', 'email', 'isAccountAdmin', 'accountId', 'company', 'firstName', 'lastName')
+        return web.json_response({'userInfoList': [{f: u[f] for f in fields if f in u} for u in users],
+                                  'page': page})
+
+    async def insert_user(self, request):
+        data = await request.json()
+        if data['email'] in self.user_ids_by_email:
+            return web.json_response({'code': 'EMAIL_ALREADY_EXISTS', 'message': 'User exists'}, status=409)
+        user_id = uuid.uuid4().hex
+        self.add_user(user_id, data['email'], next(iter(self.groups)), data.get('isAccountAdmin', False))
+        self.users[user_id].update({k: data[k] for k in ('firstName', 'lastName') if k in data})
+        return web.json_response({'userId': user_id}, status=201)
+
+    async def get_user(self, request):
+        user_id = request.match_info['user_id']
+        if user_id not in self.users:
+            return self.not_found(user_id)
+        return web.json_response(self.users[user_id])
+
+    async def update_user(self, request):
+        user_id = request.match_info['user_id']
+        if user_id not in self.users:
+            return self.not_found(user_id)
+        data = await request.json()
+        self.users[user_id].update({k: v for k, v in data.items() if k not in ('id', 'email', 'status')})
+        return web.Response()
+
+    async def get_user_groups(self, request):
+        user_id = request.match_info['user_id']
+        if user_id not in self.users:
+            return self.not_found(user_id)
+        return web.json_response({'groupInfoList': self.user_groups[user_id]})
+
+    async def update_user_groups(self, request):
+        user_id = request.match_info['user_id']
+        if user_id not in self.users:
+            return self.not_found(user_id)
+        groups = (await request.json())['groupInfoList']
+        if any(g['id'] not in self.groups for g in groups):
+            return web.json_response({'code': 'INVALID_GROUP_ID', 'message': 'No such group'}, status=404)
+        self.user_groups[user_id] = [self.user_group(g['id'], g.get('isGroupAdmin', False)) for g in groups]
+        return web.Response()
+
+    async def update_user_state(self, request):
+        user_id = request.match_info['user_id']
+        if user_id not in self.users:
+            return self.not_found(user_id)
+        self.users[user_id]['status'] = (await request.json())['state']
+        return web.json_response({'code': 'OK'})
+
+    async def list_groups(self, request):
+        groups, page = self.page(request, list(self.groups.values()))
+        return web.json_response({'groupInfoList': groups, 'page': page})
+
+    async def create_group(self, request):
+        name = (await request.json())['name']
+        if any(g['groupName'].lower() == name.lower() for g in self.groups.values()):
+            return web.json_response({'code': 'GROUP_ALREADY_EXISTS', 'message': 'Group exists'}, status=409)
+        group_id = uuid.uuid4().hex
+        self.groups[group_id] = {'groupId': group_id, 'groupName': name, 'createdDate': '2020-01-01T00:00:00Z',
+                                 'isDefaultGroup': False}
+        return web.json_response({'id': group_id}, status=201)
+
+    def start(self, port=0):
+        """
+        Serve from a background thread
+        :return: the server URL, usable as a connector's host
+        """
+        self._loop = asyncio.new_event_loop()
+        self._runner = web.AppRunner(self.app(), access_log=None)
+        self._loop.run_until_complete(self._runner.setup())
+        site = web.TCPSite(self._runner, '127.0.0.1', port)
+        self._loop.run_until_complete(site.start())
+        self.url = 'http://127.0.0.1:{}/'.format(site._server.sockets[0].getsockname()[1])
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+        return self.url
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+
+def add_server_arguments(parser):
+    parser.add_argument('--users', type=int, default=10000, help='Sign users in the account')
+    parser.add_argument('--groups', type=int, default=50)
+    parser.add_argument('--page-size', type=int, default=1000, help='most users or groups returned per page')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every response')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='fraction of calls answered with 429')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of calls answered with 503')
+    parser.add_argument('--retry-after', type=int, help='Retry-After seconds sent with 429s')
+
+
+def server_from_arguments(args):
+    return FakeSignServer(args.users, args.groups, args.page_size, args.latency, args.throttle_rate,
+                          args.error_rate, args.retry_after)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_server_arguments(parser)
+    parser.add_argument('--port', type=int, default=8080)
+    args = parser.parse_args()
+    server = server_from_arguments(args)
+    server.url = 'http://127.0.0.1:{}/'.format(args.port)
+    print('Serving {} Sign users at {}'.format(args.users, server.url))
+    web.run_app(server.app(), host='127.0.0.1', port=args.port, print=None)
+
+
+if __name__ == '__main__':
+    main()
@@ -39,7 +39,9 @@ setup(name='sign-client',
       license='MIT',
       packages=find_packages(),
       install_requires=[
-        "requests~=2.26.0",
         "aiohttp~=3.8.1",
       ],
+      extras_require={
+          'fast': ['orjson'],
+      },
       zip_safe=False)
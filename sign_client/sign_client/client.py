@@ -1,22 +1,37 @@
 import asyncio
-import json
 import logging
+import random
+from collections import namedtuple
 from math import ceil
 
 import aiohttp
-import requests
 
 from aiohttp.client_exceptions import ServerTimeoutError
 
 from .error import AssertionException, TimeoutException
+from .throttle import AdaptiveLimiter, TokenBucket, is_throttled, parse_retry_after
 
-from .model import GroupInfo, UsersInfo, DetailedUserInfo, GroupsInfo, UserGroupsInfo, JSONEncoder, DetailedGroupInfo, UserStateInfo
+from .model import GroupInfo, UsersInfo, DetailedUserInfo, GroupsInfo, UserGroupsInfo, DetailedGroupInfo, UserStateInfo, dumps, loads
 
+# outcome of inserting a user: user_id is set once the user exists, error describes whatever failed
+InsertedUser = namedtuple('InsertedUser', ['user', 'user_id', 'error'])
 
-class SignClient:
+
+class AsyncSignClient:
+    """
+    Client for the Sign API.  Every method is a coroutine, and every call shares one session, so the client
+    must only be used on one event loop.  Use it as an async context manager, or call close() when done.
+    """
     _endpoint = 'api/rest/v6/'
     USER_PAGE_SIZE = 1000
     GROUP_PAGE_SIZE = 1000
+    # idle connections are kept open between batches and sync calls, so they aren't renegotiated
+    KEEPALIVE_TIMEOUT = 60
+    DNS_CACHE_TTL = 300
+    # retries back off exponentially (with jitter) from RETRY_BASE_WAIT up to RETRY_MAX_WAIT seconds,
+    # unless the server says how long to wait
+    RETRY_BASE_WAIT = 2
+    RETRY_MAX_WAIT = 120
 
     def __init__(self, connection, host, integration_key, admin_email, logger=None):
         self.host = host
@@ -26,22 +41,30 @@ class SignClient:
         self.groups = []
         self.max_sign_retries = connection.get('retry_count') or 5
         self.concurrency_limit = connection.get('request_concurrency') or 1
+        self.max_concurrency_limit = connection.get('max_request_concurrency') or self.concurrency_limit * 4
+        # shared by every request this client makes, sync or async
+        self.limiter = AdaptiveLimiter(self.concurrency_limit, self.max_concurrency_limit)
+        self.rate_limiter = TokenBucket(connection.get('requests_per_second'))
         timeout = connection.get('timeout') or 120
         self.batch_size = connection.get('batch_size') or 10000
         self.logger = logger or logging.getLogger("sign_client_{}".format(self.integration_key[0:4]))
         logging.getLogger("urllib3").setLevel(logging.WARNING)
         self.timeout = aiohttp.ClientTimeout(total=None, sock_connect=timeout, sock_read=timeout)
-        self.loop = asyncio.get_event_loop()
-        self.users = {}
-        self.user_groups = {}
+        self._session = None
 
-    def _init(self):
-        self.api_url = self.base_uri()
-        self.groups = self.get_groups()
+    async def __aenter__(self):
+        return self
 
-    def sign_groups(self):
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def _init(self):
         if self.api_url is None or self.groups is None:
-            self._init()
+            self.api_url = await self.base_uri()
+            self.groups = await self.get_groups()
+
+    async def sign_groups(self):
+        await self._init()
         return self.groups
 
     def header(self):
@@ -66,180 +89,310 @@ class SignClient:
         json_headers.update(self.header())
         return json_headers
 
-    def base_uri(self):
+    async def _get_session(self):
+        """
+        Get the session shared by every call this client makes, creating it on first use
+        :return: aiohttp.ClientSession
+        """
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_concurrency_limit,
+                                             keepalive_timeout=self.KEEPALIVE_TIMEOUT,
+                                             ttl_dns_cache=self.DNS_CACHE_TTL)
+            self._session = aiohttp.ClientSession(connector=connector, trust_env=True, timeout=self.timeout)
+        return self._session
+
+    async def close(self):
+        """
+        Close the shared session and its connections.  The client can still be used afterwards,
+        in which case a new session is created.
+        """
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def _request_once(self, method, url, header, data=None):
+        """
+        Make a single call, without retries, on the shared session
+        :return: (status, reason, body)
+        """
+        status, reason, _, body = await self._request(await self._get_session(), method, url, header, data)
+        return status, reason, body
+
+    async def _request(self, session, method, url, header, data=None):
+        """
+        Make a single call, once the rate limit and the adaptive concurrency limit allow it.
+        The outcome feeds back into both limits.
+        :return: (status, reason, headers, body)
+        """
+        await self.rate_limiter.acquire()
+        started = await self.limiter.acquire()
+        status = None
+        timed_out = False
+        try:
+            async with session.request(method=method, url=url, headers=header, data=data) as r:
+                status = r.status
+                if is_throttled(status):
+                    retry_after = parse_retry_after(r.headers.get('Retry-After'))
+                    if retry_after:
+                        # hold back every request, not just this one
+                        self.logger.warning(f'Server asked to retry after {retry_after} seconds; pausing requests')
+                        self.rate_limiter.pause(retry_after)
+                return status, r.reason, r.headers, await r.text()
+        except asyncio.TimeoutError:
+            # includes aiohttp's ServerTimeoutError
+            timed_out = True
+            raise
+        finally:
+            await self.limiter.release(started, status, timed_out)
+
+    async def base_uri(self):
         """
         This function validates that the SIGN integration key is valid.
         :return: dict()
         """
 
-        url = 'https://' + self.host + '/' + self._endpoint
+        # the host may name its scheme, e.g. to point at a local stand-in server over plain http
+        host = self.host if '://' in self.host else 'https://' + self.host
+        url = host.rstrip('/') + '/' + self._endpoint
 
         url_path = 'baseUris'
         access_point_key = 'apiAccessPoint'
 
-        result = requests.get(url + url_path, headers=self.header())
-        if result.status_code != 200:
+        status, reason, body = await self._request_once('GET', url + url_path, self.header())
+        if status != 200:
             raise AssertionException(
                 "Error getting base URI from Sign API, is API key valid? (error: {}, reason: {}, {})".format
-                (result.status_code, result.reason, result.content))
+                (status, reason, body))
 
-        if access_point_key not in result.json():
+        result = loads(body)
+        if access_point_key not in result:
             raise AssertionException("Error getting base URI for Sign API, result invalid")
 
-        return result.json()[access_point_key] + self._endpoint
+        return result[access_point_key] + self._endpoint
+
+    async def _paginate_get(self, base_url, list_attr, constructor, page_size) -> list:
+        return [r async for page in self._paginate_async(base_url, list_attr, constructor, page_size) for r in page]
 
-    def _paginate_get(self, base_url, list_attr, constructor, page_size) -> list:
-        all_results = []
+    async def _paginate_async(self, base_url, list_attr, constructor, page_size):
+        """
+        Yield each page of a cursor-paginated listing as soon as it arrives
+        """
         cursor = None
         while True:
             if cursor is not None:
                 cursor_str = f"&cursor={cursor}"
             else:
                 cursor_str = ""
-            result, _ = self.call_with_retry_sync('GET', f"{base_url}?pageSize={str(page_size)}{cursor_str}", self.header_json())
+            result, _ = await self.call_with_retry_async('GET', f"{base_url}?pageSize={str(page_size)}{cursor_str}", self.header_json())
             result = constructor(result)
-            all_results.extend(getattr(result, list_attr))
+            yield getattr(result, list_attr)
             cursor = result.page.nextCursor
             if cursor is None:
                 break
-        return all_results
 
-    def get_users(self, user_ids=None):
+    async def list_users(self) -> list:
         """
-        Gets the full user list, and then extracts the user ID's for making calls
-        We return self.users because it will be filled by the _get_user method.  This is
-        necessary to avoid returning futures of calls which we cannot predict.
+        List all users, other than the admin user.  Listing only returns a few fields per user, but is far
+        cheaper than getting each user's details.
+        :return: list of UserInfo
         """
-        if self.api_url is None or self.groups is None:
-            self._init()
+        await self._init()
+        self.logger.info('Listing Sign users')
+        users = await self._paginate_get(f"{self.api_url}users", 'userInfoList', UsersInfo.from_dict, self.USER_PAGE_SIZE)
+        return [u for u in users if u.email != self.admin_email]
+
+    async def get_users(self, user_ids=None):
+        """
+        Get details of the given users, or of all users if no ids are given
+        :return: dict of DetailedUserInfo by email
+        """
+        return {user.email: user async for user in self.aiter_users(user_ids)}
 
+    async def aiter_users(self, user_ids=None):
+        """
+        Yield details of the given users, or of all users if no ids are given, in the order they arrive.
+        Only a bounded number of users are held at any time, so the caller should consume them as they come.
+        :return: async iterator of DetailedUserInfo
+        """
+        await self._init()
         if user_ids is None or len(user_ids) == 0:
             self.logger.info('Getting list of all Sign users')
-            user_list = self._paginate_get(f"{self.api_url}users", 'userInfoList', UsersInfo.from_dict, self.USER_PAGE_SIZE)
-            user_ids = [u.id for u in user_list]
+            # details are fetched for each page of the listing while the next one is requested
+            async def list_user_ids():
+                async for page in self._paginate_async(f"{self.api_url}users", 'userInfoList',
+                                                       UsersInfo.from_dict, self.USER_PAGE_SIZE):
+                    for user in page:
+                        yield user.id
         else:
             self.logger.info(f'Getting details for {len(user_ids)} Sign user(s)')
-
-        self._handle_calls(self._get_user, self.header_json(), user_ids)
-        return self.users
-
-
-    def get_user_groups(self, user_ids):
-        if self.api_url is None or self.groups is None:
-            self._init()
+            async def list_user_ids():
+                for user_id in user_ids:
+                    yield user_id
+        users = self._stream_calls(self._get_user, self.header_json(), list_user_ids())
+        try:
+            async for user in users:
+                yield user
+        finally:
+            # closed here rather than by the garbage collector, so its calls stop while the loop is running
+            await users.aclose()
+
+    async def get_user_groups(self, user_ids):
+        """
+        :return: dict of UserGroupsInfo by user id
+        """
+        await self._init()
         self.logger.info(f'Getting groups for {len(user_ids)} Sign users')
-        self._handle_calls(self._get_user_groups, self.header_json(), user_ids)
-        return self.user_groups
+        user_groups = {}
+        await self._handle_calls(self._get_user_groups, self.header_json(), user_ids, user_groups)
+        return user_groups
 
-    def update_users(self, users):
+    async def update_users(self, users: list[DetailedUserInfo]) -> dict[str, str]:
         """
-        Passthrough for call handling
+        Update many users concurrently
+        :return: error message by user id, for the users that couldn't be updated
         """
-        self._handle_calls(self._update_user, self.header_json(), users)
+        errors = {}
+        await self._handle_calls(self._update_user, self.header_json(), users, errors)
+        return errors
 
-    def update_user_groups(self, user_groups: list[tuple[str, UserGroupsInfo]]):
+    async def update_user_groups(self, user_groups: list[tuple[str, UserGroupsInfo]]) -> dict[str, str]:
         """
         Process assignment of groups for a list of users
+        :param user_groups: list of (user id, groups to assign) pairs
+        :return: error message by user id, for the users whose groups couldn't be assigned
         """
-        self._handle_calls(self._update_user_groups, self.header_json(), user_groups)
+        errors = {}
+        await self._handle_calls(self._update_user_groups, self.header_json(), user_groups, errors)
+        return errors
 
-    def update_user_groups_single(self, user_id: str, user_groups: UserGroupsInfo):
+    async def update_user_groups_single(self, user_id: str, user_groups: UserGroupsInfo):
         """
         Assign user groups to a single user
         :param data: dict()
         """
-        if self.api_url is None or self.groups is None:
-            self._init()
+        await self._init()
 
-        res = requests.put(f"{self.api_url}users/{user_id}/groups", headers=self.header_json(), data=json.dumps(user_groups, cls=JSONEncoder))
+        status, reason, _ = await self._request_once('PUT', f"{self.api_url}users/{user_id}/groups", self.header_json(),
+                                               dumps(user_groups))
 
-        if res.status_code < 200 or res.status_code > 299:
-            raise AssertionException(f"Failed to assign groups to user '{user_id}' (code: {res.status_code} reason: {res.reason})")
+        if status < 200 or status > 299:
+            raise AssertionException(f"Failed to assign groups to user '{user_id}' (code: {status} reason: {reason})")
 
-    def get_groups(self):
+    async def get_groups(self):
         """
         API request to get group information
         :return: dict()
         """
         if self.api_url is None:
-            self.api_url = self.base_uri()
+            self.api_url = await self.base_uri()
 
         self.logger.info('getting Sign user groups')
-        groups = self._paginate_get(f"{self.api_url}groups", 'groupInfoList', GroupsInfo.from_dict, self.GROUP_PAGE_SIZE)
+        groups = await self._paginate_get(f"{self.api_url}groups", 'groupInfoList', GroupsInfo.from_dict, self.GROUP_PAGE_SIZE)
         return groups
 
-    def create_group(self, group: DetailedGroupInfo):
+    async def create_group(self, group: DetailedGroupInfo):
         """
         Create a new group in Sign
         :param group: str
         :return:
         """
-        if self.api_url is None or self.groups is None:
-            self._init()
+        await self._init()
         url = f"{self.api_url}groups"
         header = self.header_json()
-        data = json.dumps(group, cls=JSONEncoder)
+        data = dumps(group)
         self.logger.info(f'Creating Sign group {group.name}')
-        res, code = self.call_with_retry_sync('POST', url, header, data)
+        res, code = await self.call_with_retry_async('POST', url, header, data)
         if code > 299:
             raise AssertionException(f"Failed to create Sign group '{group.name}' (reason: {res.reason})")
         self.groups.append(GroupInfo(
             groupName=group.name,
-            groupId=group.id,
+            groupId=res['id'],
             createdDate=group.createdDate,
             isDefaultGroup=group.isDefaultGroup,
         ))
         return res['id']
 
-    def insert_user(self, user: DetailedUserInfo) -> str:
+    async def create_groups(self, groups: list[DetailedGroupInfo]) -> tuple[list[GroupInfo], dict[str, str]]:
+        """
+        Create many groups concurrently
+        :return: (the groups that were created, error message by name of the groups that weren't)
+        """
+        created = {}
+        errors = {}
+        await self._handle_calls(self._create_group, self.header_json(), groups, created, errors)
+        created_groups = [created[g.name] for g in groups if g.name in created]
+        self.groups.extend(created_groups)
+        return created_groups, errors
+
+    async def insert_user(self, user: DetailedUserInfo) -> str:
         """
         Insert Sign user
         """
-        if self.api_url is None or self.groups is None:
-            self._init()
+        await self._init()
 
-        res = requests.post(f"{self.api_url}users", headers=self.header_json(), data=json.dumps(user, cls=JSONEncoder))
+        status, reason, body = await self._request_once('POST', f"{self.api_url}users", self.header_json(),
+                                                  dumps(user))
         # Response status code 201 is successful insertion
-        if res.status_code < 200 or res.status_code > 299:
-            raise AssertionException(f"Failed to insert user '{user.email}' (code: {res.status_code} reason: {res.reason})")
-        return res.json()['userId']
+        if status < 200 or status > 299:
+            raise AssertionException(f"Failed to insert user '{user.email}' (code: {status} reason: {reason})")
+        return loads(body)['userId']
 
-    def update_user_state(self, user_id: str, state: UserStateInfo):
+    async def insert_users(self, new_users: list[tuple[DetailedUserInfo, UserGroupsInfo]]) -> list[InsertedUser]:
+        """
+        Insert users and assign each one its groups as soon as its id comes back.  Users are inserted
+        concurrently, and a failure only affects the user it happened to.
+        :param new_users: list of (user, groups to assign) pairs
+        :return: InsertedUser for each of new_users, in the same order
+        """
+        results = {}
+        await self._handle_calls(self._insert_user, self.header_json(), new_users, results)
+        return [results[user.email] for user, _ in new_users]
+
+    async def update_user_state(self, user_id: str, state: UserStateInfo):
         """
         Deactivate Sign user
         :param data: dict()
         """
-        if self.api_url is None or self.groups is None:
-            self._init()
+        await self._init()
+
+        status, _, body = await self._request_once('PUT', f"{self.api_url}users/{user_id}/state", self.header_json(),
+                                             dumps(state))
 
-        res = requests.put(f"{self.api_url}users/{user_id}/state", headers=self.header_json(),
-                           data=json.dumps(state, cls=JSONEncoder))
+        if status < 200 or status > 299:
+            error = loads(body)
+            raise AssertionException(f"Failed to change state of user '{user_id}' to '{state.state}' (code: {status} reason: {error['message']})")
 
-        if res.status_code < 200 or res.status_code > 299:
-            error = res.json()
-            raise AssertionException(f"Failed to change state of user '{user_id}' to '{state.state}' (code: {res.status_code} reason: {error['message']})")
+    async def update_user_states(self, user_states: list[tuple[str, UserStateInfo]]) -> dict[str, str]:
+        """
+        Change the state of many users concurrently
+        :param user_states: list of (user id, new state) pairs
+        :return: error message by user id, for the users whose state couldn't be changed
+        """
+        errors = {}
+        await self._handle_calls(self._update_user_state, self.header_json(), user_states, errors)
+        return errors
 
-    def _handle_calls(self, handle, headers, objects):
+    async def _handle_calls(self, handle, headers, objects, *args):
         """
         Batches and executes handle for each of o in objects
         handle: reference to function which will be called
         headers: api headers (common to all requests)
         objects: list of objects, which will be iterated through - and handle called on each
+        args: any further arguments to handle
         """
 
-        if self.api_url is None or self.groups is None:
-            self._init()
+        await self._init()
 
         # Execute calls by batches.  This reduces the memory stack, since we do not need to create all
-        # coroutines before starting execution.  We call run_until_complete for each set until all sets have run
+        # coroutines before starting execution.  Each set is awaited before the next one is created
         set_number = 1
         batch_count = ceil(len(objects) / self.batch_size)
         for i in range(0, len(objects), self.batch_size):
             self.logger.info("Batching calls to {} - batch {}/{}".format(handle.__name__, set_number, batch_count))
-            self.loop.run_until_complete(self._await_calls(handle, headers, objects[i:i + self.batch_size]))
+            await self._await_calls(handle, headers, objects[i:i + self.batch_size], *args)
             set_number += 1
 
-    async def _await_calls(self, handle, headers, objects):
+    async def _await_calls(self, handle, headers, objects, *args):
         """
         Where we actually await the coroutines. Must be own method, in order to be handled by loop
         """
@@ -247,57 +400,119 @@ class SignClient:
         if not objects:
             return
 
-            # Semaphore specifies number of allowed calls at one time
-        sem = asyncio.Semaphore(value=self.concurrency_limit)
-
-        # We must use only 1 session, else will hang
-        async with aiohttp.ClientSession(trust_env=True, timeout=self.timeout) as session:
-            # prepare a list of calls to make * Note: calls are prepared by using call
-            # syntax (eg, func() and not func), but they will not be run until executed by the wait
-            # split into batches of self.bach_size to avoid taking too much memory
-            calls = [handle(sem, o, headers, session) for o in objects]
-            await asyncio.wait(calls)
-
-    async def _get_user(self, semaphore, user_id, header, session):
-
-        # This will block the method from executing until a position opens
-        async with semaphore:
-            user_url = self.api_url + 'users/' + user_id
-            user, code = await self.call_with_retry_async('GET', user_url, header, session=session)
-            if code > 299:
-                self.logger.error(f"Error fetching user '{user_id}' with response: {user}")
-                return
-            user = DetailedUserInfo.from_dict(user)
-            if user.email == self.admin_email:
+        # Semaphore caps the number of calls in progress; the adaptive limiter decides how many are in flight
+        sem = asyncio.Semaphore(value=self.max_concurrency_limit)
+
+        # every batch shares the client's session, so connections opened by one are reused by the next
+        session = await self._get_session()
+        # prepare a list of calls to make * Note: calls are prepared by using call
+        # syntax (eg, func() and not func), but they will not be run until executed by the wait
+        # split into batches of self.bach_size to avoid taking too much memory
+        calls = [asyncio.ensure_future(handle(sem, o, headers, session, *args)) for o in objects]
+        # handlers report the failures they expect; anything else is raised once all the calls are done
+        results = await asyncio.gather(*calls, return_exceptions=True)
+        failures = [r for r in results if isinstance(r, BaseException)]
+        if failures:
+            raise failures[0]
+
+    async def _stream_calls(self, handle, headers, objects):
+        """
+        Call handle(o, headers, session) for each of the objects that arrive from an async iterator, and yield
+        the results (other than None) as they complete.  Objects and results pass through queues of at most
+        batch_size, so calls start while the iterator is still producing, and the iterator is held back when
+        the workers or the consumer fall behind.
+        """
+        session = await self._get_session()
+        pending = asyncio.Queue(maxsize=self.batch_size)
+        results = asyncio.Queue(maxsize=self.batch_size)
+        done = object()
+        worker_count = self.max_concurrency_limit
+
+        async def produce():
+            try:
+                async for o in objects:
+                    await pending.put(o)
+            except Exception as e:
+                await results.put(e)
                 return
-            self.users[user.email] = user
-            self.logger.debug(f'retrieved user details for Sign user {user.email}')
+            for _ in range(worker_count):
+                await pending.put(done)
+
+        async def worker():
+            while True:
+                o = await pending.get()
+                if o is done:
+                    await results.put(done)
+                    return
+                try:
+                    result = await handle(o, headers, session)
+                except Exception as e:
+                    # e.g. a dropped connection, which isn't retried; a worker that stopped here would
+                    # leave the queues undrained and the stream stuck
+                    self.logger.error(f"Error calling {handle.__name__} for '{o}': {e}")
+                    continue
+                if result is not None:
+                    await results.put(result)
+
+        tasks = [asyncio.ensure_future(produce())] + [asyncio.ensure_future(worker()) for _ in range(worker_count)]
+        try:
+            finished = 0
+            while finished < worker_count:
+                result = await results.get()
+                if result is done:
+                    finished += 1
+                elif isinstance(result, Exception):
+                    raise result
+                else:
+                    yield result
+        finally:
+            for task in tasks:
+                task.cancel()
+            # let them finish cancelling, so none is still running when the session or loop is closed
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _get_user(self, user_id, header, session):
+        user_url = self.api_url + 'users/' + user_id
+        user, code = await self.call_with_retry_async('GET', user_url, header, session=session)
+        if code > 299:
+            self.logger.error(f"Error fetching user '{user_id}' with response: {user}")
+            return
+        user = DetailedUserInfo.from_dict(user)
+        if user.email == self.admin_email:
+            return
+        self.logger.debug(f'retrieved user details for Sign user {user.email}')
+        return user
 
 
-    async def _get_user_groups(self, semaphore, user_id, header, session):
+    async def _get_user_groups(self, semaphore, user_id, header, session, user_groups):
         async with semaphore:
             url = f"{self.api_url}users/{user_id}/groups"
-            groups, code = await self.call_with_retry_async('GET', url, header, session=session)
-            if code > 299:
-                self.logger.error(f"Error fetching groups for user '{user_id}' with response: {groups}")
+            try:
+                groups, _ = await self.call_with_retry_async('GET', url, header, session=session)
+            except Exception as e:
+                # the user is left out, and its groups are fetched again by a later sync
+                self.logger.error(f"Error fetching groups for user '{user_id}': {e}")
                 return
             groups = UserGroupsInfo.from_dict(groups)
-            self.user_groups[user_id] = groups
+            user_groups[user_id] = groups
             self.logger.debug(f'retrieved user group details for Sign user {user_id}')
 
-    async def _update_user(self, semaphore, user, headers, session):
+    async def _update_user(self, semaphore, user, headers, session, errors):
         """
         Update Sign user
         """
         # This will block the method from executing until a position opens
         async with semaphore:
             url = f"{self.api_url}users/{user.id}"
-            body, code = await self.call_with_retry_async('PUT', url, headers, data=json.dumps(user, cls=JSONEncoder), session=session)
+            try:
+                await self.call_with_retry_async('PUT', url, headers, data=dumps(user), session=session)
+            except Exception as e:
+                errors[user.id] = f"Failed to update user '{user.email}': {e}"
+                return
             self.logger.info(f"Updated Sign User: {user.email}")
-            if code > 299:
-                self.logger.error(f"Error updating user '{user.email}' (code {code}) with response: {body}")
 
-    async def _update_user_groups(self, semaphore, user_group_data: tuple[str, UserGroupsInfo], headers, session):
+    async def _update_user_groups(self, semaphore, user_group_data: tuple[str, UserGroupsInfo], headers, session,
+                                  errors):
         """
         Update Sign user
         """
@@ -305,54 +520,209 @@ class SignClient:
         user_id, group_data = user_group_data
         async with semaphore:
             url = f"{self.api_url}users/{user_id}/groups"
-            body, code = await self.call_with_retry_async('PUT', url, headers, data=json.dumps(group_data, cls=JSONEncoder), session=session)
+            try:
+                await self.call_with_retry_async('PUT', url, headers, data=dumps(group_data), session=session)
+            except Exception as e:
+                errors[user_id] = f"Failed to assign groups to user '{user_id}': {e}"
+                return
             self.logger.info(f"Updated Sign User: {user_id}")
-            if code > 299:
-                self.logger.error(f"Error updating user '{user_id}' (code {code}) with response: {body}")
 
-    def call_with_retry_sync(self, method, url, header, data=None):
+    async def _create_group(self, semaphore, group: DetailedGroupInfo, headers, session, created, errors):
+        """
+        Create a Sign group
+        """
+        async with semaphore:
+            try:
+                res, _ = await self.call_with_retry_async('POST', f"{self.api_url}groups", headers, data=dumps(group),
+                                                          session=session)
+            except Exception as e:
+                errors[group.name] = f"Failed to create Sign group '{group.name}': {e}"
+                return
+            self.logger.info(f'Created Sign group {group.name}')
+            created[group.name] = GroupInfo(
+                groupName=group.name,
+                groupId=res['id'],
+                createdDate=group.createdDate,
+                isDefaultGroup=group.isDefaultGroup,
+            )
+
+    async def _insert_user(self, semaphore, new_user: tuple[DetailedUserInfo, UserGroupsInfo], headers, session, results):
+        """
+        Insert a Sign user, then assign its groups
+        """
+        user, user_groups = new_user
+        async with semaphore:
+            try:
+                body, _ = await self.call_with_retry_async('POST', f"{self.api_url}users", headers, data=dumps(user),
+                                                           session=session)
+                user_id = body['userId']
+            except Exception as e:
+                results[user.email] = InsertedUser(user, None, f"Failed to insert user '{user.email}': {e}")
+                return
+            try:
+                await self.call_with_retry_async('PUT', f"{self.api_url}users/{user_id}/groups", headers,
+                                                 data=dumps(user_groups), session=session)
+            except Exception as e:
+                results[user.email] = InsertedUser(user, user_id,
+                                                   f"Failed to assign groups to user '{user.email}': {e}")
+                return
+            self.logger.debug(f"Inserted Sign user {user.email}")
+            results[user.email] = InsertedUser(user, user_id, None)
+
+    async def _update_user_state(self, semaphore, user_state: tuple[str, UserStateInfo], headers, session, errors):
         """
-        Need to define this method, so that it can be called outside async context
-        loop will execute a single synchronous call, but sharing code with the async retry method
+        Change the state of a Sign user
         """
-        return self.loop.run_until_complete(self.call_with_retry_async(method, url, header, data=data or {}))
+        user_id, state = user_state
+        async with semaphore:
+            try:
+                await self.call_with_retry_async('PUT', f"{self.api_url}users/{user_id}/state", headers,
+                                                 data=dumps(state), session=session)
+            except Exception as e:
+                errors[user_id] = f"Failed to change state of user '{user_id}' to '{state.state}': {e}"
 
     async def call_with_retry_async(self, method, url, header, data=None, session=None):
         """
         Call manager with exponential retry
-        :return: Response <Response> object
+        :return: (body, status)
         """
         retry_nb = 0
-        waiting_time = 10
-        close = session is None
-        session = session or aiohttp.ClientSession(trust_env=True, timeout=self.timeout)
-        session.headers.update(header)
+        session = session or await self._get_session()
         while True:
             try:
-                waiting_time *= 3
                 self.logger.debug(f'Attempt {retry_nb+1} to call: {url}')
-                async with session.request(method=method, url=url, data=data or {}) as r:
-                    if r.status >= 500:
-                        raise TimeoutException('{}, Headers: {}'.format(r.status, r.headers))
-                    elif r.status == 429:
-                        raise TimeoutException('{} - too many calls. Headers: {}'.format(r.status, r.headers))
-                    elif r.status < 200 or r.status > 299:
-                        err = await r.json()
-                        raise AssertionException(f"Error calling '{method} {url}': {r.status} {err['code']} {err['message']}")
-                    body = await r.text()
-                    if method != 'PUT':
-                        return json.loads(body), r.status
-                    else:
-                        # PUT calls respond with an empty body
-                        return body, r.status
+                status, _, headers, body = await self._request(session, method, url, header, data or {})
+                if status >= 500:
+                    raise TimeoutException('{}, Headers: {}'.format(status, headers),
+                                           parse_retry_after(headers.get('Retry-After')))
+                elif status == 429:
+                    raise TimeoutException('{} - too many calls. Headers: {}'.format(status, headers),
+                                           parse_retry_after(headers.get('Retry-After')))
+                elif status < 200 or status > 299:
+                    err = loads(body)
+                    raise AssertionException(f"Error calling '{method} {url}': {status} {err['code']} {err['message']}")
+                if method != 'PUT':
+                    return loads(body), status
+                else:
+                    # PUT calls respond with an empty body
+                    return body, status
             except (TimeoutException, ServerTimeoutError) as err:
                 retry_nb += 1
                 self.logger.warning('Call failed: Type: {} - Message: {}'.format(type(err), err))
                 if retry_nb == (self.max_sign_retries + 1):
                     raise AssertionException('Quitting after {} retries'.format(self.max_sign_retries))
-                self.logger.warning('Waiting for {} seconds before retry'.format(waiting_time))
+                waiting_time = self.retry_wait(retry_nb, getattr(err, 'retry_after', None))
+                self.logger.warning('Waiting for {:.1f} seconds before retry'.format(waiting_time))
 
                 await asyncio.sleep(waiting_time)
-            finally:
-                if close:
-                    await session.close()
+
+    def retry_wait(self, retry_nb, retry_after=None):
+        """
+        Seconds to wait before the given retry.  The jitter keeps calls that failed together from
+        retrying together.
+        """
+        backoff = min(self.RETRY_MAX_WAIT, self.RETRY_BASE_WAIT * 2 ** (retry_nb - 1))
+        backoff = backoff / 2 + random.uniform(0, backoff / 2)
+        return max(backoff, retry_after or 0)
+
+
+class SignClient:
+    """
+    Synchronous wrapper around AsyncSignClient.  Each call runs to completion on an event loop that belongs
+    to this client, so it can be used from any thread that isn't already running an event loop.
+    """
+
+    def __init__(self, connection, host, integration_key, admin_email, logger=None):
+        self.loop = asyncio.new_event_loop()
+        self.client = AsyncSignClient(connection, host, integration_key, admin_email, logger)
+        self.logger = self.client.logger
+
+    def _run(self, coro):
+        return self.loop.run_until_complete(coro)
+
+    @property
+    def api_url(self):
+        return self.client.api_url
+
+    @api_url.setter
+    def api_url(self, value):
+        self.client.api_url = value
+
+    @property
+    def groups(self):
+        return self.client.groups
+
+    @groups.setter
+    def groups(self, value):
+        self.client.groups = value
+
+    def close(self):
+        """
+        Close the client's connections and event loop.  The client can't be used afterwards.
+        """
+        if not self.loop.is_closed():
+            self._run(self.client.close())
+            self.loop.close()
+
+    def base_uri(self):
+        return self._run(self.client.base_uri())
+
+    def sign_groups(self):
+        return self._run(self.client.sign_groups())
+
+    def get_groups(self):
+        return self._run(self.client.get_groups())
+
+    def list_users(self):
+        return self._run(self.client.list_users())
+
+    def get_users(self, user_ids=None):
+        return self._run(self.client.get_users(user_ids))
+
+    def iter_users(self, user_ids=None):
+        """
+        Like AsyncSignClient.aiter_users.  Requests are only in progress while the caller is waiting for
+        the next user.
+        """
+        users = self.client.aiter_users(user_ids)
+        try:
+            while True:
+                try:
+                    yield self._run(users.__anext__())
+                except StopAsyncIteration:
+                    return
+        finally:
+            self._run(users.aclose())
+
+    def get_user_groups(self, user_ids):
+        return self._run(self.client.get_user_groups(user_ids))
+
+    def update_users(self, users: list[DetailedUserInfo]) -> dict[str, str]:
+        return self._run(self.client.update_users(users))
+
+    def update_user_groups(self, user_groups: list[tuple[str, UserGroupsInfo]]) -> dict[str, str]:
+        return self._run(self.client.update_user_groups(user_groups))
+
+    def update_user_groups_single(self, user_id: str, user_groups: UserGroupsInfo):
+        self._run(self.client.update_user_groups_single(user_id, user_groups))
+
+    def create_group(self, group: DetailedGroupInfo):
+        return self._run(self.client.create_group(group))
+
+    def create_groups(self, groups: list[DetailedGroupInfo]) -> tuple[list[GroupInfo], dict[str, str]]:
+        return self._run(self.client.create_groups(groups))
+
+    def insert_user(self, user: DetailedUserInfo) -> str:
+        return self._run(self.client.insert_user(user))
+
+    def insert_users(self, new_users: list[tuple[DetailedUserInfo, UserGroupsInfo]]) -> list[InsertedUser]:
+        return self._run(self.client.insert_users(new_users))
+
+    def update_user_state(self, user_id: str, state: UserStateInfo):
+        self._run(self.client.update_user_state(user_id, state))
+
+    def update_user_states(self, user_states: list[tuple[str, UserStateInfo]]) -> dict[str, str]:
+        return self._run(self.client.update_user_states(user_states))
+
+    def call_with_retry_sync(self, method, url, header, data=None):
+        return self._run(self.client.call_with_retry_async(method, url, header, data=data or {}))
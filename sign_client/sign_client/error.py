@@ -32,9 +32,11 @@ class AssertionException(Exception):
 
 
 class TimeoutException(Exception):
-    def __init__(self, message):
-        super(AssertionException, self).__init__(message)
+    def __init__(self, message, retry_after=None):
+        super(TimeoutException, self).__init__(message)
         self.reported = False
+        # seconds the server asked us to wait before retrying, if it said
+        self.retry_after = retry_after
 
     def set_reported(self):        
         self.reported = True
@@ -18,18 +18,49 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 import dataclasses
-from dataclasses import dataclass
 import json
+import sys
+import typing
+from dataclasses import dataclass
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# slotted instances are smaller and faster to read, but slots=True needs Python 3.10
+_DATACLASS_OPTIONS = {'slots': True} if sys.version_info >= (3, 10) else {}
+
+
+def _default(o):
+    if hasattr(o, 'to_dict'):
+        return o.to_dict()
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+def dumps(obj) -> str:
+    """
+    Serialize models (or plain data containing them) to JSON.  Fields of @model instances that are None are
+    left out, since those go through to_dict(); None values in plain dicts and lists are written as null.
+    Uses orjson when it is installed.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_PASSTHROUGH_DATACLASS).decode('utf-8')
+    return json.dumps(obj, default=_default)
+
+
+def loads(s):
+    if orjson is not None:
+        return orjson.loads(s)
+    return json.loads(s)
 
 
 class JSONEncoder(json.JSONEncoder):
     def default(self, o):
+        if hasattr(o, 'to_dict'):
+            return o.to_dict()
         new_dct = {}
-        if dataclasses.is_dataclass(o):
-            dct = dataclasses.asdict(o)
-        else:
-            dct = o
-        for k, v in dct.items():
+        for k, v in o.items():
             if v is None:
                 continue
             if isinstance(v, dict):
@@ -42,26 +73,91 @@ class JSONEncoder(json.JSONEncoder):
 
 
 def remove_unknown_keys(dct: dict, cls):
-    known_keys = set()
+    known_keys = cls._field_names
+    return {k: v for k, v in dct.items() if k in known_keys}
+
+
+def _field_codec(field_type):
+    """
+    Tell how a field is (de)serialized: ('model', cls) for a nested model, ('list', cls) for a list of
+    them, or None for plain JSON values
+    """
+    if hasattr(field_type, '_field_names'):
+        return 'model', field_type
+    if typing.get_origin(field_type) is list:
+        item_type, = typing.get_args(field_type)
+        if hasattr(item_type, '_field_names'):
+            return 'list', item_type
+    return None
+
+
+def _make_function(name, lines, namespace):
+    exec('\n'.join(lines), namespace)
+    return namespace[name]
+
+
+def _make_to_dict(cls):
+    """
+    Generate to_dict() for a model.  Like dataclasses.asdict(), but None values are left out
+    (as the Sign API expects), and nothing is copied that doesn't need to be.
+    """
+    namespace = {}
+    lines = ['def to_dict(self):', '    d = {}']
     for field in dataclasses.fields(cls):
-        known_keys.add(field.name)
-    new_dct = {}
-    for k, v in dct.items():
-        if k in known_keys:
-            new_dct[k] = v
-    return new_dct
+        codec = _field_codec(field.type)
+        lines.append(f'    v = self.{field.name}')
+        lines.append('    if v is not None:')
+        if codec is None:
+            lines.append(f'        d[{field.name!r}] = v')
+        elif codec[0] == 'model':
+            lines.append(f'        d[{field.name!r}] = v.to_dict()')
+        else:
+            lines.append(f'        d[{field.name!r}] = [item.to_dict() for item in v]')
+    lines.append('    return d')
+    return _make_function('to_dict', lines, namespace)
+
+
+def _make_from_dict(cls):
+    """
+    Generate from_dict() for a model.  Unknown keys are ignored, so new API fields don't break parsing,
+    and nested models are built from nested dicts.
+    """
+    namespace = {'cls': cls}
+    lines = ['def from_dict(dct):', '    if dct is None:', '        return None', '    kwargs = {}']
+    for i, field in enumerate(dataclasses.fields(cls)):
+        codec = _field_codec(field.type)
+        lines.append(f'    if {field.name!r} in dct:')
+        if codec is None:
+            lines.append(f'        kwargs[{field.name!r}] = dct[{field.name!r}]')
+        else:
+            namespace[f'_type{i}'] = codec[1]
+            lines.append(f'        v = dct[{field.name!r}]')
+            if codec[0] == 'model':
+                lines.append(f'        kwargs[{field.name!r}] = _type{i}.from_dict(v)')
+            else:
+                lines.append(f'        kwargs[{field.name!r}] = None if v is None else [_type{i}.from_dict(item) for item in v]')
+    lines.append('    return cls(**kwargs)')
+    return staticmethod(_make_function('from_dict', lines, namespace))
+
 
+def model(cls):
+    """
+    Make a Sign API model class: a dataclass (slotted where supported) with generated to_dict() and
+    from_dict(), and its set of field names in _field_names
+    """
+    cls = dataclass(**_DATACLASS_OPTIONS)(cls)
+    cls._field_names = frozenset(f.name for f in dataclasses.fields(cls))
+    cls.to_dict = _make_to_dict(cls)
+    cls.from_dict = _make_from_dict(cls)
+    return cls
 
-@dataclass
+
+@model
 class PageInfo:
     nextCursor: str = None
 
-    @classmethod
-    def from_dict(cls, dct):
-        return cls(**remove_unknown_keys(dct, cls))
-
 
-@dataclass
+@model
 class UserInfo:
     email: str
     id: str
@@ -71,33 +167,20 @@ class UserInfo:
     firstName: str = None
     lastName: str = None
 
-    @classmethod
-    def from_dict(cls, dct):
-        return cls(**remove_unknown_keys(dct, cls))
 
-
-@dataclass
+@model
 class UsersInfo:
     page: PageInfo
     userInfoList: list[UserInfo]
 
-    @classmethod
-    def from_dict(cls, dct):
-        userInfoList = [UserInfo(**u) for u in dct['userInfoList']]
-        return cls(page=PageInfo(**dct['page']), userInfoList=userInfoList)
-
 
-@dataclass
+@model
 class UserStateInfo:
     state: str
     comment: str = None
 
-    @classmethod
-    def from_dict(cls, dct):
-        return cls(**remove_unknown_keys(dct, cls))
 
-
-@dataclass
+@model
 class DetailedUserInfo:
     accountType: str
     email: str
@@ -115,57 +198,36 @@ class DetailedUserInfo:
     primaryGroupId: str = None
     title: str = None
 
-    @classmethod
-    def from_dict(cls, dct):
-        return cls(**remove_unknown_keys(dct, cls))
-
 
-@dataclass
+@model
 class GroupInfo:
     groupId: str
     groupName: str
     createdDate: str = None
     isDefaultGroup: bool = None
 
-    @classmethod
-    def from_dict(cls, dct):
-        return cls(**remove_unknown_keys(dct, cls))
 
-
-@dataclass
+@model
 class DetailedGroupInfo:
     name: str
     id: str = None
     createdDate: str = None
     isDefaultGroup: bool = False
 
-    @classmethod
-    def from_dict(cls, dct):
-        return cls(**remove_unknown_keys(dct, cls))
-
 
-@dataclass
+@model
 class GroupsInfo:
     page: PageInfo
     groupInfoList: list[GroupInfo]
 
-    @classmethod
-    def from_dict(cls, dct):
-        groupInfoList = [GroupInfo(**u) for u in dct['groupInfoList']]
-        return cls(page=PageInfo(**dct['page']), groupInfoList=groupInfoList)
 
-
-@dataclass
+@model
 class BooleanSettingsInfo:
     value: bool
     inherited: bool = None
 
-    @classmethod
-    def from_dict(cls, dct):
-        return cls(**dct)
-
 
-@dataclass
+@model
 class SettingsInfo:
     libaryDocumentCreationVisible: BooleanSettingsInfo = None
     sendRestrictedToWorkflows: BooleanSettingsInfo = None
@@ -173,15 +235,8 @@ class SettingsInfo:
     userManagedWorkflowsEnabled: BooleanSettingsInfo = None
     allowedToShareUserCreatedWorkflows: BooleanSettingsInfo = None
 
-    @classmethod
-    def from_dict(cls, dct):
-        if dct is None:
-            return None
-        new_dct = {k: BooleanSettingsInfo.from_dict(v) for k, v in dct.items()}
-        return cls(**remove_unknown_keys(new_dct, cls))
 
-
-@dataclass
+@model
 class UserGroupInfo:
     id: str
     isGroupAdmin: bool
@@ -191,21 +246,8 @@ class UserGroupInfo:
     name: str = None
     settings: SettingsInfo = None
 
-    @classmethod
-    def from_dict(cls, dct):
-        new_dct = {}
-        for k, v in dct.items():
-            if k == 'settings':
-                new_dct[k] = SettingsInfo.from_dict(v)
-            else:
-                new_dct[k] = v
-        return cls(**new_dct)
-
 
-@dataclass
+@model
 class UserGroupsInfo:
     groupInfoList: list[UserGroupInfo]
 
-    @classmethod
-    def from_dict(cls, dct):
-        return cls([UserGroupInfo.from_dict(v) for v in dct['groupInfoList']])
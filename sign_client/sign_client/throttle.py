@@ -0,0 +1,153 @@
+# Copyright (c) 2016-2021 Adobe Inc.  All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import asyncio
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+
+def is_throttled(status) -> bool:
+    """
+    Tell whether a response means the server is overloaded.  A status of None means no response was received,
+    which says nothing about the server.
+    """
+    return status is not None and (status == 429 or status >= 500)
+
+
+def parse_retry_after(value, now=None):
+    """
+    Parse a Retry-After header, which is either a number of seconds or an HTTP date
+    :return: seconds to wait, or None if the header is missing or invalid
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    now = now or datetime.now(timezone.utc)
+    return max(0.0, (retry_at - now).total_seconds())
+
+
+class TokenBucket:
+    """
+    Limits the request rate of every coroutine sharing the bucket.  A rate of None means no rate limit,
+    but the bucket can still be paused, e.g. when the server responds with Retry-After.
+    """
+
+    def __init__(self, rate=None, clock=time.monotonic):
+        self.rate = rate
+        # allow up to a second's worth of requests in a burst
+        self.capacity = max(rate or 1, 1)
+        self.tokens = self.capacity
+        self.clock = clock
+        self.updated = clock()
+        self.paused_until = 0.0
+
+    def pause(self, seconds):
+        """
+        Stop handing out tokens for the given number of seconds.  Requests resume gradually afterwards.
+        """
+        self.paused_until = max(self.paused_until, self.clock() + seconds)
+        self.tokens = 0
+        self.updated = self.paused_until
+
+    async def acquire(self):
+        while True:
+            now = self.clock()
+            if now < self.paused_until:
+                await asyncio.sleep(self.paused_until - now)
+                continue
+            if self.rate is None:
+                return
+            self.tokens = min(self.capacity, self.tokens + max(0.0, now - self.updated) * self.rate)
+            self.updated = max(self.updated, now)
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class AdaptiveLimiter:
+    """
+    Limits the number of requests in flight, adjusting the limit with AIMD (additive increase,
+    multiplicative decrease).  Each healthy response raises the limit by 1/limit, which adds about one
+    request per round trip.  A throttled response halves it.  Responses to requests that started before
+    the last cut don't cut it again, so one burst of 429s counts as a single signal.
+
+    A response is healthy if it succeeded and its latency is within LATENCY_TOLERANCE times the fastest
+    seen (plus LATENCY_SLACK seconds, so a few very fast responses don't set an unreachable bar).  Slower successes leave the limit unchanged, since queueing at the server shows up as latency
+    before it shows up as errors.
+    """
+    LATENCY_TOLERANCE = 3.0
+    LATENCY_SLACK = 0.1
+    DECREASE_FACTOR = 0.5
+
+    def __init__(self, initial, maximum, minimum=1, clock=time.monotonic):
+        self.minimum = minimum
+        self.maximum = max(maximum, minimum)
+        self.limit = float(min(max(initial, minimum), self.maximum))
+        self.in_flight = 0
+        self.min_latency = None
+        self.last_decrease = float('-inf')
+        self.clock = clock
+        # created on first use, so it belongs to the loop the limiter is used on
+        self._condition = None
+
+    async def acquire(self) -> float:
+        """
+        Wait for a free slot
+        :return: the start time to pass to release()
+        """
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+        return self.clock()
+
+    async def release(self, started: float, status, timed_out=False):
+        """
+        Free a slot and adjust the limit.  Requests that got no response (cancelled, or failed locally) leave
+        the limit alone, unless they timed out waiting for the server.
+        :param started: value returned by acquire()
+        :param status: HTTP status of the response, or None if there was none
+        :param timed_out: whether the request timed out
+        """
+        now = self.clock()
+        if timed_out or is_throttled(status):
+            if started > self.last_decrease:
+                self.limit = max(self.minimum, self.limit * self.DECREASE_FACTOR)
+                self.last_decrease = now
+        elif status is not None and 200 <= status <= 299:
+            latency = now - started
+            if self.min_latency is None or latency < self.min_latency:
+                self.min_latency = latency
+            if latency <= self.min_latency * self.LATENCY_TOLERANCE + self.LATENCY_SLACK:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+        async with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
@@ -0,0 +1,246 @@
+import asyncio
+import threading
+
+import pytest
+from aiohttp import web
+
+from sign_client.client import AsyncSignClient, SignClient
+from sign_client.model import DetailedGroupInfo, DetailedUserInfo, UserGroupInfo, UserGroupsInfo
+
+
+@pytest.fixture
+def sign_server():
+    """
+    Serve a minimal Sign API from a background thread, with five pages of two users.
+    Records the client port and path of each request.
+    """
+    peers = []
+    paths = []
+    app = web.Application()
+
+    async def get_users(request):
+        peers.append(request.transport.get_extra_info('peername')[1])
+        paths.append(request.path_qs)
+        cursor = int(request.query.get('cursor', 0))
+        page = {'nextCursor': str(cursor + 1)} if cursor < 4 else {}
+        # give detail requests for earlier pages a chance to arrive first
+        await asyncio.sleep(0.05)
+        users = [{'id': f"{cursor}-{i}", 'email': f"user{cursor}-{i}@example.com", 'isAccountAdmin': False,
+                  'accountId': '1'} for i in range(2)]
+        return web.json_response({'userInfoList': users, 'page': page})
+
+    async def get_user(request):
+        peers.append(request.transport.get_extra_info('peername')[1])
+        paths.append(request.path_qs)
+        user_id = request.match_info['user_id']
+        return web.json_response({'id': user_id, 'email': f"user{user_id}@example.com", 'accountType': 'GLOBAL',
+                                  'isAccountAdmin': False, 'firstName': 'Test', 'lastName': 'User',
+                                  'initials': 'TU', 'locale': 'en_US', 'accountId': '1', 'status': 'ACTIVE'})
+
+    async def insert_user(request):
+        peers.append(request.transport.get_extra_info('peername')[1])
+        name = (await request.json())['email'].split('@')[0]
+        if name.startswith('bad'):
+            return web.json_response({'code': 'INVALID_USER', 'message': 'Bad user'}, status=400)
+        return web.json_response({'userId': 'new-id' if name == 'user' else f'new-{name}'}, status=201)
+
+    async def put_user_groups(request):
+        paths.append(request.path_qs)
+        if 'nogroup' in request.match_info['user_id']:
+            return web.json_response({'code': 'INVALID_GROUP_ID', 'message': 'No such group'}, status=404)
+        return web.Response()
+
+    app.router.add_get('/users', get_users)
+    app.router.add_get('/users/{user_id}', get_user)
+    async def create_group(request):
+        name = (await request.json())['name']
+        if name.startswith('Bad'):
+            return web.json_response({'code': 'INVALID_GROUP_NAME', 'message': 'Bad name'}, status=400)
+        return web.json_response({'id': f'id-{name}'}, status=201)
+
+    async def base_uris(request):
+        return web.json_response({'apiAccessPoint': 'https://api.example.com/'})
+
+    app.router.add_get('/api/rest/v6/baseUris', base_uris)
+    app.router.add_post('/users', insert_user)
+    app.router.add_post('/groups', create_group)
+    app.router.add_put('/users/{user_id}/groups', put_user_groups)
+    loop = asyncio.new_event_loop()
+    runner = web.AppRunner(app)
+    loop.run_until_complete(runner.setup())
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    loop.run_until_complete(site.start())
+    port = site._server.sockets[0].getsockname()[1]
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{port}/", peers, paths
+    asyncio.run_coroutine_threadsafe(runner.cleanup(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    loop.close()
+
+
+def test_session_reused(sign_server):
+    api_url, peers, _ = sign_server
+    client = SignClient({'max_request_concurrency': 1}, 'localhost', 'key', 'admin@example.com')
+    client.api_url = api_url
+    client.groups = []
+    assert len(client.get_users()) == 10
+    user = DetailedUserInfo(accountType='GLOBAL', email='user@example.com', id=None, isAccountAdmin=False,
+                            firstName='Test', lastName='User', initials='TU', locale='en_US', accountId='1',
+                            status='ACTIVE')
+    assert client.insert_user(user) == 'new-id'
+    client.close()
+    # five pages, ten users and an insert, all over a single connection
+    assert len(peers) == 16
+    assert len(set(peers)) == 1
+
+
+def test_get_users_overlaps_listing(sign_server):
+    api_url, _, paths = sign_server
+    client = SignClient({'request_concurrency': 2}, 'localhost', 'key', 'admin@example.com')
+    client.api_url = api_url
+    client.groups = []
+    users = client.get_users()
+    client.close()
+    assert sorted(u.id for u in users.values()) == [f"{c}-{i}" for c in range(5) for i in range(2)]
+    # details for the first page were requested before the last page was listed
+    assert paths.index('/users/0-0') < paths.index('/users?pageSize=1000&cursor=4')
+
+
+def test_iter_users_bounded(sign_server):
+    api_url, _, paths = sign_server
+    client = SignClient({'batch_size': 1, 'request_concurrency': 1, 'max_request_concurrency': 1},
+                        'localhost', 'key', 'admin@example.com')
+    client.api_url = api_url
+    client.groups = []
+    users = client.iter_users()
+    assert next(users).id == '0-0'
+    users.close()
+    # and no call is left running on the client's loop
+    assert not [t for t in asyncio.all_tasks(client.loop) if not t.done()]
+    # with nobody consuming, the listing and detail fetches stopped well short of the end
+    assert len([p for p in paths if p.startswith('/users/')]) < 5
+    assert [u.id for u in client.iter_users(['1-0', '3-1'])] == ['1-0', '3-1']
+    client.close()
+
+
+def test_async_client(sign_server):
+    api_url, _, _ = sign_server
+
+    async def run():
+        async with AsyncSignClient({'request_concurrency': 2}, 'localhost', 'key', 'admin@example.com') as client:
+            client.api_url = api_url
+            client.groups = []
+            users, user = await asyncio.gather(client.get_users(), client.get_users(['2-1']))
+            assert len(users) == 10
+            assert list(user) == ['user2-1@example.com']
+
+    asyncio.run(run())
+
+
+def test_insert_users(sign_server):
+    api_url, _, paths = sign_server
+    client = SignClient({'request_concurrency': 4}, 'localhost', 'key', 'admin@example.com')
+    client.api_url = api_url
+    client.groups = []
+    groups = UserGroupsInfo([UserGroupInfo(id='g1', isGroupAdmin=False, isPrimaryGroup=True, status='ACTIVE')])
+    names = ['user1', 'bad1', 'nogroup1', 'user2']
+    new_users = [(DetailedUserInfo(accountType='GLOBAL', email=f'{name}@example.com', id='', isAccountAdmin=False,
+                                   status='ACTIVE'), groups) for name in names]
+    results = client.insert_users(new_users)
+    client.close()
+    assert [r.user.email.split('@')[0] for r in results] == names
+    assert [r.user_id for r in results] == ['new-user1', None, 'new-nogroup1', 'new-user2']
+    assert [r.error is None for r in results] == [True, False, False, True]
+    assert 'Bad user' in results[1].error
+    assert 'No such group' in results[2].error
+    # groups are only assigned to users that were inserted
+    assert sorted(paths) == ['/users/new-nogroup1/groups', '/users/new-user1/groups', '/users/new-user2/groups']
+
+
+def test_create_groups(sign_server):
+    api_url, _, _ = sign_server
+    client = SignClient({'request_concurrency': 4}, 'localhost', 'key', 'admin@example.com')
+    client.api_url = api_url
+    client.groups = []
+    created, errors = client.create_groups([DetailedGroupInfo(name=n) for n in ['Group 1', 'Bad Group', 'Group 2']])
+    client.close()
+    assert [(g.groupName, g.groupId) for g in created] == [('Group 1', 'id-Group 1'), ('Group 2', 'id-Group 2')]
+    assert list(errors) == ['Bad Group']
+    assert client.groups == created
+
+
+def test_base_uri_host_scheme(sign_server):
+    api_url, _, _ = sign_server
+    # a host without a scheme is reached over https, but one can be given, e.g. for a local server
+    client = SignClient({}, api_url, 'key', 'admin@example.com')
+    assert client.base_uri() == 'https://api.example.com/api/rest/v6/'
+    client.close()
+
+
+def test_request_without_response_keeps_limit():
+    import aiohttp
+
+    class FailingSession:
+        def request(self, **kwargs):
+            raise aiohttp.ClientConnectionError('connection reset')
+
+    async def run():
+        client = AsyncSignClient({'request_concurrency': 4}, 'localhost', 'key', 'admin@example.com')
+        with pytest.raises(aiohttp.ClientConnectionError):
+            await client._request(FailingSession(), 'GET', 'http://localhost/', {})
+        # a local failure says nothing about server load
+        assert client.limiter.limit == 4
+        assert client.limiter.in_flight == 0
+
+    asyncio.run(run())
+
+
+def test_stream_calls_survives_errors():
+    import aiohttp
+
+    async def items():
+        for i in range(20):
+            yield i
+
+    async def handle(i, headers, session):
+        if i == 7:
+            raise aiohttp.ClientConnectionError('connection reset')
+        return i
+
+    async def run():
+        client = AsyncSignClient({'batch_size': 2, 'request_concurrency': 1, 'max_request_concurrency': 1},
+                                 'localhost', 'key', 'admin@example.com')
+        try:
+            return [r async for r in client._stream_calls(handle, {}, items())]
+        finally:
+            await client.close()
+
+    # the failed item is left out, and the rest still come through
+    results = asyncio.run(asyncio.wait_for(run(), 5))
+    assert sorted(results) == [i for i in range(20) if i != 7]
+
+
+def test_update_failures_returned(sign_server):
+    api_url, _, _ = sign_server
+    client = SignClient({}, 'localhost', 'key', 'admin@example.com')
+    client.api_url = api_url
+    client.groups = []
+    groups = UserGroupsInfo([UserGroupInfo(id='g1', isGroupAdmin=False, isPrimaryGroup=True, status='ACTIVE')])
+    errors = client.update_user_groups([('user1', groups), ('nogroup1', groups)])
+    assert list(errors) == ['nogroup1']
+    assert 'INVALID_GROUP_ID' in errors['nogroup1']
+
+    # failures a handler doesn't expect are raised, once every call is done
+    handled = []
+
+    async def handle(semaphore, o, headers, session):
+        handled.append(o)
+        if o == 1:
+            raise ValueError('unexpected')
+
+    with pytest.raises(ValueError, match='unexpected'):
+        client._run(client.client._handle_calls(handle, {}, [1, 2, 3]))
+    assert sorted(handled) == [1, 2, 3]
+    client.close()
@@ -1,4 +1,5 @@
-from sign_client.model import UserGroupsInfo
+from sign_client.model import BooleanSettingsInfo, DetailedUserInfo, JSONEncoder, SettingsInfo, UserGroupsInfo, \
+    dumps, loads, remove_unknown_keys
 import json
 
 def test_deserialize():
@@ -41,3 +42,33 @@ def test_deserialize():
     """
     dct = json.loads(api_resp_json)
     UserGroupsInfo.from_dict(dct)
+
+
+def test_round_trip():
+    """to_dict leaves out None values and from_dict rebuilds nested models"""
+    dct = {
+        'groupInfoList': [
+            {
+                'id': 'g1',
+                'isGroupAdmin': True,
+                'isPrimaryGroup': False,
+                'status': 'ACTIVE',
+                'settings': {'userCanSend': {'value': True}},
+            },
+        ],
+    }
+    user_groups = UserGroupsInfo.from_dict(dct)
+    assert user_groups.groupInfoList[0].settings.userCanSend == BooleanSettingsInfo(value=True)
+    assert user_groups.to_dict() == dct
+    assert json.loads(dumps(user_groups)) == dct
+    assert json.loads(json.dumps(user_groups, cls=JSONEncoder)) == dct
+    assert UserGroupsInfo.from_dict(loads(dumps(user_groups))) == user_groups
+
+
+def test_from_dict():
+    user = DetailedUserInfo.from_dict({'accountType': 'GLOBAL', 'email': 'user@example.com', 'id': 'u1',
+                                       'isAccountAdmin': False, 'status': 'ACTIVE', 'unknown': 'ignored'})
+    assert user.email == 'user@example.com'
+    assert user.firstName is None
+    assert SettingsInfo.from_dict(None) is None
+    assert remove_unknown_keys({'value': True, 'other': 1}, BooleanSettingsInfo) == {'value': True}
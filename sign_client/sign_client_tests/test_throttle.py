@@ -0,0 +1,94 @@
+import asyncio
+from datetime import datetime, timezone
+
+from sign_client.throttle import AdaptiveLimiter, TokenBucket, parse_retry_after
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_parse_retry_after():
+    now = datetime(2022, 1, 1, tzinfo=timezone.utc)
+    assert parse_retry_after('30') == 30.0
+    assert parse_retry_after('Sat, 01 Jan 2022 00:01:00 GMT', now) == 60.0
+    assert parse_retry_after('Fri, 31 Dec 2021 23:00:00 GMT', now) == 0.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after('soon') is None
+
+
+def test_adaptive_limiter():
+    clock = FakeClock()
+
+    async def run():
+        limiter = AdaptiveLimiter(2, 4, clock=clock)
+        # healthy responses raise the limit, up to the maximum
+        for _ in range(20):
+            started = await limiter.acquire()
+            clock.now += 0.01
+            await limiter.release(started, 200)
+        assert limiter.limit == 4
+        # a burst of throttled responses only halves it once
+        started = [await limiter.acquire() for _ in range(4)]
+        assert limiter.in_flight == 4
+        clock.now += 0.01
+        for s in started:
+            await limiter.release(s, 429)
+        assert limiter.limit == 2
+        # requests without a response, e.g. cancelled ones, leave it alone
+        clock.now += 0.01
+        await limiter.release(await limiter.acquire(), None)
+        assert limiter.limit == 2
+        # but a timeout started after the cut can cut it again
+        await limiter.release(await limiter.acquire(), None, timed_out=True)
+        assert limiter.limit == 1
+        # client errors and slow responses leave it alone
+        await limiter.release(await limiter.acquire(), 404)
+        started = await limiter.acquire()
+        clock.now += 5
+        await limiter.release(started, 200)
+        assert limiter.limit == 1
+        assert limiter.in_flight == 0
+
+    asyncio.run(run())
+
+
+def test_adaptive_limiter_waits_for_slot():
+    async def run():
+        limiter = AdaptiveLimiter(1, 1)
+        started = await limiter.acquire()
+        waiter = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        assert not waiter.done()
+        await limiter.release(started, 200)
+        await asyncio.wait_for(waiter, 1)
+        assert limiter.in_flight == 1
+
+    asyncio.run(run())
+
+
+def test_token_bucket(monkeypatch):
+    clock = FakeClock()
+    slept = []
+
+    async def sleep(seconds):
+        slept.append(seconds)
+        clock.now += seconds
+
+    async def run():
+        bucket = TokenBucket(2, clock=clock)
+        for _ in range(4):
+            await bucket.acquire()
+        # the burst allowance was used up, so the last two waited for refills
+        assert slept == [0.5, 0.5]
+        slept.clear()
+        bucket.pause(10)
+        await bucket.acquire()
+        assert slept == [10, 0.5]
+
+    monkeypatch.setattr(asyncio, 'sleep', sleep)
+    asyncio.run(run())
@@ -0,0 +1,81 @@
+from click.testing import CliRunner
+
+from user_sync import app
+from user_sync.config.sign_sync import SignConfigLoader
+from user_sync.config.user_sync import UMAPIConfigLoader
+from user_sync.engine.sign import SignSyncEngine
+from .test_directory_shared import FakeDirectoryConnector
+
+
+def test_sync_all_options(monkeypatch, test_resources):
+    loaders = []
+    monkeypatch.setattr(app, 'run_sync', lambda config_loader, begin_work: loaders.append(config_loader))
+    result = CliRunner().invoke(app.main, [
+        'sync-all', '-c', test_resources['umapi_root_config'],
+        '--sign-config-filename', test_resources['sign_root_config'],
+        '--process-groups', '--users', 'mapped', '--adobe-only-user-action', 'exclude', '-t'])
+    assert result.exit_code == 0, result.output
+    # the UMAPI config gets all the options the sync command would
+    options = loaders[0].get_invocation_options()
+    assert options['process_groups'] is True
+    assert options['directory_group_mapped'] is True
+    assert options['exclude_strays'] is True
+    assert options['test_mode'] is True
+
+
+def test_begin_work_combined(monkeypatch, default_args, default_sign_args, get_mock_user):
+    config_loader = UMAPIConfigLoader(default_args)
+    sign_config_loader = SignConfigLoader(default_sign_args)
+    umapi_group = next(iter(config_loader.get_directory_groups()))
+    sign_group = next(iter(sign_config_loader.get_directory_groups()))
+    underlying = FakeDirectoryConnector([
+        get_mock_user('user1', groups=[umapi_group]),
+        get_mock_user('user2', groups=[sign_group]),
+    ])
+    monkeypatch.setattr(app, 'load_directory_config',
+                        lambda loader, new_account_type=None: (underlying, loader.get_directory_groups()))
+
+    umapi_emails = []
+    sign_emails = []
+
+    def run_umapi_engine(loader, rule_processor, directory_connector, directory_groups):
+        rule_processor.read_desired_user_groups(directory_groups, directory_connector)
+        umapi_emails.extend(u['email'] for u in rule_processor.filtered_directory_user_index.data)
+
+    def run_sign_engine(engine, directory_groups, directory_connector):
+        engine.read_desired_user_groups(directory_groups, directory_connector)
+        sign_emails.extend(u['email'] for u in engine.directory_user_by_user_key.values())
+
+    monkeypatch.setattr(app, 'run_umapi_engine', run_umapi_engine)
+    monkeypatch.setattr(SignSyncEngine, 'run', run_sign_engine)
+    app.begin_work_combined(sign_config_loader, config_loader)
+
+    # both engines ran off a single read of the directory
+    assert len(underlying.reads) == 1
+    # and each got the users it would have read on its own
+    assert umapi_emails == ['user1@example.com', 'user2@example.com']
+    assert sign_emails == ['user2@example.com']
+
+
+def test_begin_work_combined_sign_source_ignored(monkeypatch, caplog, test_resources, modify_config, default_args,
+                                                 default_sign_args):
+    import shutil
+    import yaml
+    sign_ldap = test_resources['ldap'].replace('connector-ldap.yml', 'connector-ldap-sign.yml')
+    shutil.copy(test_resources['ldap'], sign_ldap)
+    modify_config('sign_root_config', ['identity_source', 'connector'], 'connector-ldap-sign.yml')
+    monkeypatch.setattr(app, 'load_directory_config', lambda loader, new_account_type=None: (None, {}))
+    monkeypatch.setattr(app, 'run_umapi_engine', lambda *args: None)
+    monkeypatch.setattr(SignSyncEngine, 'run', lambda *args: None)
+    config_loader = UMAPIConfigLoader(default_args)
+
+    # the same connector config, even in another file, is fine
+    app.begin_work_combined(SignConfigLoader(default_sign_args), config_loader)
+    assert 'is ignored' not in caplog.text
+
+    # but one that differs is reported, since it isn't used
+    ldap_config = yaml.safe_load(open(sign_ldap))
+    ldap_config['search_page_size'] = 50
+    yaml.dump(ldap_config, open(sign_ldap, 'w'))
+    app.begin_work_combined(SignConfigLoader(default_sign_args), config_loader)
+    assert 'differs in: search_page_size' in caplog.text
@@ -1,8 +1,16 @@
+import os
+import sqlite3
 from pathlib import Path
 from datetime import datetime, timedelta
+
+import psutil
+import pytest
+
 from user_sync.cache.base import CacheBase
-from user_sync.cache.sign import SignCache
-from sign_client.model import DetailedUserInfo, GroupInfo, UserGroupInfo, SettingsInfo
+from user_sync.cache.sign import SignCache, SignUserIndex, SignUserRecord
+from sign_client.model import DetailedUserInfo, GroupInfo, UserGroupInfo, SettingsInfo, BooleanSettingsInfo
+from user_sync.error import AssertionException
+from user_sync.lockfile import ProcessLock
 
 
 def test_init_no_store(tmp_path):
@@ -204,9 +212,194 @@ def test_table_rebuild(tmp_path):
     store_path: Path = tmp_path / 'cache' / 'sign'
     cache = SignCache(store_path, 'primary')
     assert cache.should_refresh
+    cache.close()
     cache = SignCache(store_path, 'primary')
     assert not cache.should_refresh
+    cache.close()
     SignCache.VERSION += 1
     cache = SignCache(store_path, 'primary')
     assert cache.should_refresh
     assert cache.get_version() == SignCache.VERSION
+
+def test_batch_writes(tmp_path):
+    """Batch writes land in the cache, in one transaction each"""
+    store_path: Path = tmp_path / 'cache' / 'sign'
+    cache = SignCache(store_path, 'primary')
+    assert cache.db_conn.execute("pragma journal_mode").fetchone()[0] == 'wal'
+    users = [DetailedUserInfo(accountType='GLOBAL', email=f'user{i}@example.com', id=f'id{i}',
+                              isAccountAdmin=False, status='ACTIVE') for i in range(3)]
+    cache.cache_users(u for u in users)
+    assert not cache.db_conn.in_transaction
+    users[1].status = 'INACTIVE'
+    cache.update_users(users[1:2])
+    cache.update_users_refresh_status(['id0', 'id2'], needs_refresh=True)
+    assert [u.id for u in cache.get_users_to_refresh()] == ['id0', 'id2']
+    assert cache.get_user('id1').status == 'INACTIVE'
+    group = UserGroupInfo(id='g1', isGroupAdmin=False, isPrimaryGroup=True, status='ACTIVE')
+    other = UserGroupInfo(id='g2', isGroupAdmin=False, isPrimaryGroup=True, status='ACTIVE')
+    cache.cache_user_groups([('id0', group), ('id1', group)])
+    cache.update_user_groups_many([('id0', [other, group]), ('id2', [other])])
+    user_groups = {user_id: [g.id for g in groups] for user_id, groups in cache.get_user_groups()}
+    assert user_groups == {'id0': ['g2', 'g1'], 'id1': ['g1'], 'id2': ['g2']}
+
+def test_columnar_round_trip(tmp_path):
+    """Every field survives the trip through the cache columns, and indexed lookups work"""
+    store_path: Path = tmp_path / 'cache' / 'sign'
+    cache = SignCache(store_path, 'primary')
+    user = DetailedUserInfo(accountType='GLOBAL', email='user@example.com', id='id1', isAccountAdmin=True,
+                            status='ACTIVE', accountId='acct', company='Example', createdDate='2022-01-01',
+                            firstName='Test', initials='TU', lastName='User', locale='en_US', phone='555',
+                            primaryGroupId='g1', title='Boss')
+    group = GroupInfo(groupId='g1', groupName='Test Group', createdDate='2022-01-01', isDefaultGroup=False)
+    user_group = UserGroupInfo(id='g1', isGroupAdmin=True, isPrimaryGroup=False, status='ACTIVE',
+                               createdDate='2022-01-01', name='Test Group',
+                               settings=SettingsInfo(userCanSend=BooleanSettingsInfo(value=True, inherited=False)))
+    cache.cache_user(user)
+    cache.cache_group(group)
+    cache.cache_user_group('id1', user_group)
+    assert cache.get_user('id1') == user
+    assert cache.get_user('nobody') is None
+    assert cache.get_group_by_name('TEST GROUP') == group
+    assert cache.get_user_groups() == [('id1', [user_group])]
+    plan = cache.db_conn.execute("explain query plan delete from user_groups where user_id = ?", ('id1', )).fetchall()
+    assert 'user_groups_user_id' in plan[0][-1]
+
+
+def test_migrate_blob_schema(tmp_path):
+    """A cache written with the old JSON blob schema is rebuilt and refreshed"""
+    store_path: Path = tmp_path / 'cache' / 'sign'
+    cache = SignCache(store_path, 'primary')
+    conn = cache.db_conn
+    conn.execute("drop table users")
+    conn.execute("create table users (id text not null unique, needs_refresh int default 0, user detailed_user_info)")
+    conn.execute("insert into users (id, user) values ('id1', '{}')")
+    cache.VERSION = 2
+    cache.update_version()
+    conn.commit()
+    cache.close()
+    cache = SignCache(store_path, 'primary')
+    assert cache.should_refresh
+    assert cache.get_users() == []
+    cache.cache_user(DetailedUserInfo(accountType='GLOBAL', email='user@example.com', id='id1',
+                                      isAccountAdmin=False, status='ACTIVE'))
+    assert cache.get_user('id1').email == 'user@example.com'
+
+def test_user_records(tmp_path):
+    """User records only carry the fields used for matching"""
+    store_path: Path = tmp_path / 'cache' / 'sign'
+    cache = SignCache(store_path, 'primary')
+    user = DetailedUserInfo(accountType='GLOBAL', email='user@example.com', id='id1', isAccountAdmin=True,
+                            status='ACTIVE', firstName='Test')
+    cache.cache_user(user)
+    assert cache.get_user_records() == [SignUserRecord(id='id1', email='user@example.com', status='ACTIVE',
+                                                       isAccountAdmin=True)]
+
+
+def test_user_index(tmp_path):
+    cache = SignCache(tmp_path / 'cache' / 'sign', 'primary')
+    cache.cache_users([DetailedUserInfo(accountType='GLOBAL', email=f'user{i}@example.com', id=f'id{i}',
+                                        isAccountAdmin=False, status=status)
+                       for i, status in enumerate(['ACTIVE', 'INACTIVE', 'CREATED'])])
+    primary = UserGroupInfo(id='g1', isGroupAdmin=False, isPrimaryGroup=True, status='ACTIVE')
+    other = UserGroupInfo(id='g2', isGroupAdmin=True, isPrimaryGroup=False, status='ACTIVE')
+    cache.cache_user_groups([('id0', other), ('id0', primary), ('id2', primary)])
+    assert cache.get_primary_user_groups() == {'id0': primary, 'id2': primary}
+
+    index = SignUserIndex(cache.get_user_records(), cache.get_primary_user_groups())
+    assert list(index.by_email) == ['user0@example.com', 'user2@example.com']
+    assert list(index.inactive_by_email) == ['user1@example.com']
+    assert index.by_id['id2'].status == 'CREATED'
+    assert list(index.by_status['CREATED']) == ['user2@example.com']
+    assert index.primary_groups['id0'] == primary
+
+
+def test_org_metadata(tmp_path):
+    """Each org is refreshed and versioned on its own"""
+    store_path: Path = tmp_path / 'cache' / 'sign'
+    primary = SignCache(store_path, 'primary')
+    primary.update_next_refresh()
+    primary.close()
+    secondary = SignCache(store_path, 'secondary')
+    assert secondary.should_refresh
+    # a version change rebuilds only the org it was seen in
+    secondary.VERSION = SignCache.VERSION + 1
+    secondary.rebuild_tables()
+    secondary.init_meta()
+    secondary.close()
+    assert (store_path / 'primary-cache-meta.db').exists()
+    assert (store_path / 'secondary-cache-meta.db').exists()
+    primary = SignCache(store_path, 'primary')
+    assert not primary.should_refresh
+    primary.close()
+
+
+def test_org_data_without_metadata(tmp_path):
+    """Data from before orgs had their own metadata is rebuilt"""
+    store_path: Path = tmp_path / 'cache' / 'sign'
+    cache = SignCache(store_path, 'primary')
+    cache.cache_user(DetailedUserInfo(accountType='GLOBAL', email='user@example.com', id='id1',
+                                      isAccountAdmin=False, status='ACTIVE'))
+    cache.close()
+    (store_path / 'primary-cache-meta.db').unlink()
+    cache = SignCache(store_path, 'primary')
+    assert cache.should_refresh
+    assert cache.get_users() == []
+    cache.close()
+
+
+def test_org_lock(tmp_path):
+    """An org's cache can't be opened while it is open, in another process or this one"""
+    store_path: Path = tmp_path / 'cache' / 'sign'
+    store_path.mkdir(parents=True)
+    lock_path = store_path / 'primary.lock'
+    # the parent process, which is alive but not this one
+    lock_path.write_text(str(os.getppid()))
+    with pytest.raises(AssertionException, match="'primary' is in use"):
+        SignCache(store_path, 'primary')
+    # other orgs aren't held up
+    SignCache(store_path, 'secondary').close()
+    lock_path.unlink()
+    cache = SignCache(store_path, 'primary')
+    assert lock_path.read_text() == str(os.getpid())
+    with pytest.raises(AssertionException, match="'primary' is in use"):
+        SignCache(store_path, 'primary')
+    # the refused open leaves the lock to the cache that holds it
+    assert lock_path.read_text() == str(os.getpid())
+    cache.close()
+    assert not lock_path.exists()
+
+
+def test_process_lock(tmp_path):
+    """The lock file is created atomically, and a lock left by a process that is gone is taken over"""
+    lock_path = tmp_path / 'test.lock'
+    lock = ProcessLock(str(lock_path))
+    assert lock.set_lock()
+    assert lock_path.read_text() == str(os.getpid())
+    # not even this process can take it twice
+    assert not ProcessLock(str(lock_path)).set_lock()
+    lock.unlock()
+    # one being created by another process, which hasn't written its pid yet
+    lock_path.write_text('')
+    assert not lock.set_lock()
+    # one left by a process that is gone
+    dead_pid = max(psutil.pids()) + 1000
+    lock_path.write_text(str(dead_pid))
+    assert lock.set_lock()
+    assert lock_path.read_text() == str(os.getpid())
+    lock.unlock()
+
+
+def test_close_unlocks_on_error(tmp_path):
+    store_path: Path = tmp_path / 'cache' / 'sign'
+    cache = SignCache(store_path, 'primary')
+    cache.db_conn.close()
+
+    class FailingConnection:
+        def close(self):
+            raise sqlite3.ProgrammingError('close failed')
+
+    cache.db_conn = FailingConnection()
+    with pytest.raises(sqlite3.ProgrammingError):
+        cache.close()
+    assert not (store_path / 'primary.lock').exists()
+    SignCache(store_path, 'primary').close()
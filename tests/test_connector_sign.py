@@ -0,0 +1,206 @@
+import logging
+
+import pytest
+
+from sign_client.client import InsertedUser
+from sign_client.model import DetailedGroupInfo, DetailedUserInfo, GroupInfo, UserGroupInfo, UserGroupsInfo, UserInfo, UserStateInfo
+from user_sync.cache.sign import SignCache
+from user_sync.connector.connector_sign import SignConnector
+from user_sync.error import AssertionException
+
+
+class FakeSignClient:
+
+    def __init__(self, users, groups, user_groups):
+        self.users = {u.id: u for u in users}
+        self.groups = groups
+        self.user_groups = user_groups
+        self.detail_requests = []
+        self.group_requests = []
+
+    def list_users(self):
+        return [UserInfo(email=u.email, id=u.id, isAccountAdmin=u.isAccountAdmin, accountId=u.accountId,
+                         company=u.company, firstName=u.firstName, lastName=u.lastName) for u in self.users.values()]
+
+    def iter_users(self, user_ids=None):
+        user_ids = user_ids or list(self.users)
+        self.detail_requests.extend(user_ids)
+        return (self.users[i] for i in user_ids)
+
+    def sign_groups(self):
+        return self.groups
+
+    def get_user_groups(self, user_ids):
+        self.group_requests.extend(user_ids)
+        return {i: UserGroupsInfo(self.user_groups[i]) for i in user_ids}
+
+    def create_groups(self, groups):
+        created = [GroupInfo(groupId=f'id-{g.name}', groupName=g.name) for g in groups if not g.name.startswith('Bad')]
+        return created, {g.name: 'failed' for g in groups if g.name.startswith('Bad')}
+
+    def update_users(self, users):
+        self.updated = users
+        return {u.id: 'failed' for u in users if u.id.startswith('bad')}
+
+    def update_user_states(self, user_states):
+        return {user_id: 'failed' for user_id, _ in user_states if user_id.startswith('bad')}
+
+    def insert_users(self, new_users):
+        results = []
+        for user, _ in new_users:
+            name = user.email.split('@')[0]
+            if name.startswith('bad'):
+                results.append(InsertedUser(user, None, 'insert failed'))
+            else:
+                results.append(InsertedUser(user, f'new-{name}', 'no group' if name.startswith('nogroup') else None))
+        return results
+
+
+def sign_user(i, **kwargs):
+    return DetailedUserInfo(accountType='GLOBAL', email=f'user{i}@example.com', id=f'id{i}', isAccountAdmin=False,
+                            status='ACTIVE', firstName=f'First{i}', **kwargs)
+
+
+@pytest.fixture
+def sign_connector(tmp_path):
+    def _sign_connector(client, full_refresh=False):
+        connector = SignConnector.__new__(SignConnector)
+        connector.logger = logging.getLogger('test_sign')
+        connector.full_refresh = full_refresh
+        connector.test_mode = False
+        connector.cache = SignCache(tmp_path, 'primary')
+        connector.sign_client = client
+        return connector
+
+    return _sign_connector
+
+
+def test_refresh_delta(sign_connector):
+    group = UserGroupInfo(id='g1', isGroupAdmin=False, isPrimaryGroup=True, status='ACTIVE')
+    client = FakeSignClient([sign_user(i) for i in range(4)], [GroupInfo(groupId='g1', groupName='Group 1')],
+                            {f'id{i}': [group] for i in range(6)})
+    connector = sign_connector(client)
+    assert connector.cache.should_refresh
+    assert len(connector.get_users()) == 4
+    assert sorted(client.detail_requests) == ['id0', 'id1', 'id2', 'id3']
+
+    # one user renamed, one removed, one added; the others are left alone
+    client.detail_requests.clear()
+    client.group_requests.clear()
+    client.users['id1'] = sign_user(1, lastName='Changed')
+    del client.users['id2']
+    client.users['id4'] = sign_user(4)
+    connector.refresh()
+    assert sorted(client.detail_requests) == ['id1', 'id4']
+    assert sorted(client.group_requests) == ['id1', 'id4']
+    users = connector.cache.get_users()
+    assert sorted(u.id for u in users) == ['id0', 'id1', 'id3', 'id4']
+    assert connector.cache.get_user('id1').lastName == 'Changed'
+    assert sorted(user_id for user_id, _ in connector.cache.get_user_groups()) == ['id0', 'id1', 'id3', 'id4']
+    assert not connector.cache.should_refresh
+
+
+def test_full_refresh(sign_connector):
+    group = UserGroupInfo(id='g1', isGroupAdmin=False, isPrimaryGroup=True, status='ACTIVE')
+    client = FakeSignClient([sign_user(i) for i in range(3)], [GroupInfo(groupId='g1', groupName='Group 1')],
+                            {f'id{i}': [group] for i in range(3)})
+    sign_connector(client).refresh()
+    client.detail_requests.clear()
+    connector = sign_connector(client, full_refresh=True)
+    assert not connector.cache.should_refresh
+    assert len(connector.get_users()) == 3
+    assert sorted(client.detail_requests) == ['id0', 'id1', 'id2']
+    # only once per run
+    assert not connector.full_refresh
+
+
+def test_insert_users(sign_connector):
+    connector = sign_connector(FakeSignClient([], [], {}))
+    group = UserGroupInfo(id='g1', isGroupAdmin=False, isPrimaryGroup=True, status='ACTIVE')
+    new_users = [(DetailedUserInfo(accountType='GLOBAL', email=f'{name}@example.com', id='', isAccountAdmin=False,
+                                   status='ACTIVE'), UserGroupsInfo([group])) for name in ['user1', 'bad1', 'nogroup1']]
+    results = connector.insert_users(new_users)
+    assert [r.user_id for r in results] == ['new-user1', None, 'new-nogroup1']
+    # users that exist are cached, but only assigned groups are
+    assert sorted(u.id for u in connector.cache.get_users()) == ['new-nogroup1', 'new-user1']
+    assert dict(connector.cache.get_user_groups()) == {'new-user1': [group]}
+
+
+def test_update_user_states(sign_connector):
+    connector = sign_connector(FakeSignClient([], [], {}))
+    bad_user = sign_user(2)
+    bad_user.id = 'bad2'
+    connector.cache.cache_users([sign_user(1), bad_user])
+    errors = connector.update_user_states([('id1', UserStateInfo('INACTIVE')), ('bad2', UserStateInfo('INACTIVE'))])
+    assert errors == {'bad2': 'failed'}
+    assert connector.cache.get_user('id1').status == 'INACTIVE'
+    assert connector.cache.get_user('bad2').status == 'ACTIVE'
+    assert [u.id for u in connector.cache.get_users_to_refresh()] == ['bad2']
+
+
+def test_create_groups(sign_connector):
+    connector = sign_connector(FakeSignClient([], [], {}))
+    assert [g.groupId for g in connector.create_groups([DetailedGroupInfo(name='Group 1')])] == ['id-Group 1']
+    with pytest.raises(AssertionException, match='failed'):
+        connector.create_groups([DetailedGroupInfo(name='Bad Group'), DetailedGroupInfo(name='Group 2')])
+    # the groups that were created are cached even if others failed
+    assert sorted(g.groupName for g in connector.cache.get_groups()) == ['Group 1', 'Group 2']
+
+
+def test_refresh_users_without_groups(sign_connector):
+    group = UserGroupInfo(id='g1', isGroupAdmin=False, isPrimaryGroup=True, status='ACTIVE')
+    client = FakeSignClient([sign_user(i) for i in range(3)], [GroupInfo(groupId='g1', groupName='Group 1')],
+                            {f'id{i}': [group] for i in range(3)})
+    connector = sign_connector(client)
+    connector.refresh()
+    # e.g. the group assignment of a new user failed, so it was cached without one
+    connector.cache.update_user_groups_many([('id1', [])])
+    assert connector.cache.get_user_ids_without_primary_group() == ['id1']
+    client.group_requests.clear()
+    connector.refresh_users_if_needed()
+    assert client.group_requests == ['id1']
+    assert connector.cache.get_primary_user_groups()['id1'] == group
+    assert connector.cache.get_user_ids_without_primary_group() == []
+
+
+def test_update_user_fields(sign_connector):
+    client = FakeSignClient([sign_user(1, lastName='Changed')], [], {})
+    connector = sign_connector(client)
+    connector.cache.cache_users([sign_user(1, lastName='Cached')])
+    connector.update_user_fields([('id1', {'isAccountAdmin': True})])
+    assert [(u.lastName, u.isAccountAdmin) for u in client.updated] == [('Cached', True)]
+    # a saved plan is applied to the user as it is in Sign now
+    connector.update_user_fields([('id1', {'isAccountAdmin': True})], current=True)
+    assert [(u.lastName, u.isAccountAdmin) for u in client.updated] == [('Changed', True)]
+    assert connector.cache.get_user('id1').lastName == 'Changed'
+
+
+def test_update_user_states_missing_from_cache(sign_connector):
+    client = FakeSignClient([sign_user(1, lastName='Changed')], [], {})
+    client.users['id1'].status = 'INACTIVE'
+    connector = sign_connector(client)
+    connector.cache.cache_users([sign_user(2, lastName='Cached')])
+    # id1 isn't cached, as a user added since a plan was made wouldn't be
+    state = UserStateInfo('INACTIVE')
+    assert connector.update_user_states([('id1', state), ('id2', state)]) == {}
+    assert connector.cache.get_user('id1') is None
+    assert connector.cache.get_user('id2').status == 'INACTIVE'
+
+    # a saved plan caches the users as they are in Sign
+    connector.cache.cache_users([sign_user(1, lastName='Cached')])
+    assert connector.update_user_states([('id1', state)], current=True) == {}
+    user = connector.cache.get_user('id1')
+    assert (user.lastName, user.status) == ('Changed', 'INACTIVE')
+
+
+def test_update_users_failed(sign_connector):
+    connector = sign_connector(FakeSignClient([], [], {}))
+    bad_user = sign_user(2, lastName='Cached')
+    bad_user.id = 'bad2'
+    connector.cache.cache_users([sign_user(1, lastName='Cached'), bad_user])
+    errors = connector.update_user_fields([('id1', {'lastName': 'New'}), ('bad2', {'lastName': 'New'})])
+    assert errors == {'bad2': 'failed'}
+    # only the update that was made is cached
+    assert connector.cache.get_user('id1').lastName == 'New'
+    assert connector.cache.get_user('bad2').lastName == 'Cached'
+    assert [u.id for u in connector.cache.get_users_to_refresh()] == ['bad2']
@@ -0,0 +1,93 @@
+import logging
+from collections import defaultdict
+
+import pytest
+
+from user_sync.connector.directory_adobe_console import AdobeConsoleConnector
+
+
+class MockConnection:
+
+    def __init__(self, users, groups, page_size=2):
+        self.objects = {'user': users, 'group': groups}
+        self.page_size = page_size
+        self.pages_requested = []
+
+    def query_multiple(self, object_type, page=0, url_params=None, query_params=None):
+        self.pages_requested.append((object_type, page))
+        objects = self.objects[object_type]
+        start = page * self.page_size
+        values = objects[start:start + self.page_size]
+        last_page = start + self.page_size >= len(objects)
+        return values, last_page, len(objects), 0, page + 1, self.page_size
+
+
+def console_user(name, groups, identity_type='federatedID'):
+    return {
+        'username': name + '@example.com',
+        'email': name + '@example.com',
+        'domain': 'example.com',
+        'type': identity_type,
+        'firstname': name,
+        'lastname': name,
+        'country': 'US',
+        'groups': groups,
+    }
+
+
+@pytest.fixture
+def console_connector():
+    def _console_connector(users, groups, page_prefetch=0):
+        connector = AdobeConsoleConnector.__new__(AdobeConsoleConnector)
+        connector.logger = logging.getLogger('test_console')
+        connector.options = {}
+        connector.connection = MockConnection(users, [{'groupName': g} for g in groups])
+        connector.filter_by_identity_type = 'all'
+        connector.page_prefetch = page_prefetch
+        connector.user_by_usr_key = {}
+        connector.user_keys_by_group = defaultdict(list)
+        return connector
+
+    return _console_connector
+
+
+def test_iter_group_members(console_connector):
+    users = [
+        console_user('user1', ['Group A', 'group b']),
+        console_user('user2', ['GROUP A', 'group a']),
+        console_user('user3', []),
+    ]
+    connector = console_connector(users, ['Group A', 'Group B'])
+    connector.load_umapi_users('all')
+    assert list(connector.iter_group_members('group a')) == [
+        'federatedid,user1@example.com,example.com',
+        'federatedid,user2@example.com,example.com',
+    ]
+    assert list(connector.iter_group_members('Group B')) == ['federatedid,user1@example.com,example.com']
+    assert list(connector.iter_group_members('Group C')) == []
+
+
+def test_load_users_and_groups(console_connector):
+    users = [
+        console_user('user1', ['Group A', 'Group B']),
+        console_user('user2', ['group b']),
+        console_user('user3', ['Unmapped']),
+    ]
+    connector = console_connector(users, ['Group A', 'Group B', 'Unmapped'])
+    loaded = {u['email']: u for u in connector.load_users_and_groups(['Group A', 'Group B'], [], False)}
+    assert set(loaded) == {'user1@example.com', 'user2@example.com'}
+    assert loaded['user1@example.com']['groups'] == ['Group A', 'Group B']
+    assert loaded['user2@example.com']['groups'] == ['Group B']
+
+
+@pytest.mark.parametrize('page_prefetch', [0, 1, 3])
+def test_load_umapi_users_paged(console_connector, page_prefetch):
+    users = [console_user('user{}'.format(i), ['Group A']) for i in range(7)]
+    users.append(console_user('adobe1', ['Group A'], identity_type='adobeID'))
+    connector = console_connector(users, ['Group A'], page_prefetch)
+    connector.load_umapi_users('federatedID')
+    assert list(connector.user_by_usr_key) == [
+        'federatedid,user{}@example.com,example.com'.format(i) for i in range(7)]
+    assert len(list(connector.iter_group_members('Group A'))) == 7
+    user_pages = [p for t, p in connector.connection.pages_requested if t == 'user']
+    assert user_pages[:4] == [0, 1, 2, 3]
@@ -0,0 +1,123 @@
+import bz2
+import gzip
+import os
+
+import pytest
+
+from user_sync.connector.directory_csv import CSVDirectoryConnector
+from user_sync.error import AssertionException
+from user_sync.helper import CSVAdapter
+
+
+@pytest.fixture
+def csv_file(tmp_path):
+    def _csv_file(content, name='users.csv'):
+        path = tmp_path / name
+        path.write_text(content, encoding='utf8')
+        return str(path)
+
+    return _csv_file
+
+
+def test_read_csv_columns(csv_file):
+    path = csv_file("email,extra,email,country\n"
+                    "a@example.com,x,b@example.com,us\n"
+                    "\n"
+                    "c@example.com\n"
+                    "d@example.com,,e@example.com,,unexpected\n")
+    rows = list(CSVAdapter.read_csv_columns(path, ['email', 'country', 'missing']))
+    # like csv.DictReader, the last duplicated column wins
+    assert rows == [
+        ('b@example.com', 'us', None),
+        (None, None, None),
+        ('e@example.com', None, None),
+    ]
+    assert list(CSVAdapter.read_csv_columns(csv_file('', 'empty.csv'), ['email'])) == []
+
+
+def test_read_users(csv_file):
+    path = csv_file("email,firstname,lastname,country,groups,type,username,domain,title\n"
+                    "user1@example.com,One,User,us,\"Group A,Group B\",,,,Boss\n"
+                    "user1@example.com,,,,Group C,federatedID,user1,example.net,\n"
+                    "invalid,Bad,Email,,,,,,\n"
+                    "user2@example.com,Two,User,,,adobeID,,,\n"
+                    "user3@example.com,Three,User,,,notAType,,,\n")
+    connector = CSVDirectoryConnector({'file_path': path, 'user_identity_type': 'enterpriseID'})
+    users = connector.read_users(path, ['title'])
+    assert list(users) == ['user1@example.com', 'user2@example.com']
+    user1 = users['user1@example.com']
+    assert user1['firstname'] == 'One'
+    assert user1['country'] == 'US'
+    assert user1['groups'] == ['Group A', 'Group B', 'Group C']
+    assert user1['member_groups'] is user1['groups']
+    assert user1['identity_type'] == 'federatedID'
+    assert user1['username'] == 'user1'
+    assert user1['domain'] == 'example.net'
+    assert user1['source_attributes']['title'] is None
+    assert user1['source_attributes']['groups'] == 'Group C'
+    user2 = users['user2@example.com']
+    assert user2['identity_type'] == 'adobeID'
+    assert user2['username'] == 'user2@example.com'
+    assert user2['domain'] is None
+    assert 'member_groups' not in user2
+
+
+def test_read_users_without_source_attributes(csv_file):
+    path = csv_file("email,firstname,title\nuser1@example.com,One,Boss\n")
+    connector = CSVDirectoryConnector({'file_path': path})
+    connector.set_source_attributes_required(False)
+    assert 'source_attributes' not in connector.read_users(path, [])['user1@example.com']
+    # extended attributes always need them
+    assert connector.read_users(path, ['title'])['user1@example.com']['source_attributes']['title'] == 'Boss'
+
+
+def test_read_compressed_shards(csv_file, tmp_path):
+    header = "email,firstname,groups,type\n"
+    with gzip.open(str(tmp_path / 'shard1.csv.gz'), 'wt', encoding='utf8') as f:
+        f.write(header + "user1@example.com,One,Group A,\nuser2@example.com,Two,,\n")
+    with bz2.open(str(tmp_path / 'shard2.csv.bz2'), 'wt', encoding='utf8') as f:
+        f.write(header + "user1@example.com,,Group B,\nuser2@example.com,,,badType\nuser3@example.com,Three,,\n")
+    extra = csv_file(header + "user2@example.com,Two Again,Group C,\n", 'extra.csv')
+    connector = CSVDirectoryConnector({'file_path': [str(tmp_path / 'shard*'), extra]})
+    assert connector.get_file_paths() == [str(tmp_path / 'shard1.csv.gz'), str(tmp_path / 'shard2.csv.bz2'), extra]
+    users = {u['email']: u for u in connector.load_users_and_groups([], [], True)}
+    # merged the same way rows are merged within a single file
+    assert list(users) == ['user1@example.com', 'user3@example.com', 'user2@example.com']
+    assert users['user1@example.com']['firstname'] == 'One'
+    assert users['user1@example.com']['groups'] == ['Group A', 'Group B']
+    # the bad row in the second file dropped what was read for user2 before it
+    assert users['user2@example.com']['firstname'] == 'Two Again'
+    assert users['user2@example.com']['groups'] == ['Group C']
+
+
+def test_file_path_no_match(tmp_path):
+    connector = CSVDirectoryConnector({'file_path': str(tmp_path / '*.csv')})
+    with pytest.raises(AssertionException):
+        connector.get_file_paths()
+
+
+def test_cache_path(csv_file, tmp_path, monkeypatch):
+    path = csv_file("email,firstname,title\nuser1@example.com,One,Boss\n")
+    cache_path = str(tmp_path / 'cache')
+    connector = CSVDirectoryConnector({'file_path': path, 'cache_path': cache_path})
+    first = list(connector.load_users_and_groups([], ['title'], True))
+
+    def read_users(*args):
+        raise AssertionError('input was parsed again')
+
+    monkeypatch.setattr(CSVDirectoryConnector, 'read_users', read_users)
+    # a touched but otherwise unchanged file is still served from the cache
+    os.utime(path, ns=(0, 0))
+    assert list(connector.load_users_and_groups([], ['title'], True)) == first
+    # different extended attributes change the result, as does different content
+    monkeypatch.undo()
+    assert 'title' not in list(connector.load_users_and_groups([], [], True))[0]['source_attributes']
+    csv_file("email,firstname,title\nuser1@example.com,Uno,Boss\n")
+    assert list(connector.load_users_and_groups([], ['title'], True))[0]['firstname'] == 'Uno'
+
+
+def test_cache_path_missing_file(tmp_path):
+    connector = CSVDirectoryConnector({'file_path': [str(tmp_path / 'missing.csv')],
+                                       'cache_path': str(tmp_path / 'cache')})
+    with pytest.raises(AssertionException, match="Can't open file"):
+        list(connector.load_users_and_groups([], [], True))
@@ -0,0 +1,53 @@
+from user_sync.connector.directory import DirectoryConnector
+from user_sync.connector.directory_shared import SharedDirectoryConnector
+
+
+class FakeDirectoryConnector(DirectoryConnector):
+
+    def __init__(self, users):
+        super().__init__()
+        self.users = users
+        self.reads = []
+        self.source_attributes_required = True
+
+    def set_source_attributes_required(self, required):
+        self.source_attributes_required = required
+
+    def load_users_and_groups(self, groups, extended_attributes=None, all_users=True):
+        self.reads.append((set(groups), extended_attributes, all_users, self.source_attributes_required))
+        return iter(self.users)
+
+
+def directory_user(name, groups):
+    return {'email': name + '@example.com', 'groups': groups}
+
+
+def test_single_read_for_all_requests():
+    underlying = FakeDirectoryConnector([
+        directory_user('user1', ['Group A', 'Group B']),
+        directory_user('user2', ['Group B']),
+        directory_user('user3', []),
+    ])
+    connector = SharedDirectoryConnector(underlying, [
+        ({'Group A'}, ['title'], True),
+        ({'Group B'}, [], False),
+    ])
+    connector.set_source_attributes_required(True)
+    connector.set_source_attributes_required(False)
+
+    # groups are left as the connector returned them, including ones only the other engine asked for
+    first = list(connector.load_users_and_groups({'Group A'}, ['title'], True))
+    assert [u['groups'] for u in first] == [['Group A', 'Group B'], ['Group B'], []]
+    # all users were read, but the second engine only gets members of its groups, matched without case
+    second = list(connector.load_users_and_groups({'group b'}, [], False))
+    assert [(u['email'], u['groups']) for u in second] == [
+        ('user1@example.com', ['Group A', 'Group B']),
+        ('user2@example.com', ['Group B']),
+    ]
+    assert underlying.reads == [({'Group A', 'Group B'}, ['title'], True, True)]
+
+    # engines add their own keys, which must not leak into what the others see
+    first[0]['member_groups'] = ['added']
+    first[0]['groups'].append('added')
+    assert 'member_groups' not in list(connector.load_users_and_groups({'Group A'}, ['title'], True))[0]
+    assert underlying.users[0]['groups'] == ['Group A', 'Group B']
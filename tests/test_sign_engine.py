@@ -5,8 +5,9 @@ import pytest
 from mock import MagicMock, call
 
 from user_sync.config.sign_sync import SignConfigLoader
-from user_sync.engine.sign import SignSyncEngine
+from user_sync.engine.sign import GroupMappingResolver, SignOrgPlan, SignSyncEngine
 from user_sync.engine.umapi import AdobeGroup
+from user_sync.error import AssertionException
 
 
 @pytest.fixture
@@ -73,30 +74,34 @@ def test_handle_sign_only_users(example_engine):
         status='ACTIVE',
     )}
 
+    def plan_for(action):
+        example_engine.options['user_sync']['sign_only_user_action'] = action
+        plan = SignOrgPlan()
+        example_engine.handle_sign_only_users(sign_connector, 'primary', plan)
+        return plan
+
     # Check exclude action
-    example_engine.options['user_sync']['sign_only_user_action'] = 'exclude'
-    example_engine.handle_sign_only_users(sign_connector, 'primary')
-    assert sign_connector.deactivate_user.call_args is None
-    assert sign_connector.update_users.call_args == call([])
+    plan = plan_for('exclude')
+    assert len(plan) == 0
 
     # Check reset (groups and roles)
-    example_engine.options['user_sync']['sign_only_user_action'] = 'reset'
-    example_engine.handle_sign_only_users(sign_connector, 'primary')
-    assert sign_connector.update_users.call_args[0][0][0].isAccountAdmin is False
-    assert sign_connector.update_user_groups.call_args[0][0][0][1].groupInfoList[0].id == 'abc12345'
-    assert sign_connector.update_user_groups.call_args[0][0][0][1].groupInfoList[0].isGroupAdmin is False
+    plan = plan_for('reset')
+    assert plan.user_updates == [('12345', {'isAccountAdmin': False})]
+    assert plan.user_group_updates[0][1].groupInfoList[0].id == 'abc12345'
+    assert plan.user_group_updates[0][1].groupInfoList[0].isGroupAdmin is False
 
     # Check remove_roles (group should remain the same as it is for ex_sign_user)
-    example_engine.options['user_sync']['sign_only_user_action'] = 'remove_roles'
-    example_engine.handle_sign_only_users(sign_connector, 'primary')
-    assert sign_connector.update_users.call_args[0][0][0].isAccountAdmin is False
-    assert sign_connector.update_user_groups.call_args[0][0][0][1].groupInfoList[0].id == 'xyz98765'
-    assert sign_connector.update_user_groups.call_args[0][0][0][1].groupInfoList[0].isGroupAdmin is False
+    plan = plan_for('remove_roles')
+    assert plan.user_updates == [('12345', {'isAccountAdmin': False})]
+    assert plan.user_group_updates[0][1].groupInfoList[0].id == 'xyz98765'
+    assert plan.user_group_updates[0][1].groupInfoList[0].isGroupAdmin is False
 
     # Check remove_groups (role should remain the same as it is for ex_sign_user)
-    example_engine.options['user_sync']['sign_only_user_action'] = 'remove_groups'
-    example_engine.handle_sign_only_users(sign_connector, 'primary')
-    assert sign_connector.update_user_groups.call_args[0][0][0][1].groupInfoList[0].id == 'abc12345'
+    plan = plan_for('remove_groups')
+    assert plan.user_group_updates[0][1].groupInfoList[0].id == 'abc12345'
+    # nothing is changed until the plan is applied
+    assert not sign_connector.update_users.called
+    assert not sign_connector.update_user_groups.called
 
 def test_roles_match():
     resolved_role = ['GROUP_ADMIN', 'ACCOUNT_ADMIN']
@@ -277,3 +282,242 @@ def test_extract_mapped_group():
     check_mapping(['Sign Group 3', 'Sign Group 2'], 'Sign Group 2', ['NORMAL_USER'])
     check_mapping(['Sign Group 3', 'Test Group Admins 1', 'Test Group Admins 2'],
                   'Sign Group 3', ['ACCOUNT_ADMIN', 'GROUP_ADMIN'])
+
+
+
+def test_group_mapping_resolver():
+    AdobeGroup.index_map = {}
+    g1 = AdobeGroup.create('Sign Group 1')
+    g2 = AdobeGroup.create('Sign Group 2')
+    mappings = {
+        'Admins': {'priority': 1, 'roles': {'GROUP_ADMIN'}, 'groups': []},
+        'Group 2': {'priority': 2, 'roles': set(), 'groups': [g2]},
+        'Group 1': {'priority': 0, 'roles': set(), 'groups': [g1]},
+    }
+    resolver = GroupMappingResolver(mappings)
+    first = resolver.resolve(['Other', 'Group 2', 'Admins', 'Group 1'])
+    assert first == {'group': g1, 'roles': ['GROUP_ADMIN']}
+    # unmapped groups and order don't matter, so this is answered from the memo
+    second = resolver.resolve(['Group 1', 'Admins', 'Group 2'])
+    assert second == first and second is not first
+    assert len(resolver.memo) == 1
+    assert resolver.resolve(['Group 2']) == {'group': g2, 'roles': ['NORMAL_USER']}
+    assert resolver.resolve([]) == {'group': None, 'roles': ['NORMAL_USER']}
+    assert len(resolver.memo) == 3
+
+def test_handle_sign_only_users_deactivate(example_engine):
+    from sign_client.model import GroupInfo, UserGroupInfo
+    from user_sync.cache.sign import SignUserRecord
+    users = [SignUserRecord(f'id{i}', f'user{i}@example.com', 'ACTIVE', False) for i in range(3)]
+    example_engine.sign_only_users_by_org['primary'] = {u.email: u for u in users}
+    example_engine.default_groups['primary'] = GroupInfo(groupId='g0', groupName='Default Group', isDefaultGroup=True)
+    example_engine.sign_user_primary_groups['primary'] = {u.id: UserGroupInfo(
+        id='g0', isGroupAdmin=u.id == 'id2', isPrimaryGroup=True, status='ACTIVE') for u in users}
+    example_engine.options['user_sync']['sign_only_user_action'] = 'deactivate'
+    sign_connector = MagicMock()
+    sign_connector.deactivate_users = True
+    sign_connector.update_user_states.return_value = {'id1': 'failed'}
+    plan = SignOrgPlan()
+    example_engine.handle_sign_only_users(sign_connector, 'primary', plan)
+    assert plan.deactivations == [(u.id, u.email) for u in users]
+    assert not sign_connector.update_user_states.called
+    example_engine.sign_groups['primary'] = {}
+    example_engine.apply_org_plan('primary', sign_connector, plan)
+    # all state changes go out in one batch
+    assert sign_connector.update_user_states.call_count == 1
+    assert [user_id for user_id, _ in sign_connector.update_user_states.call_args[0][0]] == ['id0', 'id1', 'id2']
+    assert example_engine.sign_users_deactivated == {('primary', 'user0@example.com'), ('primary', 'user2@example.com')}
+    assert [user_id for user_id, _ in sign_connector.update_user_groups.call_args[0][0]] == []
+
+
+def test_handle_sign_only_users_unknown_group(example_engine):
+    from sign_client.model import GroupInfo, UserGroupInfo
+    from user_sync.cache.sign import SignUserRecord
+    users = [SignUserRecord(f'id{i}', f'user{i}@example.com', 'ACTIVE', True) for i in range(2)]
+    example_engine.sign_only_users_by_org['primary'] = {u.email: u for u in users}
+    example_engine.default_groups['primary'] = GroupInfo(groupId='g0', groupName='Default Group', isDefaultGroup=True)
+    # the groups of id1 aren't cached
+    example_engine.sign_user_primary_groups['primary'] = {'id0': UserGroupInfo(
+        id='g1', isGroupAdmin=False, isPrimaryGroup=True, status='ACTIVE')}
+    example_engine.options['user_sync']['sign_only_user_action'] = 'reset'
+    plan = SignOrgPlan()
+    example_engine.handle_sign_only_users(MagicMock(), 'primary', plan)
+    assert [user_id for user_id, _ in plan.user_group_updates] == ['id0']
+
+
+class FakeOrgConnector:
+    """
+    Stands in for SignConnector in run(), serving one existing user and one Sign-only user per org
+    """
+    barrier = None
+
+    def __init__(self, target_options, org_name, test_mode, connection, cache_config, full_refresh=False):
+        from sign_client.model import GroupInfo, UserGroupInfo
+        from user_sync.cache.sign import SignUserRecord
+        self.console_org = org_name
+        self.test_mode = test_mode
+        self.connection = connection
+        self.create_users = True
+        self.deactivate_users = False
+        self.closed = False
+        self.inserted = []
+        self.refreshed_groups = False
+        self.updated_fields = []
+        self.groups = {'default group': GroupInfo(groupId='g0', groupName='Default Group', isDefaultGroup=True)}
+        self.records = [SignUserRecord(f'{org_name}1', 'user1@example.com', 'ACTIVE', False),
+                        SignUserRecord(f'{org_name}2', f'{org_name}-only@example.com', 'ACTIVE', False)]
+        self.user_groups = {r.id: [UserGroupInfo(id='g0', name='Default Group', isGroupAdmin=False,
+                                                 isPrimaryGroup=True, status='ACTIVE')] for r in self.records}
+
+    def sign_groups(self, refresh=True):
+        self.refreshed_groups = refresh
+        if self.barrier is not None:
+            # both orgs must get here before either can go on
+            self.barrier.wait()
+        return self.groups
+
+    def create_groups(self, new_groups):
+        from sign_client.model import GroupInfo
+        self.created_groups = [g.name for g in new_groups]
+        if self.test_mode:
+            return []
+        return [GroupInfo(groupId=f'id-{g.name}', groupName=g.name) for g in new_groups]
+
+    def get_user_index(self):
+        from user_sync.cache.sign import SignUserIndex
+        return SignUserIndex(self.records, {user_id: groups[0] for user_id, groups in self.user_groups.items()})
+
+    def insert_users(self, new_users):
+        from sign_client.client import InsertedUser
+        if self.test_mode:
+            return [InsertedUser(user, None, None) for user, _ in new_users]
+        self.inserted.extend(user.email for user, _ in new_users)
+        self.inserted_groups = [groups.groupInfoList[0].id for _, groups in new_users]
+        return [InsertedUser(user, f'{self.console_org}-new', None) for user, _ in new_users]
+
+    def update_user_fields(self, user_changes, current=False):
+        if user_changes:
+            self.updated_fields.append((user_changes, current))
+        return {}
+
+    def update_user_groups(self, user_groups):
+        return {}
+
+    def close(self):
+        self.closed = True
+
+
+def test_run_orgs_concurrently(monkeypatch, mock_dir_user):
+    import threading
+    monkeypatch.setattr('user_sync.engine.sign.SignConnector', FakeOrgConnector)
+    monkeypatch.setattr(FakeOrgConnector, 'barrier', threading.Barrier(2, timeout=10))
+    options = {
+        'test_mode': False,
+        'connection': {'org_concurrency': 2},
+        'cache': {'path': 'cache/sign'},
+        'user_sync': {'sign_only_limit': 100, 'sign_only_user_action': 'exclude'},
+    }
+    engine = SignSyncEngine(options, {'primary': {}, 'secondary': {}})
+    directory_users = [dict(mock_dir_user, email='user1@example.com', groups=[]),
+                       dict(mock_dir_user, email='user2@example.com', groups=[])]
+    dc = MagicMock()
+    dc.load_users_and_groups.return_value = directory_users
+    engine.run({}, dc)
+
+    assert all(c.closed for c in engine.connectors.values())
+    assert engine.connectors['secondary'].inserted == ['user2@example.com']
+    assert engine.action_summary['Number of Sign users read'] == 4
+    assert engine.action_summary['Number of Sign users created'] == 2
+    assert engine.action_summary['Number of Sign users not in directory (sign-only)'] == 2
+    assert engine.org_action_summary({'primary'})['Number of Sign users created'] == 1
+
+
+def test_run_org_failure(monkeypatch, mock_dir_user):
+    def sign_groups(self):
+        raise AssertionException(f'{self.console_org} is down')
+
+    monkeypatch.setattr('user_sync.engine.sign.SignConnector', FakeOrgConnector)
+    monkeypatch.setattr(FakeOrgConnector, 'sign_groups', sign_groups)
+    options = {'test_mode': False, 'connection': {}, 'cache': {'path': 'cache/sign'}}
+    engine = SignSyncEngine(options, {'primary': {}, 'secondary': {}})
+    dc = MagicMock()
+    dc.load_users_and_groups.return_value = []
+    with pytest.raises(AssertionException, match='primary is down'):
+        engine.run({}, dc)
+    # without org_concurrency, orgs run one at a time and stop at the first failure
+    assert list(engine.connectors) == ['primary']
+    assert engine.connectors['primary'].closed
+
+
+def test_run_creates_groups(monkeypatch, mock_dir_user):
+    monkeypatch.setattr('user_sync.engine.sign.SignConnector', FakeOrgConnector)
+    AdobeGroup.index_map = {}
+    groups = [AdobeGroup('New Group', 'primary'), AdobeGroup('new group', 'primary'), AdobeGroup('Default Group', 'primary')]
+    mappings = {
+        'Dir 1': {'priority': 0, 'roles': set(), 'groups': groups[:1]},
+        'Dir 2': {'priority': 1, 'roles': set(), 'groups': groups[1:]},
+    }
+    options = {
+        'test_mode': False,
+        'connection': {},
+        'cache': {'path': 'cache/sign'},
+        'user_sync': {'sign_only_limit': 100, 'sign_only_user_action': 'exclude'},
+    }
+    engine = SignSyncEngine(options, {'primary': {}})
+    dc = MagicMock()
+    dc.load_users_and_groups.return_value = [dict(mock_dir_user, email='user2@example.com', groups=['Dir 1'])]
+    engine.run(mappings, dc)
+    connector = engine.connectors['primary']
+    # created once, despite the differently cased mapping, and usable without reloading the groups
+    assert connector.created_groups == ['New Group']
+    assert engine.sign_groups['primary']['new group'].groupId == 'id-New Group'
+    assert connector.inserted == ['user2@example.com']
+
+
+def test_plan_and_apply(monkeypatch, mock_dir_user, tmp_path):
+    monkeypatch.setattr('user_sync.engine.sign.SignConnector', FakeOrgConnector)
+    AdobeGroup.index_map = {}
+    mappings = {'Dir 1': {'priority': 0, 'roles': set(), 'groups': [AdobeGroup('New Group', 'primary')]},
+                'Dir 2': {'priority': 1, 'roles': {'ACCOUNT_ADMIN'}, 'groups': []}}
+    plan_path = str(tmp_path / 'plan.json')
+    options = {
+        'test_mode': False,
+        'plan_out': plan_path,
+        'connection': {'request_concurrency': 2},
+        'cache': {'path': 'cache/sign'},
+        'user_sync': {'sign_only_limit': 100, 'sign_only_user_action': 'exclude'},
+    }
+    engine = SignSyncEngine(options, {'primary': {}})
+    dc = MagicMock()
+    dc.load_users_and_groups.return_value = [dict(mock_dir_user, email='user2@example.com', groups=['Dir 1']),
+                                             dict(mock_dir_user, email='user1@example.com', groups=['Dir 2'])]
+    engine.run(mappings, dc)
+    # the plan is worked out as in test mode
+    assert engine.connectors['primary'].test_mode
+    assert engine.connectors['primary'].inserted == []
+    assert engine.plans['primary'].user_updates == [('primary1', {'isAccountAdmin': True})]
+    # and nothing is reported as done
+    assert not hasattr(engine.connectors['primary'], 'created_groups')
+    assert 'Number of Sign users created' not in engine.action_summary
+    assert engine.action_summary['Number of Sign users to be created'] == 1
+
+    # and applied by another run, which doesn't read the directory
+    del options['plan_out']
+    engine = SignSyncEngine(options, {'primary': {}})
+    engine.apply_plan(plan_path)
+    connector = engine.connectors['primary']
+    assert connector.connection['request_concurrency'] == connector.connection['max_request_concurrency'] == 8
+    assert connector.created_groups == ['New Group']
+    assert connector.inserted == ['user2@example.com']
+    # the new user is assigned to the group created just before
+    assert connector.inserted_groups == ['id-New Group']
+    # without refreshing the cache first, and only changing the planned fields of the user as it is now
+    assert not connector.refreshed_groups
+    assert connector.updated_fields == [([('primary1', {'isAccountAdmin': True})], True)]
+    assert engine.action_summary['Number of Sign users created'] == 1
+
+    with pytest.raises(AssertionException, match='unknown Sign orgs'):
+        SignSyncEngine(options, {'secondary': {}}).apply_plan(plan_path)
+    (tmp_path / 'old.json').write_text('{"version": 0, "orgs": {}}')
+    with pytest.raises(AssertionException, match='not saved by this version'):
+        engine.apply_plan(str(tmp_path / 'old.json'))
@@ -18,6 +18,7 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 import logging
+import multiprocessing
 import os
 import platform
 import sys
@@ -54,6 +55,7 @@ from user_sync.connector.directory_adobe_console import AdobeConsoleConnector
 from user_sync.connector.directory_csv import CSVDirectoryConnector
 from user_sync.connector.directory_ldap import LDAPDirectoryConnector
 from user_sync.connector.directory_okta import OktaDirectoryConnector
+from user_sync.connector.directory_shared import SharedDirectoryConnector
 
 from user_sync.error import AssertionException
 from user_sync.version import __version__ as app_version
@@ -121,79 +123,91 @@ def info():
             click.echo(f"  {p}: {pkg_meta[p]}")
 
 
+# options of the sync command, which sync-all shares so that both build the same UMAPI config
+umapi_sync_options = [
+    click.option('--config-file-encoding', 'encoding_name',
+                 help="encoding of your configuration files",
+                 type=str,
+                 nargs=1,
+                 metavar='encoding-name'),
+    click.option('-c', '--config-filename',
+                 help="path to your main configuration file",
+                 type=str,
+                 nargs=1,
+                 metavar='path-to-file'),
+    click.option('--adobe-only-user-action',
+                 help="specify what action to take on Adobe users that don't match users from the "
+                      "directory.  Options are 'exclude' (from all changes), "
+                      "'preserve' (as is except for --process-groups, the default), "
+                      "'write-file f' (preserve and list them), "
+                      "'remove-adobe-groups' (but do not remove users)"
+                      "'remove' (users but preserve cloud storage), "
+                      "'delete' (users and their cloud storage), ",
+                 cls=user_sync.cli.OptionMulti,
+                 type=list,
+                 metavar='exclude|preserve|delete|remove|remove-adobe-groups|write-file [path-to-file.csv]'),
+    click.option('--adobe-only-user-list',
+                 help="instead of computing Adobe-only users (Adobe users with no matching users "
+                      "in the directory) by comparing Adobe users with directory users, "
+                      "the list is read from a file (see --adobe-only-user-action write-file). "
+                      "When using this option, you must also specify what you want done with Adobe-only "
+                      "users by also including --adobe-only-user-action and one of its arguments",
+                 type=str,
+                 nargs=1,
+                 metavar='input_path'),
+    click.option('--adobe-users',
+                 help="specify the adobe users to pull from UMAPI. Legal values are 'all' (the default), "
+                      "'group names' (one or more specified groups), 'mapped' (all groups listed in "
+                      "the configuration file)",
+                 cls=user_sync.cli.OptionMulti,
+                 type=list,
+                 metavar='all|mapped|group [group list]'),
+    click.option('--connector',
+                 help='specify a connector to use; default is LDAP (or CSV if --users file is specified)',
+                 cls=user_sync.cli.OptionMulti,
+                 type=list,
+                 metavar='ldap|okta|csv|adobe_console [path-to-file.csv]'),
+    click.option('--exclude-unmapped-users/--include-unmapped-users', default=None,
+                 help='Exclude users that is not part of a mapped group from being created on Adobe side'),
+    click.option('--process-groups/--no-process-groups', default=None,
+                 help='if membership in mapped groups differs between the enterprise directory and Adobe sides, '
+                      'the group membership is updated on the Adobe side so that the memberships in mapped '
+                      'groups match those on the enterprise directory side.'),
+    click.option('--strategy',
+                 help="whether to fetch and sync the Adobe directory against the customer directory "
+                      "or just to push each customer user to the Adobe side.  Default is to fetch and sync.",
+                 nargs=1,
+                 type=str,
+                 metavar='sync|push'),
+    click.option('-t/-T', '--test-mode/--no-test-mode', default=None,
+                 help='enable test mode (API calls do not execute changes on the Adobe side).'),
+    click.option('--user-filter',
+                 help='limit the selected set of users that may be examined for syncing, with the pattern '
+                      'being a regular expression.',
+                 nargs=1,
+                 type=str,
+                 metavar='pattern'),
+    click.option('--users',
+                 help="specify the users to be considered for sync. Legal values are 'all' (the default), "
+                      "'group names' (one or more specified groups), 'mapped' (all groups listed in "
+                      "the configuration file), 'file f' (a specified input file).",
+                 cls=user_sync.cli.OptionMulti,
+                 type=list,
+                 metavar='all|file|mapped|group [group list or path-to-file.csv]'),
+    click.option('--update-user-info/--no-update-user-info', default=None,
+                 help='user attributes on the Adobe side are updated from the directory.'),
+]
+
+
+def with_umapi_sync_options(func):
+    for option in reversed(umapi_sync_options):
+        func = option(func)
+    return func
+
+
 @main.command()
 @click.help_option('-h', '--help')
-@click.option('--config-file-encoding', 'encoding_name',
-              help="encoding of your configuration files",
-              type=str,
-              nargs=1,
-              metavar='encoding-name')
-@click.option('-c', '--config-filename',
-              help="path to your main configuration file",
-              type=str,
-              nargs=1,
-              metavar='path-to-file')
-@click.option('--adobe-only-user-action',
-              help="specify what action to take on Adobe users that don't match users from the "
-                   "directory.  Options are 'exclude' (from all changes), "
-                   "'preserve' (as is except for --process-groups, the default), "
-                   "'write-file f' (preserve and list them), "
-                   "'remove-adobe-groups' (but do not remove users)"
-                   "'remove' (users but preserve cloud storage), "
-                   "'delete' (users and their cloud storage), ",
-              cls=user_sync.cli.OptionMulti,
-              type=list,
-              metavar='exclude|preserve|delete|remove|remove-adobe-groups|write-file [path-to-file.csv]')
-@click.option('--adobe-only-user-list',
-              help="instead of computing Adobe-only users (Adobe users with no matching users "
-                   "in the directory) by comparing Adobe users with directory users, "
-                   "the list is read from a file (see --adobe-only-user-action write-file). "
-                   "When using this option, you must also specify what you want done with Adobe-only "
-                   "users by also including --adobe-only-user-action and one of its arguments",
-              type=str,
-              nargs=1,
-              metavar='input_path')
-@click.option('--adobe-users',
-              help="specify the adobe users to pull from UMAPI. Legal values are 'all' (the default), "
-                   "'group names' (one or more specified groups), 'mapped' (all groups listed in "
-                   "the configuration file)",
-              cls=user_sync.cli.OptionMulti,
-              type=list,
-              metavar='all|mapped|group [group list]')
-@click.option('--connector',
-              help='specify a connector to use; default is LDAP (or CSV if --users file is specified)',
-              cls=user_sync.cli.OptionMulti,
-              type=list,
-              metavar='ldap|okta|csv|adobe_console [path-to-file.csv]')
-@click.option('--exclude-unmapped-users/--include-unmapped-users', default=None,
-              help='Exclude users that is not part of a mapped group from being created on Adobe side')
-@click.option('--process-groups/--no-process-groups', default=None,
-              help='if membership in mapped groups differs between the enterprise directory and Adobe sides, '
-                   'the group membership is updated on the Adobe side so that the memberships in mapped '
-                   'groups match those on the enterprise directory side.')
-@click.option('--strategy',
-              help="whether to fetch and sync the Adobe directory against the customer directory "
-                   "or just to push each customer user to the Adobe side.  Default is to fetch and sync.",
-              nargs=1,
-              type=str,
-              metavar='sync|push')
-@click.option('-t/-T', '--test-mode/--no-test-mode', default=None,
-              help='enable test mode (API calls do not execute changes on the Adobe side).')
-@click.option('--user-filter',
-              help='limit the selected set of users that may be examined for syncing, with the pattern '
-                   'being a regular expression.',
-              nargs=1,
-              type=str,
-              metavar='pattern')
-@click.option('--users',
-              help="specify the users to be considered for sync. Legal values are 'all' (the default), "
-                   "'group names' (one or more specified groups), 'mapped' (all groups listed in "
-                   "the configuration file), 'file f' (a specified input file).",
-              cls=user_sync.cli.OptionMulti,
-              type=list,
-              metavar='all|file|mapped|group [group list or path-to-file.csv]')
-@click.option('--update-user-info/--no-update-user-info', default=None,
-              help='user attributes on the Adobe side are updated from the directory.')
+@with_umapi_sync_options
 def sync(**kwargs):
     """Run User Sync [default command]"""
     # sign_config_file = kwargs.get('sign_sync_config')
@@ -224,6 +238,19 @@ def sync(**kwargs):
               metavar='all|mapped|group [group list]')  # default should mapped
 @click.option('-t/-T', '--test-mode/--no-test-mode', default=None,
               help='enable test mode (API calls do not execute changes).')
+@click.option('--full-refresh/--no-full-refresh', default=None,
+              help='rebuild the Sign cache from scratch, instead of refreshing only users that changed.')
+@click.option('--plan-out',
+              help="work out the changes for every Sign org without making them, and save them to this file "
+                   "for a later run with --apply-plan.",
+              type=str,
+              nargs=1,
+              metavar='path-to-file')
+@click.option('--apply-plan',
+              help="make the changes saved by an earlier run with --plan-out, without reading the directory.",
+              type=str,
+              nargs=1,
+              metavar='path-to-file')
 def sign_sync(**kwargs):
     """Run Sign Sync """
     # load the config files (sign-sync-config.yml) and start the file logger
@@ -237,6 +264,33 @@ def sign_sync(**kwargs):
             e.set_reported()
 
 
+@main.command()
+@click.help_option('-h', '--help')
+@with_umapi_sync_options
+@click.option('--sign-config-filename',
+              help="path to your main Sign Sync configuration file.",
+              type=str,
+              nargs=1,
+              metavar='path-to-file')
+def sync_all(sign_config_filename, **kwargs):
+    """Run User Sync, then Sign Sync, on a single directory read
+
+    The directory is read with the User Sync connector config.  The Sign Sync identity_source must be of the
+    same type, and its connector config is not used.
+    """
+    try:
+        sign_config_loader = SignConfigLoader({'config_filename': sign_config_filename,
+                                               'encoding_name': kwargs['encoding_name'],
+                                               'test_mode': kwargs['test_mode']})
+        run_sync(config.UMAPIConfigLoader(kwargs), lambda loader: begin_work_combined(sign_config_loader, loader))
+    except ConfigValidationError as e:
+        logger.critical('Schema validation failed. Detailed message: {}'.format(e))
+    except AssertionException as e:
+        if not e.is_reported():
+            logger.critical("%s", e)
+            e.set_reported()
+
+
 @main.command()
 @click.help_option('-h', '--help')
 @click.option('--config-filename', help="Filename of post-sync config file",
@@ -352,9 +406,20 @@ def migrate_post_sync(config_filename, connector_type, connector_filename):
 
 def begin_work_sign(sign_config_loader: SignConfigLoader):
     sign_engine_config = sign_config_loader.get_engine_options()
-    directory_connector, directory_groups = load_directory_config(sign_config_loader)
     target_options = sign_config_loader.get_target_options()
     sign_engine = SignSyncEngine(sign_engine_config, target_options)
+    if sign_engine_config.get('apply_plan'):
+        # the directory was read when the plan was made
+        sign_engine.apply_plan(sign_engine_config['apply_plan'])
+        return
+    directory_connector, directory_groups = load_directory_config(sign_config_loader)
+    run_sign_engine(sign_engine, directory_connector, directory_groups)
+
+
+def run_sign_engine(sign_engine: SignSyncEngine, directory_connector: DirectoryConnector, directory_groups: dict):
+    if directory_connector is not None:
+        # sign sync has no after-mapping hook
+        directory_connector.set_source_attributes_required(False)
     sign_engine.run(directory_groups, directory_connector)
 
 
@@ -365,6 +430,54 @@ def begin_work_umapi(config_loader: UMAPIConfigLoader):
 
     umapi_engine_config = config_loader.get_engine_options()
     directory_connector, directory_groups = load_directory_config(config_loader, umapi_engine_config['new_account_type'])
+    rule_processor = user_sync.engine.umapi.RuleProcessor(umapi_engine_config)
+    run_umapi_engine(config_loader, rule_processor, directory_connector, directory_groups)
+
+
+def begin_work_combined(sign_config_loader: SignConfigLoader, config_loader: UMAPIConfigLoader):
+    """
+    Run the UMAPI sync and then the Sign sync, reading the directory once for both.  The directory connector
+    is the one configured for the UMAPI sync; the Sign sync must be configured with the same type.
+    :type sign_config_loader: SignConfigLoader
+    :type config_loader: config.UMAPIConfigLoader
+    """
+    umapi_source = config_loader.get_directory_connector_module_name()
+    sign_source = sign_config_loader.get_directory_connector_module_name()
+    if umapi_source != sign_source:
+        raise AssertionException("Sign sync identity source '{}' does not match the User Sync connector '{}'".format(
+            sign_source, umapi_source))
+    if umapi_source is not None:
+        umapi_options = config_loader.get_directory_connector_options(umapi_source)
+        sign_options = sign_config_loader.get_directory_connector_options(sign_source)
+        differing = sorted(k for k in set(umapi_options) | set(sign_options)
+                           if umapi_options.get(k) != sign_options.get(k))
+        if differing:
+            logger.warning("The Sign sync identity source config is ignored; the directory is read with the "
+                           "User Sync connector config, which differs in: %s", ', '.join(differing))
+
+    umapi_engine_config = config_loader.get_engine_options()
+    directory_connector, umapi_directory_groups = load_directory_config(config_loader,
+                                                                        umapi_engine_config['new_account_type'])
+    rule_processor = user_sync.engine.umapi.RuleProcessor(umapi_engine_config)
+    sign_directory_groups = sign_config_loader.get_directory_groups()
+    sign_engine = SignSyncEngine(sign_config_loader.get_engine_options(), sign_config_loader.get_target_options())
+    if directory_connector is not None:
+        directory_connector = SharedDirectoryConnector(directory_connector, [
+            rule_processor.get_directory_request(umapi_directory_groups),
+            sign_engine.get_directory_request(sign_directory_groups),
+        ])
+
+    run_umapi_engine(config_loader, rule_processor, directory_connector, umapi_directory_groups)
+    run_sign_engine(sign_engine, directory_connector, sign_directory_groups)
+
+
+def run_umapi_engine(config_loader: UMAPIConfigLoader, rule_processor, directory_connector: DirectoryConnector,
+                     directory_groups: dict):
+    """
+    :type config_loader: config.UMAPIConfigLoader
+    :type rule_processor: user_sync.engine.umapi.RuleProcessor
+    """
+    umapi_engine_config = rule_processor.options
 
     if not umapi_engine_config['ssl_cert_verify']:
         logger.warning("SSL certificate verification is bypassed.  Consider disabling this option and using the "
@@ -393,6 +506,7 @@ def begin_work_umapi(config_loader: UMAPIConfigLoader):
         additional_group_filters = [r['source'] for r in additional_groups]
     if directory_connector is not None:
         directory_connector.set_additional_group_filters(additional_group_filters)
+        directory_connector.set_source_attributes_required(umapi_engine_config['after_mapping_hook'] is not None)
 
     primary_name = '.primary' if secondary_umapi_configs else ''
     umapi_primary_connector = UmapiConnector(primary_name, primary_umapi_config, True)
@@ -403,7 +517,6 @@ def begin_work_umapi(config_loader: UMAPIConfigLoader):
         umapi_other_connectors[secondary_umapi_name] = umapi_secondary_conector
     umapi_connectors = user_sync.engine.umapi.UmapiConnectors(umapi_primary_connector, umapi_other_connectors)
 
-    rule_processor = user_sync.engine.umapi.RuleProcessor(umapi_engine_config)
     if len(directory_groups) == 0 and rule_processor.will_process_groups():
         logger.warning('No group mapping specified in configuration but --process-groups requested on command line')
     rule_processor.run(directory_groups, directory_connector, umapi_connectors)
@@ -763,4 +876,6 @@ def certgen(randomize, key, certificate, overwrite):
 
 
 if __name__ == '__main__':
+    # required for the CSV connector's worker processes in frozen (pyinstaller) builds
+    multiprocessing.freeze_support()
     main()
@@ -5,16 +5,24 @@ from .schema import cache_meta as cache_meta_schema
 
 class CacheBase:
     should_refresh: bool = False
+    # whether init() found no metadata and created it
+    meta_created: bool = False
     cache_meta_filename: str = 'cache-meta.db'
     refresh_interval: int = 86400
 
     # used by child classes to manage schema and data model changes
     VERSION: int = 0
 
-    def init(self, store_path: Path):
-        self.meta_path = store_path / self.cache_meta_filename
+    def init(self, store_path: Path, name: str = None):
+        """
+        :param store_path: directory of the cache files
+        :param name: when several caches share the store path, the name of this one.  Each named cache
+            has its own metadata, so it is refreshed (and versioned) on its own schedule.
+        """
+        self.meta_path = store_path / self.get_meta_filename(name)
         if not self.meta_path.exists():
             self.should_refresh = True
+            self.meta_created = True
             store_path.mkdir(parents=True, exist_ok=True)
             self.cache_meta_conn = self.get_db_conn(self.meta_path)
             self.init_meta()
@@ -28,7 +36,20 @@ class CacheBase:
             cur.close()
     
     def __del__(self):
-        self.cache_meta_conn.close()
+        self.close()
+
+    def close(self):
+        """
+        Close the cache's connections.  This has to be done in the thread that opened them, so a cache
+        used in a worker thread should be closed there rather than left to the garbage collector.
+        """
+        if getattr(self, 'cache_meta_conn', None) is not None:
+            self.cache_meta_conn.close()
+            self.cache_meta_conn = None
+
+    @classmethod
+    def get_meta_filename(cls, name: str = None) -> str:
+        return cls.cache_meta_filename if name is None else f"{name}-{cls.cache_meta_filename}"
 
     def init_meta(self):
         self.cache_meta_conn.execute("drop table if exists cache_meta")
@@ -52,4 +73,9 @@ class CacheBase:
     
     @staticmethod
     def get_db_conn(db_path: Path) -> sqlite3.Connection:
-        return sqlite3.connect(db_path, detect_types=sqlite3.PARSE_DECLTYPES)
+        conn = sqlite3.connect(db_path, detect_types=sqlite3.PARSE_DECLTYPES)
+        # the cache can always be rebuilt from the source, so trade durability on power loss for
+        # far fewer fsyncs; WAL also lets readers proceed while a refresh is being written
+        conn.execute("pragma journal_mode=wal")
+        conn.execute("pragma synchronous=normal")
+        return conn
@@ -0,0 +1,140 @@
+from pathlib import Path
+import hashlib
+import json
+import logging
+import marshal
+import os
+import sys
+
+from user_sync.error import AssertionException
+
+
+class DirectoryCache:
+    """
+    Persists the users parsed from file-based directory sources, keyed by a fingerprint of the
+    input files and the settings that were used to parse them.  An unchanged input can then
+    be reused without parsing it again.
+
+    Files are fingerprinted by size, modification time and SHA-256 of their content.  The hash
+    is only recomputed when a file's size is unchanged but its modification time differs.
+    """
+    # increment this every time the stored data model changes
+    VERSION: int = 1
+
+    hash_chunk_size: int = 1024 * 1024
+
+    def __init__(self, store_path: Path, name: str, logger=None) -> None:
+        self.store_path = store_path
+        self.meta_path = store_path / f"{name}-meta.json"
+        self.data_path = store_path / f"{name}-users.bin"
+        self.logger = logger or logging.getLogger('directory_cache')
+
+    @staticmethod
+    def describe_files(file_paths: list[str]) -> list[dict]:
+        """
+        Capture the size and modification time of each input file
+        """
+        files = []
+        for file_path in file_paths:
+            try:
+                stat = os.stat(file_path)
+            except OSError as e:
+                # reported the same way as when the file is read without a cache
+                raise AssertionException("Can't open file '%s': %s" % (file_path, e))
+            files.append({
+                'path': os.path.abspath(file_path),
+                'size': stat.st_size,
+                'mtime_ns': stat.st_mtime_ns,
+            })
+        return files
+
+    def load(self, files: list[dict], settings: dict):
+        """
+        Return the users stored for the given input files and settings, or None if there are none
+        or the input has changed
+        """
+        meta = self._read_meta()
+        if meta is None or meta['settings'] != self._settings_key(settings):
+            return None
+        stored_files = meta['files']
+        if [f['path'] for f in stored_files] != [f['path'] for f in files]:
+            return None
+        touched = False
+        for stored, current in zip(stored_files, files):
+            if stored['size'] != current['size']:
+                return None
+            if stored['mtime_ns'] != current['mtime_ns']:
+                # touched, copied or rewritten - only the content tells whether it really changed
+                if self.hash_file(current['path']) != stored['sha256']:
+                    return None
+                stored['mtime_ns'] = current['mtime_ns']
+                touched = True
+        try:
+            with open(self.data_path, 'rb') as f:
+                users = marshal.load(f)
+        except (OSError, EOFError, ValueError, TypeError) as e:
+            self.logger.warning("Ignoring unreadable directory cache '%s': %s", self.data_path, e)
+            return None
+        if touched:
+            self._write(self.meta_path, json.dumps(meta).encode('utf8'))
+        return users
+
+    def store(self, files: list[dict], settings: dict, users: dict):
+        """
+        Store the users parsed from the given input files.  Nothing is stored if any file changed
+        while it was being read, since the result may not match either version.
+        """
+        stored_files = []
+        for current in files:
+            try:
+                sha256 = self.hash_file(current['path'])
+                stat = os.stat(current['path'])
+            except OSError as e:
+                raise AssertionException("Can't open file '%s': %s" % (current['path'], e))
+            if stat.st_size != current['size'] or stat.st_mtime_ns != current['mtime_ns']:
+                self.logger.warning("File '%s' changed while it was read; not caching", current['path'])
+                return
+            stored_files.append(dict(current, sha256=sha256))
+        meta = {
+            'version': self.VERSION,
+            'python': list(sys.version_info[:2]),
+            'settings': self._settings_key(settings),
+            'files': stored_files,
+        }
+        self.store_path.mkdir(parents=True, exist_ok=True)
+        # data goes first, so the metadata never describes data that isn't there
+        self._write(self.data_path, marshal.dumps(users))
+        self._write(self.meta_path, json.dumps(meta).encode('utf8'))
+
+    def _read_meta(self):
+        try:
+            with open(self.meta_path, 'rb') as f:
+                meta = json.loads(f.read().decode('utf8'))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            self.logger.warning("Ignoring unreadable directory cache '%s': %s", self.meta_path, e)
+            return None
+        # marshal data is only readable by the Python version that wrote it
+        if meta.get('version') != self.VERSION or meta.get('python') != list(sys.version_info[:2]):
+            return None
+        return meta
+
+    @staticmethod
+    def _settings_key(settings: dict) -> str:
+        return json.dumps(settings, sort_keys=True, default=sorted)
+
+    @classmethod
+    def hash_file(cls, file_path: str) -> str:
+        sha256 = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(cls.hash_chunk_size), b''):
+                sha256.update(chunk)
+        return sha256.hexdigest()
+
+    @staticmethod
+    def _write(path: Path, data: bytes):
+        tmp_path = path.with_name(path.name + '.tmp')
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
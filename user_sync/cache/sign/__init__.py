@@ -1 +1 @@
-from .cache import SignCache
+from .cache import SignCache, SignUserIndex, SignUserRecord
@@ -2,132 +2,291 @@ from ..base import CacheBase
 from .schema import sign_groups as sign_groups_schema
 from .schema import sign_users as sign_users_schema
 from .schema import sign_user_groups as sign_user_groups_schema
-from sign_client.model import DetailedUserInfo, GroupInfo, UserGroupInfo, JSONEncoder
+from .schema import sign_indexes
+from sign_client.model import DetailedUserInfo, GroupInfo, UserGroupInfo, UserInfo, SettingsInfo, dumps, loads
+from user_sync.error import AssertionException
+from user_sync.lockfile import ProcessLock
 from pathlib import Path
-import json
+from typing import Iterable, Optional
+from operator import attrgetter
+import dataclasses
 import sqlite3
-from collections import defaultdict
+from collections import defaultdict, namedtuple
+
+USER_COLUMNS = [f.name for f in dataclasses.fields(DetailedUserInfo)]
+# the subset of user fields that the user listing returns
+USER_LISTING_COLUMNS = [f.name for f in dataclasses.fields(UserInfo)]
+GROUP_COLUMNS = [f.name for f in dataclasses.fields(GroupInfo)]
+USER_GROUP_COLUMNS = [f.name for f in dataclasses.fields(UserGroupInfo)]
+
+user_values = attrgetter(*USER_COLUMNS)
+group_values = attrgetter(*GROUP_COLUMNS)
+user_group_values = attrgetter(*USER_GROUP_COLUMNS)
+
+
+
+# read-only view of the user fields the sync engine matches on
+SignUserRecord = namedtuple('SignUserRecord', ['id', 'email', 'status', 'isAccountAdmin'])
+
+
+
+class SignUserIndex:
+    """
+    The Sign users of an org, indexed in a single pass over their records: by id, by status and email, and
+    (for users that aren't inactive) by email.  primary_groups holds each user's primary group by user id.
+    """
+
+    def __init__(self, records: Iterable[SignUserRecord], primary_groups: dict[str, UserGroupInfo]):
+        self.by_id: dict[str, SignUserRecord] = {}
+        self.by_email: dict[str, SignUserRecord] = {}
+        self.by_status: dict[str, dict[str, SignUserRecord]] = defaultdict(dict)
+        for record in records:
+            self.by_id[record.id] = record
+            self.by_status[record.status][record.email] = record
+            if record.status != 'INACTIVE':
+                self.by_email[record.email] = record
+        self.primary_groups = primary_groups
+
+    @property
+    def inactive_by_email(self) -> dict[str, SignUserRecord]:
+        return self.by_status.get('INACTIVE', {})
+
+
+select_users = f"select {', '.join(USER_COLUMNS)} from users"
+select_user_records = f"select {', '.join(SignUserRecord._fields)} from users"
+select_user_listing = f"select {', '.join(USER_LISTING_COLUMNS)} from users"
+select_groups = f"select {', '.join(GROUP_COLUMNS)} from groups"
+select_user_groups = f"select user_id, {', '.join(USER_GROUP_COLUMNS)} from user_groups"
 
 
 class SignCache(CacheBase):
     # increment this every time there are changes to table schema or data model
-    VERSION: int = 2
+    VERSION: int = 3
 
     def __init__(self, store_path: Path, org_name: str) -> None:
-        sqlite3.register_adapter(DetailedUserInfo, adapt_user)
-        sqlite3.register_converter("detailed_user_info", convert_user)
-        sqlite3.register_adapter(GroupInfo, adapt_group)
-        sqlite3.register_converter("group_info", convert_group)
-        sqlite3.register_adapter(UserGroupInfo, adapt_user_group)
-        sqlite3.register_converter("user_group_info", convert_user_group)
-        self.init(store_path)
+        """
+        Open the cache of an org.  Each org has its own data, metadata and lock, so orgs are refreshed on
+        their own schedules.  While the cache is open, it can't be opened again, by this process or another,
+        until it is closed.
+        """
+        sqlite3.register_converter("boolean", convert_boolean)
+        sqlite3.register_adapter(SettingsInfo, adapt_settings)
+        sqlite3.register_converter("settings_info", convert_settings)
+        store_path.mkdir(parents=True, exist_ok=True)
+        lock = ProcessLock(str(store_path / f"{org_name}.lock"))
+        if not lock.set_lock():
+            raise AssertionException(f"The Sign cache for org '{org_name}' is in use (locked by '{lock.path}')")
+        self.lock = lock
+        self.init(store_path, org_name)
         db_path = store_path / f"{org_name}.db"
-        if not db_path.exists():
+        db_existed = db_path.exists()
+        if not db_existed:
             self.should_refresh = True
             self.db_conn = self.get_db_conn(db_path)
-            for s in [sign_users_schema, sign_groups_schema, sign_user_groups_schema]:
-                self.db_conn.execute(s)
-            self.db_conn.commit()
+            self.create_tables()
         else:
             self.db_conn = self.get_db_conn(db_path)
-        if self.get_version() != self.VERSION:
+        # data kept before the org had its own metadata is of unknown version
+        if self.get_version() != self.VERSION or (db_existed and self.meta_created):
             self.rebuild_tables()
             self.init_meta()
             self.should_refresh = True
         super().__init__()
 
+    def close(self):
+        try:
+            if getattr(self, 'db_conn', None) is not None:
+                db_conn, self.db_conn = self.db_conn, None
+                db_conn.close()
+            super().close()
+        finally:
+            # a lock left behind would keep every later run out of the org
+            if getattr(self, 'lock', None) is not None:
+                self.lock.unlock()
+                self.lock = None
+
+    def create_tables(self):
+        with self.db_conn:
+            for s in [sign_users_schema, sign_groups_schema, sign_user_groups_schema] + sign_indexes:
+                self.db_conn.execute(s)
+
     def rebuild_tables(self):
-        self.db_conn.execute("drop table users")
-        self.db_conn.execute("drop table groups")
-        self.db_conn.execute("drop table user_groups")
-        for s in [sign_users_schema, sign_groups_schema, sign_user_groups_schema]:
-            self.db_conn.execute(s)
-        self.db_conn.commit()
+        with self.db_conn:
+            self.db_conn.execute("drop table if exists users")
+            self.db_conn.execute("drop table if exists groups")
+            self.db_conn.execute("drop table if exists user_groups")
+        self.create_tables()
 
     def clear_all(self):
-        self.db_conn.execute("delete from users")
-        self.db_conn.execute("delete from groups")
-        self.db_conn.execute("delete from user_groups")
-        self.db_conn.commit()
+        with self.db_conn:
+            self.db_conn.execute("delete from users")
+            self.db_conn.execute("delete from groups")
+            self.db_conn.execute("delete from user_groups")
 
     def cache_user(self, user: DetailedUserInfo):
-        self.db_conn.execute("insert into users(id, user) values (?,?)", (user.id, user))
-        self.db_conn.commit()
+        self.cache_users([user])
+
+    def cache_users(self, users: Iterable[DetailedUserInfo]):
+        """
+        Insert users in a single transaction.  users can be a generator; it is consumed as it is written.
+        """
+        with self.db_conn:
+            self.db_conn.executemany(insert_user, map(user_values, users))
 
     def update_user(self, user: DetailedUserInfo):
-        self.db_conn.execute("update users set user = ? where id = ?", (user, user.id))
-        self.db_conn.commit()
+        self.update_users([user])
+
+    def update_users(self, users: Iterable[DetailedUserInfo]):
+        with self.db_conn:
+            self.db_conn.executemany(update_user, ((*user_values(u), u.id) for u in users))
 
     def get_users(self) -> list[DetailedUserInfo]:
         cur = self.db_conn.cursor()
-        cur.execute("select user from users")
-        return [r[0] for r in cur.fetchall()]
+        cur.execute(select_users)
+        return [DetailedUserInfo(*r) for r in cur.fetchall()]
+
+    def get_user_listing(self) -> dict[str, UserInfo]:
+        """
+        Get the listing-level fields of every cached user, to compare with a fresh listing
+        :return: dict of UserInfo by user id
+        """
+        cur = self.db_conn.cursor()
+        cur.execute(select_user_listing)
+        return {u.id: u for u in (UserInfo(*r) for r in cur.fetchall())}
+
+    def delete_users(self, user_ids: Iterable[str]):
+        """
+        Delete users, and their group assignments, in a single transaction
+        """
+        user_ids = [(user_id, ) for user_id in user_ids]
+        with self.db_conn:
+            self.db_conn.executemany("delete from users where id = ?", user_ids)
+            self.db_conn.executemany("delete from user_groups where user_id = ?", user_ids)
+
+    def replace_groups(self, groups: Iterable[GroupInfo]):
+        with self.db_conn:
+            self.db_conn.execute("delete from groups")
+            self.db_conn.executemany(insert_group, map(group_values, groups))
+
+    def get_user_records(self) -> list[SignUserRecord]:
+        """
+        Like get_users, but only reads the fields in SignUserRecord.  Use get_user to get everything else
+        for the few users that need it.
+        """
+        cur = self.db_conn.cursor()
+        cur.execute(select_user_records)
+        return list(map(SignUserRecord._make, cur.fetchall()))
 
-    def get_user(self, user_id) -> DetailedUserInfo:
+    def get_user(self, user_id) -> Optional[DetailedUserInfo]:
+        """
+        :return: the cached user, or None if it isn't cached
+        """
         cur = self.db_conn.cursor()
-        cur.execute("select user from users where id = ?", (user_id, ))
-        return cur.fetchone()[0]
+        cur.execute(f"{select_users} where id = ?", (user_id, ))
+        row = cur.fetchone()
+        return DetailedUserInfo(*row) if row is not None else None
 
     def update_user_refresh_status(self, user_id: str, needs_refresh: bool):
-        self.db_conn.execute("update users set needs_refresh = ? where id = ?", (int(needs_refresh), user_id))
-        self.db_conn.commit()
+        self.update_users_refresh_status([user_id], needs_refresh)
+
+    def update_users_refresh_status(self, user_ids: Iterable[str], needs_refresh: bool):
+        with self.db_conn:
+            self.db_conn.executemany("update users set needs_refresh = ? where id = ?",
+                                     ((int(needs_refresh), user_id) for user_id in user_ids))
 
     def get_users_to_refresh(self) -> list[DetailedUserInfo]:
         cur = self.db_conn.cursor()
-        cur.execute("select user from users where needs_refresh=1")
-        return [r[0] for r in cur.fetchall()]
+        cur.execute(f"{select_users} where needs_refresh=1")
+        return [DetailedUserInfo(*r) for r in cur.fetchall()]
 
     def cache_group(self, group: GroupInfo):
-        self.db_conn.execute("insert into groups(id, group_info) values (?,?)", (group.groupId, group))
-        self.db_conn.commit()
+        self.cache_groups([group])
+
+    def cache_groups(self, groups: Iterable[GroupInfo]):
+        with self.db_conn:
+            self.db_conn.executemany(insert_group, map(group_values, groups))
 
     def delete_group(self, group: GroupInfo):
-        self.db_conn.execute("delete from groups where id = ?", (group.groupId, ))
-        self.db_conn.commit()
+        with self.db_conn:
+            self.db_conn.execute("delete from groups where groupId = ?", (group.groupId, ))
 
     def get_groups(self) -> list[GroupInfo]:
         cur = self.db_conn.cursor()
-        cur.execute("select group_info from groups")
-        return [r[0] for r in cur.fetchall()]
+        cur.execute(select_groups)
+        return [GroupInfo(*r) for r in cur.fetchall()]
+
+    def get_group_by_name(self, name: str) -> GroupInfo:
+        """
+        Look up a group by name, ignoring case
+        """
+        cur = self.db_conn.cursor()
+        cur.execute(f"{select_groups} where groupName = ? collate nocase", (name, ))
+        row = cur.fetchone()
+        return GroupInfo(*row) if row is not None else None
 
     def cache_user_group(self, user_id: str, user_group: UserGroupInfo):
-        self.db_conn.execute("insert into user_groups(user_id, user_group) values (?,?)", (user_id, user_group))
-        self.db_conn.commit()
+        self.cache_user_groups([(user_id, user_group)])
+
+    def cache_user_groups(self, user_groups: Iterable[tuple[str, UserGroupInfo]]):
+        """
+        Insert (user id, user group) pairs in a single transaction
+        """
+        with self.db_conn:
+            self.db_conn.executemany(insert_user_group, ((user_id, *user_group_values(g)) for user_id, g in user_groups))
 
     def get_user_groups(self) -> list[tuple[str, list[UserGroupInfo]]]:
         groups_by_user = defaultdict(list)
         cur = self.db_conn.cursor()
-        cur.execute("select user_id, user_group from user_groups")
-        for user_id, user_group in cur.fetchall():
-            groups_by_user[user_id].append(user_group)
+        cur.execute(select_user_groups)
+        for user_id, *user_group in cur.fetchall():
+            groups_by_user[user_id].append(UserGroupInfo(*user_group))
         return list(groups_by_user.items())
 
-    def update_user_groups(self, user_id: str, user_groups: list[UserGroupInfo]):
-        self.db_conn.execute("delete from user_groups where user_id = ?", (user_id, ))
-        self.db_conn.commit()
-        for user_group in user_groups:
-            self.cache_user_group(user_id, user_group)
+    def get_user_ids_without_primary_group(self) -> list[str]:
+        """
+        Get the ids of users whose groups aren't cached, e.g. because getting or assigning them failed
+        """
+        cur = self.db_conn.cursor()
+        cur.execute("select id from users where id not in (select user_id from user_groups where isPrimaryGroup = 1)")
+        return [user_id for user_id, in cur.fetchall()]
 
+    def get_primary_user_groups(self) -> dict[str, UserGroupInfo]:
+        """
+        Get the primary group of each user, by user id
+        """
+        cur = self.db_conn.cursor()
+        cur.execute(f"{select_user_groups} where isPrimaryGroup = 1")
+        return {user_id: UserGroupInfo(*user_group) for user_id, *user_group in cur.fetchall()}
 
-def adapt_user(user: DetailedUserInfo) -> str:
-    return json.dumps(user.__dict__, cls=JSONEncoder).encode('ascii')
+    def update_user_groups(self, user_id: str, user_groups: list[UserGroupInfo]):
+        self.update_user_groups_many([(user_id, user_groups)])
 
+    def update_user_groups_many(self, user_groups: Iterable[tuple[str, list[UserGroupInfo]]]):
+        """
+        Replace the groups of each user in a single transaction
+        """
+        user_groups = list(user_groups)
+        with self.db_conn:
+            self.db_conn.executemany("delete from user_groups where user_id = ?", ((user_id, ) for user_id, _ in user_groups))
+            self.db_conn.executemany(insert_user_group, ((user_id, *user_group_values(g))
+                                                         for user_id, groups in user_groups for g in groups))
 
-def convert_user(s: str) -> DetailedUserInfo:
-    return DetailedUserInfo.from_dict(json.loads(s))
 
 
-def adapt_group(group: GroupInfo) -> str:
-    return json.dumps(group.__dict__, cls=JSONEncoder).encode('ascii')
+insert_user = f"insert into users({', '.join(USER_COLUMNS)}) values ({', '.join('?' * len(USER_COLUMNS))})"
+update_user = f"update users set {', '.join(c + ' = ?' for c in USER_COLUMNS)} where id = ?"
+insert_group = f"insert into groups({', '.join(GROUP_COLUMNS)}) values ({', '.join('?' * len(GROUP_COLUMNS))})"
+insert_user_group = (f"insert into user_groups(user_id, {', '.join(USER_GROUP_COLUMNS)}) "
+                     f"values ({', '.join('?' * (len(USER_GROUP_COLUMNS) + 1))})")
 
 
-def convert_group(s: str) -> GroupInfo:
-    return GroupInfo.from_dict(json.loads(s))
+def convert_boolean(s: bytes) -> bool:
+    return s == b'1'
 
 
-def adapt_user_group(user_group: UserGroupInfo) -> str:
-    return json.dumps(user_group.__dict__, cls=JSONEncoder).encode('ascii')
+def adapt_settings(settings: SettingsInfo) -> str:
+    return dumps(settings)
 
 
-def convert_user_group(s: str) -> UserGroupInfo:
-    return UserGroupInfo.from_dict(json.loads(s))
+def convert_settings(s: bytes) -> SettingsInfo:
+    return SettingsInfo.from_dict(loads(s))
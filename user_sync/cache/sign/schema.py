@@ -1,21 +1,49 @@
+# column names match the fields of the sign_client model classes, in the same order
+
 sign_users = """
 create table if not exists users (
-    id text not null unique,
     needs_refresh int default 0,
-    user detailed_user_info
+    accountType text,
+    email text,
+    id text not null primary key,
+    isAccountAdmin boolean,
+    status text,
+    accountId text,
+    company text,
+    createdDate text,
+    firstName text,
+    initials text,
+    lastName text,
+    locale text,
+    phone text,
+    primaryGroupId text,
+    title text
 );
 """
 
 sign_groups = """
 create table if not exists groups (
-    id text not null unique,
-    group_info group_info
+    groupId text not null primary key,
+    groupName text,
+    createdDate text,
+    isDefaultGroup boolean
 );
 """
 
 sign_user_groups = """
 create table if not exists user_groups (
     user_id text not null,
-    user_group user_group_info
+    id text,
+    isGroupAdmin boolean,
+    isPrimaryGroup boolean,
+    status text,
+    createdDate text,
+    name text,
+    settings settings_info
 );
 """
+
+sign_indexes = [
+    "create index if not exists groups_name on groups (groupName collate nocase)",
+    "create index if not exists user_groups_user_id on user_groups (user_id)",
+]
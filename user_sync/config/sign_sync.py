@@ -28,7 +28,10 @@ def config_schema() -> Schema:
             'sign_only_user_action': Or('exclude', 'reset', 'deactivate', 'remove_roles', 'remove_groups'),
         },
         Optional('connection'): {
+            Optional('org_concurrency'): int,
             Optional('request_concurrency'): int,
+            Optional('max_request_concurrency'): int,
+            Optional('requests_per_second'): Or(int, float),
             Optional('batch_size'): int,
             Optional('retry_count'): int,
             Optional('timeout'): int
@@ -51,6 +54,7 @@ def config_schema() -> Schema:
         },
         Optional('invocation_defaults'): {
             Optional('test_mode'):  bool,
+            Optional('full_refresh'): bool,
             Optional('users'): Or('mapped', 'all', ['group', And(str, len)])
             #'directory_group_filter': Or('mapped', 'all', None)
         }
@@ -73,7 +77,9 @@ class SignConfigLoader(ConfigLoader):
     # like ROOT_CONFIG_PATH_KEYS, but for non-root configuration files
     SUB_CONFIG_PATH_KEYS = {
         '/integration/priv_key_path': (True, False, None),
-        '/file_path': (True, False, None),
+        # may be a glob pattern, so existence is checked when the files are read
+        '/file_path': (False, False, None),
+        '/cache_path': (False, False, None),
     }
 
     config_defaults = {
@@ -83,7 +89,8 @@ class SignConfigLoader(ConfigLoader):
 
     invocation_defaults = {
         'users': ['mapped'],
-        'test_mode': False
+        'test_mode': False,
+        'full_refresh': False,
     }
 
     default_cache_path = "cache/sign"
@@ -106,6 +113,8 @@ class SignConfigLoader(ConfigLoader):
         invocation_config = self.main_config.get_dict_config('invocation_defaults', True)
         options = resolve_invocation_options(options, invocation_config, self.invocation_defaults, self.args)
         options['directory_connector_type'] = self.main_config.get_dict('identity_source').get('type')
+        if options.get('plan_out') and options.get('apply_plan'):
+            raise AssertionException('A plan cannot be saved ("--plan-out") and applied ("--apply-plan") in one run')
         # --users
         users_spec = options.get('users')
         if users_spec:
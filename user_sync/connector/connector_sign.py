@@ -23,28 +23,32 @@ from sign_client.model import DetailedGroupInfo, GroupInfo, DetailedUserInfo, Us
 from sign_client.error import AssertionException as ClientException
 
 from ..config.common import DictConfig, OptionsBuilder
-from ..cache.sign import SignCache
+from ..cache.sign import SignCache, SignUserIndex, SignUserRecord
 from ..error import AssertionException
-from sign_client.client import SignClient
+from sign_client.client import InsertedUser, SignClient
 from pathlib import Path
 
 
 class SignConnector(object):
 
-    def __init__(self, caller_options, org_name, test_mode, connection, cache_config):
+    def __init__(self, caller_options, org_name, test_mode, connection, cache_config, full_refresh=False):
         """
         :type caller_options: dict
+        :param full_refresh: rebuild the cache from scratch instead of refreshing only what changed
         """
         self.console_org = org_name
         self.name = 'sign_{}'.format(self.console_org)
         self.logger = logging.getLogger(self.name)
         self.test_mode = test_mode
+        self.full_refresh = full_refresh
         caller_config = DictConfig('sign_configuration', caller_options)
         sign_builder = OptionsBuilder(caller_config)
         sign_builder.require_string_value('host')
         sign_builder.require_string_value('admin_email')
         self.create_users = sign_builder.require_value('create_users', bool)
         self.deactivate_users = sign_builder.require_value('deactivate_users', bool)
+        # per-org overrides of the main config's connection settings, e.g. a lower requests_per_second
+        sign_builder.set_dict_value('connection', None)
         store_path = Path(cache_config['path'])
 
         options = sign_builder.get_options()
@@ -56,15 +60,24 @@ class SignConnector(object):
 
         self.cache = SignCache(Path(store_path), org_name)
 
+        if options['connection']:
+            connection = dict(connection, **options['connection'])
         self.sign_client = SignClient(connection,
                                       host=options['host'],
                                       integration_key=integration_key,
                                       admin_email=options['admin_email'],
                                       logger=self.logger)
 
-    def sign_groups(self):
-        if self.cache.should_refresh:
-            self.refresh_all()
+    def close(self):
+        self.sign_client.close()
+        self.cache.close()
+
+    def sign_groups(self, refresh=True):
+        """
+        :param refresh: refresh the cache first if it is due; otherwise the cached groups are returned as they are
+        """
+        if refresh and (self.cache.should_refresh or self.full_refresh):
+            self.refresh()
         return {g.groupName.lower(): g for g in self.cache.get_groups()}
 
     def create_group(self, new_group: DetailedGroupInfo):
@@ -75,35 +88,120 @@ class SignConnector(object):
                 groupName=new_group.name,
             ))
 
+    def create_groups(self, new_groups: list[DetailedGroupInfo]) -> list[GroupInfo]:
+        """
+        Create groups concurrently and cache the ones that were created.  If any couldn't be created, that is
+        raised once the others are cached.
+        :return: the groups that were created
+        """
+        if self.test_mode or not new_groups:
+            return []
+        created, errors = self.sign_client.create_groups(new_groups)
+        self.cache.cache_groups(created)
+        if errors:
+            raise AssertionException('; '.join(errors.values()))
+        return created
+
     def get_users(self):
-        if self.cache.should_refresh:
-            self.refresh_all()
+        self.refresh_users_if_needed()
+        return {user.id: user for user in self.cache.get_users()}
+
+    def get_user_records(self) -> list[SignUserRecord]:
+        """
+        Like get_users, but returns lightweight read-only records
+        """
+        self.refresh_users_if_needed()
+        return self.cache.get_user_records()
+
+    def get_user_index(self) -> SignUserIndex:
+        """
+        Index the users of the org, with their primary groups
+        """
+        self.refresh_users_if_needed()
+        return SignUserIndex(self.cache.get_user_records(), self.cache.get_primary_user_groups())
+
+    def get_user(self, user_id) -> DetailedUserInfo:
+        return self.cache.get_user(user_id)
+
+    def refresh_users_if_needed(self):
+        if self.cache.should_refresh or self.full_refresh:
+            self.refresh()
 
         # always refresh individual users that may need it
         users_to_refresh = self.cache.get_users_to_refresh()
         if users_to_refresh:
-            for user in self.sign_client.get_users([u.id for u in users_to_refresh]).values():
-                self.cache.update_user(user)
-                self.cache.update_user_refresh_status(user.id, needs_refresh=False)
-
-        return {user.id: user for user in self.cache.get_users()}
+            refreshed = list(self.sign_client.iter_users([u.id for u in users_to_refresh]))
+            self.cache.update_users(refreshed)
+            self.cache.update_users_refresh_status([u.id for u in refreshed], needs_refresh=False)
+        # and groups that are missing, since a delta refresh only picks up users whose listing changed
+        users_without_groups = self.cache.get_user_ids_without_primary_group()
+        if users_without_groups:
+            self.logger.info(f'Getting groups of {len(users_without_groups)} Sign users missing from the cache')
+            self.refresh_user_groups(users_without_groups)
 
     def get_user_groups(self):
-        if self.cache.should_refresh:
-            self.refresh_all()
+        if self.cache.should_refresh or self.full_refresh:
+            self.refresh()
         return dict(self.cache.get_user_groups())
 
-    def update_users(self, update_data: list[DetailedUserInfo]):
-        if not self.test_mode:
-            self.sign_client.update_users(update_data)
-            for user in update_data:
-                self.cache.update_user(user)
+    def update_users(self, update_data: list[DetailedUserInfo]) -> dict[str, str]:
+        """
+        Update users concurrently, and cache the ones that were updated.  Like update_user_states, users that
+        couldn't be updated are flagged for refresh.
+        :return: error message by user id, for the users that couldn't be updated
+        """
+        if self.test_mode or not update_data:
+            return {}
+        errors = self.sign_client.update_users(update_data)
+        if errors:
+            self.cache.update_users_refresh_status(list(errors), needs_refresh=True)
+        self.cache.update_users([u for u in update_data if u.id not in errors])
+        return errors
 
-    def update_user_groups(self, update_data: list[tuple[str, UserGroupsInfo]]):
-        if not self.test_mode:
-            self.sign_client.update_user_groups(update_data)
-            for user_id, user_groups in update_data:
-                self.cache.update_user_groups(user_id, user_groups.groupInfoList)
+    def update_user_fields(self, user_changes: list[tuple[str, dict]], current=False) -> dict[str, str]:
+        """
+        Change some fields of users, leaving their other fields as they are
+        :param user_changes: list of (user id, new value by field name) pairs
+        :param current: get the users from Sign instead of the cache, for changes planned by an earlier run
+        :return: error message by user id, for the users that couldn't be updated
+        """
+        if self.test_mode or not user_changes:
+            return {}
+        changes = dict(user_changes)
+        users = self.get_users_for_update(list(changes), current)
+        for user in users:
+            for field, value in changes[user.id].items():
+                setattr(user, field, value)
+        return self.update_users(users)
+
+    def get_users_for_update(self, user_ids: list[str], current=False) -> list[DetailedUserInfo]:
+        """
+        :param current: get the users from Sign instead of the cache
+        :return: the users, leaving out any that aren't cached
+        """
+        if current:
+            return list(self.sign_client.iter_users(user_ids))
+        users = []
+        for user_id in user_ids:
+            user = self.cache.get_user(user_id)
+            if user is None:
+                self.logger.warning(f"Sign user '{user_id}' is not in the cache; its cached record is not updated")
+                continue
+            users.append(user)
+        return users
+
+    def update_user_groups(self, update_data: list[tuple[str, UserGroupsInfo]]) -> dict[str, str]:
+        """
+        Assign groups to users concurrently, and cache the assignments that were made
+        :param update_data: list of (user id, groups to assign) pairs
+        :return: error message by user id, for the users whose groups couldn't be assigned
+        """
+        if self.test_mode or not update_data:
+            return {}
+        errors = self.sign_client.update_user_groups(update_data)
+        self.cache.update_user_groups_many((user_id, user_groups.groupInfoList) for user_id, user_groups in update_data
+                                           if user_id not in errors)
+        return errors
 
     def update_user_group_single(self, user_id: str, update_data: UserGroupsInfo):
         if not self.test_mode:
@@ -111,7 +209,7 @@ class SignConnector(object):
             self.cache.update_user_groups(user_id, update_data.groupInfoList)
 
     def get_group(self, assignment_group):
-        return [g.groupId for g in self.sign_client.groups if g.groupName.lower() == assignment_group.lower()][0]
+        return self.cache.get_group_by_name(assignment_group).groupId
 
     def insert_user(self, new_user: DetailedUserInfo)-> str:
         if not self.test_mode:
@@ -120,6 +218,26 @@ class SignConnector(object):
             self.cache.cache_user(new_user)
             return user_id
 
+    def insert_users(self, new_users: list[tuple[DetailedUserInfo, UserGroupsInfo]]) -> list[InsertedUser]:
+        """
+        Insert users and assign their groups, caching whatever was done
+        :param new_users: list of (user, groups to assign) pairs
+        :return: InsertedUser for each of new_users
+        """
+        if self.test_mode:
+            return [InsertedUser(user, None, None) for user, _ in new_users]
+        if not new_users:
+            return []
+        results = self.sign_client.insert_users(new_users)
+        inserted = [r for r in results if r.user_id is not None]
+        for result in inserted:
+            result.user.id = result.user_id
+        self.cache.cache_users([r.user for r in inserted])
+        groups_by_email = {user.email: groups for user, groups in new_users}
+        self.cache.cache_user_groups((r.user_id, g) for r in inserted if r.error is None
+                                     for g in groups_by_email[r.user.email].groupInfoList)
+        return results
+
     def update_user_state(self, user_id, state: UserStateInfo):
         if not self.test_mode:
             try:
@@ -131,27 +249,82 @@ class SignConnector(object):
                 self.cache.update_user_refresh_status(user_id, needs_refresh=True)
                 raise
             user = self.cache.get_user(user_id)
-            user.status = state.state
-            self.cache.update_user(user)
-    
+            if user is not None:
+                user.status = state.state
+                self.cache.update_user(user)
+
+    def update_user_states(self, user_states: list[tuple[str, UserStateInfo]], current=False) -> dict[str, str]:
+        """
+        Change the state of many users at once.  Like update_user_state, users whose state couldn't be changed
+        are flagged for refresh.
+        :param user_states: list of (user id, new state) pairs
+        :param current: cache the users as they are in Sign afterwards, for changes planned by an earlier run
+        :return: error message by user id, for the users whose state couldn't be changed
+        """
+        if self.test_mode or not user_states:
+            return {}
+        errors = self.sign_client.update_user_states(user_states)
+        if errors:
+            self.cache.update_users_refresh_status(list(errors), needs_refresh=True)
+        states = {user_id: state for user_id, state in user_states if user_id not in errors}
+        users = self.get_users_for_update(list(states), current)
+        if not current:
+            for user in users:
+                user.status = states[user.id].state
+        self.cache.update_users(users)
+        return errors
+
+    def refresh(self):
+        if self.full_refresh:
+            self.logger.info('Rebuilding Sign cache')
+            self.refresh_all()
+            self.full_refresh = False
+        else:
+            self.refresh_delta()
+        self.cache.should_refresh = False
+        self.cache.update_next_refresh()
+
     def refresh_all(self):
         self.cache.clear_all()
         self.refresh_users()
         self.refresh_groups()
         self.refresh_user_groups()
-        self.cache.should_refresh = False
-        self.cache.update_next_refresh()
-    
+
+    def refresh_delta(self):
+        """
+        Bring the cache up to date by listing all users, which is cheap, and only getting details and
+        groups for users that are new or whose listing changed.  Users that are no longer listed are removed.
+        Changes that don't show in the listing (such as status or group membership changed outside of
+        User Sync) are only picked up by a full refresh.
+        """
+        listing = {u.id: u for u in self.sign_client.list_users()}
+        cached = self.cache.get_user_listing()
+        removed = cached.keys() - listing.keys()
+        changed = [user_id for user_id, user in listing.items() if cached.get(user_id) != user]
+        self.logger.info(f'Refreshing Sign cache: {len(changed)} new or changed users, {len(removed)} removed, '
+                         f'{len(listing)} total')
+        self.cache.delete_users(list(removed) + changed)
+        self.refresh_groups()
+        if changed:
+            fetched = []
+
+            def fetch():
+                for user in self.sign_client.iter_users(changed):
+                    fetched.append(user.id)
+                    yield user
+            self.cache.cache_users(fetch())
+            self.refresh_user_groups(fetched)
+
     def refresh_users(self):
-        for user in self.sign_client.get_users().values():
-            self.cache.cache_user(user)
+        # written in one transaction, as the users arrive
+        self.cache.cache_users(self.sign_client.iter_users())
     
     def refresh_groups(self):
-        for group in self.sign_client.sign_groups():
-            self.cache.cache_group(group)
-
-    def refresh_user_groups(self):
-        user_ids = [u.id for u in self.cache.get_users()]
-        for user_id, user_groups in self.sign_client.get_user_groups(user_ids).items():
-            for user_group in user_groups.groupInfoList:
-                self.cache.cache_user_group(user_id, user_group)
+        self.cache.replace_groups(self.sign_client.sign_groups())
+
+    def refresh_user_groups(self, user_ids=None):
+        if user_ids is None:
+            user_ids = [u.id for u in self.cache.get_users()]
+        user_groups = self.sign_client.get_user_groups(user_ids)
+        self.cache.cache_user_groups((user_id, user_group) for user_id, groups in user_groups.items()
+                                     for user_group in groups.groupInfoList)
@@ -27,3 +27,11 @@ class DirectoryConnector(object):
 
     def load_users_and_groups(self, groups, extended_attributes=None, all_users=True):
         pass
+
+    def set_source_attributes_required(self, required):
+        """
+        Tell the connector whether anything will read the 'source_attributes' of loaded users.
+        Connectors may use this to skip building them.
+        :type required: bool
+        """
+        pass
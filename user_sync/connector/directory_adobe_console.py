@@ -18,6 +18,9 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+
 import umapi_client
 import user_sync.connector.helper
 import user_sync.helper
@@ -45,6 +48,7 @@ class AdobeConsoleConnector(DirectoryConnector):
         builder.set_string_value('identity_type_filter', 'all')
         builder.set_bool_value('ssl_cert_verify', True)
         builder.set_string_value('authentication_method', 'jwt')
+        builder.set_int_value('page_prefetch', 0)
         options = builder.get_options()
 
         if not options['identity_type_filter'] == 'all':
@@ -128,8 +132,9 @@ class AdobeConsoleConnector(DirectoryConnector):
         except Exception as e:
             raise AssertionException("Connection to org %s at endpoint %s failed: %s" % (org_id, um_endpoint, e))
         logger.debug('%s: connection established', self.name)
-        self.umapi_users = []
+        self.page_prefetch = max(options['page_prefetch'], 0)
         self.user_by_usr_key = {}
+        self.user_keys_by_group = defaultdict(list)
 
     def set_additional_group_filters(self, _):
         pass
@@ -147,7 +152,7 @@ class AdobeConsoleConnector(DirectoryConnector):
 
         # Loading all the groups because UMAPI doesn't support group query. DOH!
         self.logger.info('Loading groups...')
-        umapi_groups = [g.lower() for g in self.iter_umapi_groups()]
+        umapi_groups = {g.lower() for g in self.iter_umapi_groups()}
         self.logger.info('Loading users...')
 
         # Loading all umapi users based on ID Type first before doing group filtering
@@ -223,27 +228,77 @@ class AdobeConsoleConnector(DirectoryConnector):
             raise AssertionException("Error to query groups from Adobe Console: %s" % e)
 
     def iter_group_members(self, group):
-        umapi_users = self.umapi_users
-        members = filter(lambda u: ('groups' in u and group.lower() in [g.lower() for g in u['groups']]), umapi_users)
-        for member in members:
-            user_key = self.generate_user_key(member['type'], member['username'], member['domain'])
-            yield user_key
+        """
+        Yield the key of each loaded user that belongs to group (case-insensitive)
+        :type group: str
+        """
+        return iter(self.user_keys_by_group.get(group.lower(), ()))
 
     def load_umapi_users(self, identity_type):
+        """
+        Convert and index console users page by page as they arrive, so that the raw UMAPI
+        records of a page can be dropped as soon as it has been processed
+        :type identity_type: str
+        """
+        self.user_keys_by_group = defaultdict(list)
         try:
-            u_query = umapi_client.UsersQuery(self.connection)
-            umapi_users = u_query.all_results()
-
-            if not identity_type == 'all':
-                umapi_users = list(filter(lambda usr: usr['type'] == identity_type, umapi_users))
-
-            self.umapi_users = umapi_users
-            for user in umapi_users:
-                # Generate unique user key because Username/Email is a bad unique identifier
-                user_key = self.generate_user_key(user['type'], user['username'], user['domain'])
-                self.user_by_usr_key[user_key] = self.convert_user(user)
+            for page in self.iter_umapi_user_pages():
+                for user in page:
+                    if not identity_type == 'all' and user['type'] != identity_type:
+                        continue
+                    # Generate unique user key because Username/Email is a bad unique identifier
+                    user_key = self.generate_user_key(user['type'], user['username'], user['domain'])
+                    self.user_by_usr_key[user_key] = self.convert_user(user)
+                    self.index_user_groups(user_key, user)
         except umapi_client.UnavailableError as e:
             raise AssertionException("Error contacting UMAPI server: %s" % e)
 
+    def iter_umapi_user_pages(self):
+        """
+        Yield each page of the UMAPI user list in order.  When page_prefetch is set, that many
+        pages beyond the current one are requested in parallel while the current one is consumed.
+        :rtype iterable(list(dict))
+        """
+        # same query parameters that umapi_client.UsersQuery uses for an unfiltered user query
+        def fetch(page_number):
+            return self.connection.query_multiple('user', page_number, [], {'directOnly': True})
+
+        if not self.page_prefetch:
+            page_number = 0
+            while True:
+                users, last_page = fetch(page_number)[:2]
+                if users:
+                    yield users
+                if last_page or not users:
+                    return
+                page_number += 1
+
+        with ThreadPoolExecutor(max_workers=self.page_prefetch, thread_name_prefix='umapi_page') as executor:
+            pending = deque(executor.submit(fetch, n) for n in range(self.page_prefetch + 1))
+            next_page_number = len(pending)
+            try:
+                while pending:
+                    users, last_page = pending.popleft().result()[:2]
+                    if users:
+                        yield users
+                    if last_page or not users:
+                        return
+                    pending.append(executor.submit(fetch, next_page_number))
+                    next_page_number += 1
+            finally:
+                # pages requested past the end of the list come back empty, so they can just be dropped
+                for future in pending:
+                    future.cancel()
+
+    def index_user_groups(self, user_key, user):
+        """
+        Record user_key under each of the user's (lowercased) groups so group membership
+        lookups don't have to scan the whole user list
+        :type user_key: str
+        :type user: dict
+        """
+        for group in {g.lower() for g in user.get('groups', [])}:
+            self.user_keys_by_group[group].append(user_key)
+
     def generate_user_key(self, identity_type, username, domain):
         return '%s,%s,%s' % (normalize_string(identity_type), normalize_string(username), normalize_string(domain))
@@ -18,11 +18,18 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import glob
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
 import user_sync.connector.helper
 import user_sync.error
 import user_sync.identity_type
 from user_sync.connector.directory import DirectoryConnector
 from user_sync.config.common import DictConfig, OptionsBuilder
+from user_sync.cache.directory import DirectoryCache
 from user_sync.helper import CSVAdapter
 from user_sync.config import user_sync as config
 from user_sync.config import common as config_common
@@ -47,7 +54,9 @@ class CSVDirectoryConnector(DirectoryConnector):
         builder.set_string_value('identity_type_column_name', 'type')
         builder.set_string_value('user_identity_type', None)
         builder.set_string_value('logger_name', self.name)
-        builder.require_string_value('file_path')
+        builder.require_value('file_path', (str, list))
+        builder.set_int_value('max_workers', None)
+        builder.set_string_value('cache_path', None)
         options = builder.get_options()
         self.options = options
         self.logger = logger = user_sync.connector.helper.create_logger(options)
@@ -59,6 +68,14 @@ class CSVDirectoryConnector(DirectoryConnector):
         # identity type for new users if not specified in column
         self.user_identity_type = user_sync.identity_type.parse_identity_type(options['user_identity_type'])
         self.additional_group_filters = None
+        # without an after-mapping hook nothing reads source_attributes, so building them can be skipped
+        self.source_attributes_required = True
+
+    def __getstate__(self):
+        # the connector is sent to worker processes by read_users_parallel, which don't need earlier results
+        state = self.__dict__.copy()
+        state.pop('users', None)
+        return state
 
     def load_users_and_groups(self, groups, extended_attributes, all_users):
         """
@@ -66,115 +83,218 @@ class CSVDirectoryConnector(DirectoryConnector):
         :type extended_attributes: list
         :rtype (bool, iterable(dict))
         """
-        options = self.options
-        file_path = options['file_path']
-        self.logger.debug('Reading from: %s', file_path)
-        self.users = users = self.read_users(file_path, extended_attributes)
+        file_paths = self.get_file_paths()
+        self.logger.debug('Reading from: %s', ', '.join(file_paths))
+        cache = files = settings = users = None
+        if self.options['cache_path'] is not None:
+            cache = DirectoryCache(Path(self.options['cache_path']), self.name, self.logger)
+            files = cache.describe_files(file_paths)
+            settings = self.get_cache_settings(extended_attributes)
+            users = cache.load(files, settings)
+            if users is not None:
+                self.logger.info('Input files are unchanged; using cached users from: %s', cache.store_path)
+        if users is None:
+            if len(file_paths) == 1:
+                users = self.read_users(file_paths[0], extended_attributes)
+            else:
+                users = self.read_users_parallel(file_paths, extended_attributes)
+            if cache is not None:
+                cache.store(files, settings, users)
+        self.users = users
         self.logger.debug('Number of users loaded: %d', len(users))
         return users.values()
 
+    def get_cache_settings(self, extended_attributes):
+        """
+        Everything besides the input files that affects the users read from them.  Cached users
+        are only reused if these are unchanged.
+        :type extended_attributes: list
+        :rtype dict
+        """
+        settings = {k: v for k, v in self.options.items() if k not in ('cache_path', 'logger_name', 'max_workers')}
+        settings['extended_attributes'] = sorted(extended_attributes or [])
+        settings['source_attributes_required'] = self.source_attributes_required
+        return settings
+
+    def get_file_paths(self):
+        """
+        Expand the file_path option, which can be a single path or a list of paths, any of which
+        may be a glob pattern.  Files matching a pattern are read in sorted order.
+        :rtype list(str)
+        """
+        file_path = self.options['file_path']
+        file_paths = []
+        for path in file_path if isinstance(file_path, list) else [file_path]:
+            if not glob.has_magic(path):
+                file_paths.append(path)
+                continue
+            matches = sorted(glob.glob(path))
+            if not matches:
+                raise user_sync.error.AssertionException("No files match file_path pattern '%s'" % path)
+            file_paths.extend(matches)
+        if not file_paths:
+            raise user_sync.error.AssertionException("No files specified in file_path")
+        return file_paths
+
+    def read_users_parallel(self, file_paths, extended_attributes):
+        """
+        Parse each file in a separate worker process, then merge the results in file order.
+        The result is the same as reading the concatenation of the files with read_users.
+        :type file_paths: list(str)
+        :type extended_attributes: list
+        :rtype dict
+        """
+        max_workers = min(self.options['max_workers'] or os.cpu_count() or 1, len(file_paths))
+        self.logger.info('Reading %d files with %d worker processes', len(file_paths), max_workers)
+        users = {}
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(_read_file, self, path, extended_attributes) for path in file_paths]
+            for path, future in zip(file_paths, futures):
+                file_users, removed_emails = future.result()
+                self.logger.debug('Read %d users from: %s', len(file_users), path)
+                self.merge_users(users, file_users, removed_emails)
+        return users
+
+    @staticmethod
+    def merge_users(users, file_users, removed_emails):
+        """
+        Merge the users read from one file into those read from earlier files, the same way
+        read_users merges multiple rows for the same email
+        :type users: dict
+        :type file_users: dict
+        :type removed_emails: set(str)
+        """
+        # a user was dropped because of a bad row in this file; anything read before that is discarded
+        for email in removed_emails:
+            users.pop(email, None)
+        for email, file_user in file_users.items():
+            user = users.get(email)
+            if user is None:
+                users[email] = file_user
+                continue
+            for key in ('firstname', 'lastname', 'country', 'domain'):
+                if file_user[key] is not None:
+                    user[key] = file_user[key]
+            user['groups'].extend(file_user['groups'])
+            if 'member_groups' in file_user:
+                user['member_groups'] = user['groups']
+            user['username'] = file_user['username']
+            user['identity_type'] = file_user['identity_type']
+            if 'source_attributes' in file_user:
+                user['source_attributes'] = file_user['source_attributes']
+
     def read_users(self, file_path, extended_attributes):
         """
         :type file_path
         :type extended_attributes: list
         :rtype dict
         """
+        return self.read_file(file_path, extended_attributes)[0]
+
+    def read_file(self, file_path, extended_attributes):
+        """
+        :type file_path
+        :type extended_attributes: list
+        :rtype (dict, set(str)) the users read, and the emails of any users dropped because of a bad row
+        """
         users = {}
+        removed_emails = set()
 
         options = self.options
         logger = self.logger
+        debug_enabled = logger.isEnabledFor(logging.DEBUG)
 
-        recognized_column_names = []
-
-        def get_column_name(key):
-            column_name = options[key]
-            recognized_column_names.append(column_name)
-            return column_name
-
-        email_column_name = get_column_name('email_column_name')
-        first_name_column_name = get_column_name('first_name_column_name')
-        last_name_column_name = get_column_name('last_name_column_name')
-        country_column_name = get_column_name('country_column_name')
-        groups_column_name = get_column_name('groups_column_name')
-        identity_type_column_name = get_column_name('identity_type_column_name')
-        username_column_name = get_column_name('username_column_name')
-        domain_column_name = get_column_name('domain_column_name')
+        # the order of the standard columns matters - rows are unpacked in this order below
+        recognized_column_names = [options[key] for key in [
+            'email_column_name',
+            'first_name_column_name',
+            'last_name_column_name',
+            'country_column_name',
+            'groups_column_name',
+            'identity_type_column_name',
+            'username_column_name',
+            'domain_column_name',
+        ]]
 
         # extended attributes appear after the standard ones (if no header row)
         recognized_column_names += extended_attributes
 
+        build_source_attributes = self.source_attributes_required or bool(extended_attributes)
+        create_blank_user = user_sync.connector.helper.create_blank_user
+        # only a handful of distinct identity type spellings ever occur, so parse each one once
+        identity_types = {}
+
         line_read = 0
-        rows = CSVAdapter.read_csv_rows(file_path,
-                                        recognized_column_names=recognized_column_names,
-                                        logger=logger,
-                                        encoding=self.encoding,
-                                        delimiter=options['delimiter'])
-        for row in rows:
+        rows = CSVAdapter.read_csv_columns(file_path,
+                                           recognized_column_names,
+                                           logger=logger,
+                                           encoding=self.encoding,
+                                           delimiter=options['delimiter'])
+        for values in rows:
             line_read += 1
-            email = self.get_column_value(row, email_column_name)
+            email, first_name, last_name, country, groups, identity_type, username, domain = values[:8]
             if email is None or email.find('@') < 0:
                 logger.warning('Missing or invalid email at row: %d; skipping', line_read)
                 continue
 
             user = users.get(email)
             if user is None:
-                user = user_sync.connector.helper.create_blank_user()
+                user = create_blank_user()
                 user['email'] = email
                 users[email] = user
 
-            first_name = self.get_column_value(row, first_name_column_name)
             if first_name is not None:
                 user['firstname'] = first_name
-            else:
+            elif debug_enabled:
                 logger.debug('No value firstname for: %s', email)
 
-            last_name = self.get_column_value(row, last_name_column_name)
             if last_name is not None:
                 user['lastname'] = last_name
-            else:
+            elif debug_enabled:
                 logger.debug('No value lastname for: %s', email)
 
-            country = self.get_column_value(row, country_column_name)
             if country is not None:
                 user['country'] = country.upper()
 
-            groups = self.get_column_value(row, groups_column_name)
             if groups is not None:
                 user['groups'].extend(groups.split(','))
                 user['member_groups'] = user['groups']
 
-            username = self.get_column_value(row, username_column_name)
             if username is None:
                 username = email
             user['username'] = username
 
-            identity_type = self.get_column_value(row, identity_type_column_name)
             if identity_type:
-                try:
-                    user['identity_type'] = user_sync.identity_type.parse_identity_type(identity_type)
-                except user_sync.error.AssertionException as e:
-                    self.logger.warning('Skipping user %s: %s', username, e)
-                    del users[email]
-                    continue
+                parsed_identity_type = identity_types.get(identity_type)
+                if parsed_identity_type is None:
+                    try:
+                        parsed_identity_type = user_sync.identity_type.parse_identity_type(identity_type)
+                    except user_sync.error.AssertionException as e:
+                        self.logger.warning('Skipping user %s: %s', username, e)
+                        del users[email]
+                        removed_emails.add(email)
+                        continue
+                    identity_types[identity_type] = parsed_identity_type
+                user['identity_type'] = parsed_identity_type
             else:
                 user['identity_type'] = self.user_identity_type
 
-            domain = self.get_column_value(row, domain_column_name)
             if domain:
                 user['domain'] = domain
             elif username != email:
                 user['domain'] = email[email.find('@') + 1:]
 
-            sa = {}
-            for col in recognized_column_names:
-                sa[col] = self.get_column_value(row, col)
-            user['source_attributes'] = sa
+            if build_source_attributes:
+                user['source_attributes'] = dict(zip(recognized_column_names, values))
 
-        return users
+        return users, removed_emails
 
     def set_additional_group_filters(self, _):
         pass
 
+    def set_source_attributes_required(self, required):
+        self.source_attributes_required = required
+
     def get_column_value(self, row, column_name):
         """
         :type row: dict
@@ -182,3 +302,10 @@ class CSVDirectoryConnector(DirectoryConnector):
         """
         value = row.get(column_name)
         return value if value else None
+
+
+def _read_file(connector, file_path, extended_attributes):
+    """
+    Process pool entry point for CSVDirectoryConnector.read_users_parallel
+    """
+    return connector.read_file(file_path, extended_attributes)
@@ -0,0 +1,82 @@
+# Copyright (c) 2016-2017 Adobe Inc.  All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import logging
+
+from user_sync.connector.directory import DirectoryConnector
+
+
+class SharedDirectoryConnector(DirectoryConnector):
+    """
+    Serves several sync engines from a single read of another directory connector.  The read covers everything
+    the engines will ask for, given as (groups, extended attributes, all users) requests up front.  Each
+    engine then gets copies of the users it asked for, with their groups as the connector returned them.
+    Connectors such as CSV return all of a user's groups anyway, and rules on unmapped groups (like
+    additional_groups) rely on that.
+    """
+    name = 'shared'
+
+    def __init__(self, connector, requests):
+        """
+        :type connector: DirectoryConnector
+        :type requests: list(tuple(set, list, bool))
+        """
+        super().__init__()
+        self.connector = connector
+        self.logger = logging.getLogger('shared_directory')
+        self.groups = set()
+        self.extended_attributes = []
+        self.all_users = False
+        for groups, extended_attributes, all_users in requests:
+            self.groups.update(groups)
+            self.extended_attributes.extend(a for a in extended_attributes or [] if a not in self.extended_attributes)
+            self.all_users = self.all_users or all_users
+        self.source_attributes_required = False
+        self.users = None
+
+    def set_source_attributes_required(self, required):
+        self.source_attributes_required = self.source_attributes_required or required
+
+    def set_additional_group_filters(self, additional_group_filters):
+        self.connector.set_additional_group_filters(additional_group_filters)
+
+    def load_users_and_groups(self, groups, extended_attributes=None, all_users=True):
+        """
+        :type groups: iterable(str)
+        :type extended_attributes: list(str)
+        :type all_users: bool
+        :rtype iterable(dict)
+        """
+        if self.users is None:
+            self.connector.set_source_attributes_required(self.source_attributes_required)
+            self.users = list(self.connector.load_users_and_groups(self.groups, self.extended_attributes,
+                                                                   self.all_users))
+            self.logger.debug('Read %d directory users for all engines', len(self.users))
+        else:
+            self.logger.debug('Reusing %d directory users already read', len(self.users))
+        # group names are matched without case, as in group mapping
+        groups = {g.lower() for g in groups}
+        # all users were read for another engine, but this one only wants the members of its groups
+        members_only = self.all_users and not all_users
+        for user in self.users:
+            if members_only and groups.isdisjoint(g.lower() for g in user['groups']):
+                continue
+            # a shallow copy, since engines add their own keys to the users they are given
+            yield dict(user, groups=list(user['groups']))
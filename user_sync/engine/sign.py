@@ -1,12 +1,114 @@
 import logging
 import time
+from datetime import datetime
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
 
 from user_sync.config.common import DictConfig, ConfigFileLoader, as_set, check_max_limit
+from user_sync.cache.sign import SignUserRecord
 from user_sync.connector.connector_sign import SignConnector
 from user_sync.error import AssertionException
-from sign_client.error import AssertionException as ClientException
 
-from sign_client.model import DetailedUserInfo, GroupInfo, UserGroupsInfo, UserGroupInfo, DetailedGroupInfo, UserStateInfo
+from sign_client.model import DetailedUserInfo, GroupInfo, UserGroupsInfo, UserGroupInfo, DetailedGroupInfo, UserStateInfo, dumps, loads
+
+
+class GroupMappingResolver:
+    """
+    Resolves a directory user's groups to the Sign group and roles they map to, like
+    SignSyncEngine.extract_mapped_group().  The mappings are put in priority order once, and results are
+    memoized by the set of mapped groups a user is in, since many users share the same combination.
+    """
+
+    def __init__(self, group_mapping: dict):
+        # directory group name -> rank in priority order
+        ordered = sorted(group_mapping, key=lambda g: group_mapping[g].get('priority', 0))
+        self.rank = {g: i for i, g in enumerate(ordered)}
+        self.group_mapping = group_mapping
+        self.mapped_groups = frozenset(group_mapping)
+        self.memo = {}
+
+    def resolve(self, directory_user_groups) -> dict:
+        """
+        :param directory_user_groups: the directory groups of a user
+        :return: dict with the matched Sign group (or None) and a list of roles
+        """
+        key = self.mapped_groups.intersection(directory_user_groups)
+        result = self.memo.get(key)
+        if result is None:
+            result = self.memo[key] = self._resolve(key)
+        group, roles = result
+        # a new dict for each user, since callers get to keep it
+        return {'group': group, 'roles': list(roles)}
+
+    def _resolve(self, matched_groups):
+        roles = set()
+        matched_group = None
+        for g in sorted(matched_groups, key=self.rank.__getitem__):
+            mapping = self.group_mapping[g]
+            roles |= mapping['roles']
+            if matched_group is None and mapping['groups']:
+                matched_group = mapping['groups'][0]
+        return matched_group, tuple(roles) if roles else ('NORMAL_USER',)
+
+
+class SignOrgPlan:
+    """
+    The changes a sync makes to one Sign org.  Working them out only reads from Sign, so a plan can be
+    applied straight away, or saved and applied by a later run.  Groups that don't exist yet are
+    referred to by name, with an empty id, until they are created.  User updates hold only the fields
+    that change, so applying a saved plan doesn't undo other changes made in Sign since.
+    """
+
+    def __init__(self, new_groups=None, reactivations=None, new_users=None, user_updates=None,
+                 user_group_updates=None, deactivations=None):
+        self.new_groups: list[DetailedGroupInfo] = new_groups or []
+        # (user id, email) pairs
+        self.reactivations: list[tuple[str, str]] = reactivations or []
+        self.new_users: list[tuple[DetailedUserInfo, UserGroupsInfo]] = new_users or []
+        # (user id, new value by field name) pairs
+        self.user_updates: list[tuple[str, dict]] = user_updates or []
+        self.user_group_updates: list[tuple[str, UserGroupsInfo]] = user_group_updates or []
+        self.deactivations: list[tuple[str, str]] = deactivations or []
+
+    def __len__(self):
+        return (len(self.new_groups) + len(self.reactivations) + len(self.new_users) + len(self.user_updates) +
+                len(self.user_group_updates) + len(self.deactivations))
+
+    def describe(self) -> str:
+        return (f"{len(self.new_groups)} new groups, {len(self.reactivations)} reactivations, "
+                f"{len(self.new_users)} new users, {len(self.user_updates)} user updates, "
+                f"{len(self.user_group_updates)} group assignments, {len(self.deactivations)} deactivations")
+
+    def resolve_group_ids(self, group_ids: dict):
+        """
+        Fill in the ids of groups that were created after the plan was made
+        :param group_ids: group id by lowercase group name
+        """
+        user_groups = [g for _, groups in self.new_users for g in groups.groupInfoList]
+        user_groups.extend(g for _, groups in self.user_group_updates for g in groups.groupInfoList)
+        for group in user_groups:
+            if not group.id:
+                group.id = group_ids.get(group.name.lower(), group.id)
+
+    def to_dict(self) -> dict:
+        return {
+            'new_groups': [g.to_dict() for g in self.new_groups],
+            'reactivations': self.reactivations,
+            'new_users': [[u.to_dict(), g.to_dict()] for u, g in self.new_users],
+            'user_updates': self.user_updates,
+            'user_group_updates': [[user_id, g.to_dict()] for user_id, g in self.user_group_updates],
+            'deactivations': self.deactivations,
+        }
+
+    @staticmethod
+    def from_dict(dct: dict) -> 'SignOrgPlan':
+        return SignOrgPlan(
+            new_groups=[DetailedGroupInfo.from_dict(g) for g in dct['new_groups']],
+            reactivations=[tuple(r) for r in dct['reactivations']],
+            new_users=[(DetailedUserInfo.from_dict(u), UserGroupsInfo.from_dict(g)) for u, g in dct['new_users']],
+            user_updates=[tuple(u) for u in dct['user_updates']],
+            user_group_updates=[(user_id, UserGroupsInfo.from_dict(g)) for user_id, g in dct['user_group_updates']],
+            deactivations=[tuple(d) for d in dct['deactivations']],
+        )
 
 
 class SignSyncEngine:
@@ -18,7 +120,8 @@ class SignSyncEngine:
         },
         'invocation_defaults': {
             'users': 'mapped',
-            'test_mode': False
+            'test_mode': False,
+            'full_refresh': False,
         },
         'cache': {
             'path': 'cache/sign',
@@ -36,6 +139,8 @@ class SignSyncEngine:
 
     name = 'sign_sync'
     encoding = 'utf-8'
+    # bump when saved plans change shape, so plans saved by another version aren't applied
+    PLAN_VERSION = 2
 
     def __init__(self, caller_options, target_options: dict[str, dict]):
         """
@@ -55,19 +160,21 @@ class SignSyncEngine:
         self.caller_options = caller_options
         self.target_options = target_options
         self.action_summary = {}
-        self.sign_users_by_org: dict[str, dict[str, DetailedUserInfo]] = {}
-        self.total_sign_user_count = 0
+        self.sign_users_by_org: dict[str, dict[str, SignUserRecord]] = {}
         self.sign_users_created = set()
         self.sign_users_deactivated = set()
+        # users a plan being saved will create or deactivate when it is applied
+        self.sign_users_to_create = set()
+        self.sign_users_to_deactivate = set()
         self.sign_admins_matched = set()
         self.sign_users_matched_groups = set()
         self.sign_users_group_updates = set()
         self.sign_users_role_updates = set()
         self.sign_users_matched_no_updates = set()
         self.directory_users_excluded = set()
-        self.sign_only_users_by_org: dict[str, dict[str, DetailedUserInfo]] = {}
+        self.sign_only_users_by_org: dict[str, dict[str, SignUserRecord]] = {}
         self.sign_user_primary_groups = {}
-        self.total_sign_only_user_count = 0
+        self.plans: dict[str, SignOrgPlan] = {}
 
     def get_groups(self, org):
         return self.connectors[org].sign_groups()
@@ -84,77 +191,271 @@ class SignSyncEngine:
         """
         self.read_desired_user_groups(directory_groups, directory_connector)
 
-        for org_name, target_dict in self.target_options.items():
-            self.connectors[org_name] = SignConnector(target_dict, org_name, self.options['test_mode'], self.caller_options['connection'], self.caller_options['cache'])
-        
-        for org_name in self.connectors:
+        # orgs share nothing but the directory users read above, so they can be synced side by side
+        org_concurrency = self.caller_options['connection'].get('org_concurrency') or 1
+        self.run_orgs(lambda org_name: self.sync_org(org_name, self.target_options[org_name], directory_groups),
+                      list(self.target_options), org_concurrency)
+        if self.options.get('plan_out'):
+            self.save_plan(self.options['plan_out'])
+        self.log_action_summary()
+
+    def run_orgs(self, func, org_names, org_concurrency):
+        """
+        Call func for each org, up to org_concurrency at a time.  Once one fails, orgs that haven't
+        started are skipped, and the failure is raised when the running ones are done.
+        """
+        org_concurrency = min(org_concurrency, len(org_names))
+        if org_concurrency > 1:
+            self.logger.info(f"Syncing {len(org_names)} Sign orgs, {org_concurrency} at a time")
+        with ThreadPoolExecutor(max_workers=max(org_concurrency, 1), thread_name_prefix='sign_org') as executor:
+            futures = [executor.submit(func, org_name) for org_name in org_names]
+            done, not_done = wait(futures, return_when=FIRST_EXCEPTION)
+            for future in not_done:
+                future.cancel()
+        for future in futures:
+            if not future.cancelled() and future.exception() is not None:
+                raise future.exception()
+
+    def apply_plan(self, path):
+        """
+        Apply the plan saved by an earlier run with plan_out, without reading the directory.  The work was
+        done when the plan was made, so every org is applied at once, with requests at their concurrency
+        ceiling from the start.
+        :param path: plan file
+        """
+        plans = self.load_plan(path)
+        unknown = [org_name for org_name in plans if org_name not in self.target_options]
+        if unknown:
+            raise AssertionException(f"Plan '{path}' has changes for unknown Sign orgs: {', '.join(unknown)}")
+        connection = dict(self.caller_options['connection'])
+        # same default ceiling as the Sign client's
+        ceiling = connection.get('max_request_concurrency') or (connection.get('request_concurrency') or 1) * 4
+        connection['request_concurrency'] = connection['max_request_concurrency'] = ceiling
+        self.plans = plans
+
+        def apply_org(org_name):
+            sign_connector = SignConnector(self.target_options[org_name], org_name, self.options['test_mode'],
+                                           connection, self.caller_options['cache'])
+            self.connectors[org_name] = sign_connector
+            try:
+                self.logger.info(f"{self.org_string(org_name)}Applying plan: {plans[org_name].describe()}")
+                self.apply_org_plan(org_name, sign_connector, plans[org_name], saved=True)
+            finally:
+                sign_connector.close()
+
+        self.run_orgs(apply_org, list(plans), len(plans))
+        self.log_action_summary()
+
+    def save_plan(self, path):
+        """
+        Save the plans made for each org, to be applied by a later run
+        :param path: plan file
+        """
+        plan = {
+            'version': self.PLAN_VERSION,
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'orgs': {org_name: plan.to_dict() for org_name, plan in self.plans.items()},
+        }
+        with open(path, 'w', encoding=self.encoding) as f:
+            f.write(dumps(plan))
+        self.logger.info(f"Saved plan for {len(self.plans)} Sign orgs to '{path}'")
+
+    @classmethod
+    def load_plan(cls, path) -> dict[str, SignOrgPlan]:
+        """
+        :param path: plan file written by save_plan()
+        :return: plan by org name
+        """
+        try:
+            with open(path, encoding=cls.encoding) as f:
+                plan = loads(f.read())
+        except (OSError, ValueError) as e:
+            raise AssertionException(f"Can't read plan '{path}': {e}")
+        if not isinstance(plan, dict) or plan.get('version') != cls.PLAN_VERSION:
+            raise AssertionException(f"Plan '{path}' was not saved by this version of Sign Sync")
+        return {org_name: SignOrgPlan.from_dict(org_plan) for org_name, org_plan in plan['orgs'].items()}
+
+    def sync_org(self, org_name, target_dict, directory_groups):
+        """
+        Sync a single Sign org.  The connector is created and used in one thread, since its sqlite cache
+        can't be shared between threads.
+        :param org_name:
+        :param target_dict:
+        :param directory_groups:
+        :return:
+        """
+        # when only making a plan, nothing is changed, just as in test mode
+        test_mode = self.options['test_mode'] or bool(self.options.get('plan_out'))
+        sign_connector = SignConnector(target_dict, org_name, test_mode, self.caller_options['connection'],
+                                       self.caller_options['cache'], self.options.get('full_refresh', False))
+        self.connectors[org_name] = sign_connector
+        try:
             self.sign_groups[org_name] = self.get_groups(org_name)
             self.default_groups[org_name] = self.get_default_group(org_name)
+            plan = self.plans[org_name] = SignOrgPlan()
 
-        for org_name, sign_connector in self.connectors.items():
-            # Create any new Sign groups
+            # Plan any new Sign groups, which users can be assigned to before they have an id
             org_directory_groups = self._groupify(
                 org_name, directory_groups.values())
+            new_groups = {}
             for directory_group in org_directory_groups:
                 if (directory_group.lower() not in self.sign_groups[org_name]):
-                    self.logger.info(
-                        "{}Creating new Sign group: {}".format(self.org_string(org_name), directory_group))
-                    sign_connector.create_group(DetailedGroupInfo(name=directory_group))
-            self.sign_groups[org_name] = self.get_groups(org_name)
+                    new_groups.setdefault(directory_group.lower(), directory_group)
+            for name_key, directory_group in new_groups.items():
+                plan.new_groups.append(DetailedGroupInfo(name=directory_group))
+                self.sign_groups[org_name][name_key] = GroupInfo(groupId='', groupName=directory_group)
             # Update user details or insert new user
             self.update_sign_users(
-                self.directory_user_by_user_key, sign_connector, org_name)
+                self.directory_user_by_user_key, sign_connector, org_name, plan)
             if org_name in self.sign_only_users_by_org:
-                self.handle_sign_only_users(sign_connector, org_name)
-        self.log_action_summary()
+                self.handle_sign_only_users(sign_connector, org_name, plan)
+            if self.options.get('plan_out'):
+                self.log_org_plan(org_name, plan)
+            else:
+                self.apply_org_plan(org_name, sign_connector, plan)
+        finally:
+            sign_connector.close()
 
-    def log_action_summary(self):
+    def apply_org_plan(self, org_name, sign_connector: SignConnector, plan: SignOrgPlan, saved=False):
+        """
+        Make the changes planned for an org, with as few batches of concurrent calls as possible
+        :param org_name:
+        :param sign_connector:
+        :param plan:
+        :param saved: the plan was made by an earlier run, so users are updated from their current details
+        :return:
+        """
+        groups = self.sign_groups.get(org_name)
+        if groups is None:
+            # the cache isn't refreshed while applying; groups missing from it are created or fail to be
+            groups = self.sign_groups[org_name] = sign_connector.sign_groups(refresh=False)
+        # groups planned for may have been created since, by another run
+        new_groups = [g for g in plan.new_groups if not getattr(groups.get(g.name.lower()), 'groupId', None)]
+        for group in new_groups:
+            self.logger.info("{}Creating new Sign group: {}".format(self.org_string(org_name), group.name))
+        if new_groups:
+            for group in sign_connector.create_groups(new_groups):
+                groups[group.groupName.lower()] = group
+        plan.resolve_group_ids({name_key: g.groupId for name_key, g in groups.items() if g.groupId})
+
+        # reactivations and deactivations go out together
+        activate = UserStateInfo(state='ACTIVE', comment='Activated by User Sync Tool')
+        deactivate = UserStateInfo(state='INACTIVE', comment='Deactivated by User Sync Tool')
+        state_changes = [(user_id, activate) for user_id, _ in plan.reactivations]
+        state_changes.extend((user_id, deactivate) for user_id, _ in plan.deactivations)
+        errors = sign_connector.update_user_states(state_changes, current=saved) if state_changes else {}
+        for user_id, email in plan.reactivations:
+            if user_id in errors:
+                self.logger.error(f"Reactivation error for '{email}: {errors[user_id]}")
+            else:
+                self.logger.info(f"Reactivated user '{email}")
+        for user_id, email in plan.deactivations:
+            if user_id in errors:
+                self.logger.error(errors[user_id])
+            else:
+                self.sign_users_deactivated.add((org_name, email))
+                self.logger.info(f"{self.org_string(org_name)}Deactivated sign user '{email}'")
+        # users that couldn't be deactivated are otherwise left as they are
+        failed = {user_id for user_id, _ in plan.deactivations if user_id in errors}
+
+        self.insert_new_users(org_name, sign_connector, plan.new_users)
+        errors = sign_connector.update_user_fields([(user_id, changes) for user_id, changes in plan.user_updates
+                                                    if user_id not in failed], current=saved)
+        errors.update(sign_connector.update_user_groups([(user_id, g) for user_id, g in plan.user_group_updates
+                                                         if user_id not in failed]))
+        for error in errors.values():
+            self.logger.error(f"{self.org_string(org_name)}{error}")
+
+    def log_org_plan(self, org_name, plan: SignOrgPlan):
+        """
+        Report the changes planned for an org, which a later run will make
+        :param org_name:
+        :param plan:
+        """
+        org_string = self.org_string(org_name)
+        for group in plan.new_groups:
+            self.logger.info(f"{org_string}Planned new Sign group: {group.name}")
+        for _, email in plan.reactivations:
+            self.logger.info(f"{org_string}Planned reactivation of sign user '{email}'")
+        for user, _ in plan.new_users:
+            self.sign_users_to_create.add((org_name, user.email))
+            self.logger.info(f"{org_string}Planned insert of sign user '{user.email}', admin?: {user.isAccountAdmin}")
+        for _, email in plan.deactivations:
+            self.sign_users_to_deactivate.add((org_name, email))
+            self.logger.info(f"{org_string}Planned deactivation of sign user '{email}'")
+        self.logger.info(f"{org_string}Planned {plan.describe()}")
+
+    def org_action_summary(self, org_names) -> dict:
+        """
+        Count the Sign actions taken in the given orgs.  Action sets hold (org name, email) pairs, so a user
+        counts once for each org they were changed in.
+        :param org_names: set of org names
+        """
+        def count(actions):
+            return sum(1 for org_name, _ in actions if org_name in org_names)
+
+        summary = {
+            'Number of Sign users read': sum(len(self.sign_users_by_org.get(o, ())) for o in org_names),
+            'Number of Sign users not in directory (sign-only)':
+                sum(len(self.sign_only_users_by_org.get(o, ())) for o in org_names),
+            'Number of Sign users updated': count(self.sign_users_group_updates | self.sign_users_role_updates),
+            'Number of users with groups updated': count(self.sign_users_group_updates),
+            'Number of users admin roles updated': count(self.sign_users_role_updates),
+        }
+        if self.options.get('plan_out'):
+            # nothing is created or deactivated until the plan is applied
+            summary['Number of Sign users to be created'] = count(self.sign_users_to_create)
+            summary['Number of Sign users to be deactivated'] = count(self.sign_users_to_deactivate)
+        else:
+            summary['Number of Sign users created'] = count(self.sign_users_created)
+            summary['Number of Sign users deactivated'] = count(self.sign_users_deactivated)
+        return summary
 
+    def log_action_summary(self):
+        excluded_count = len({email for _, email in self.directory_users_excluded})
         self.action_summary = {
             'Number of directory users read': len(self.directory_user_by_user_key),
-            'Number of directory selected for input': len(self.directory_user_by_user_key) - len(
-                self.directory_users_excluded),
-            'Number of directory users excluded': len(self.directory_users_excluded),
-            'Number of Sign users read': self.total_sign_user_count,
-            'Number of Sign users not in directory (sign-only)': self.total_sign_only_user_count,
-            'Number of Sign users updated': len(self.sign_users_group_updates | self.sign_users_role_updates),
-            'Number of users with groups updated': len(self.sign_users_group_updates),
-            'Number of users admin roles updated': len(self.sign_users_role_updates),
-            'Number of Sign users created': len(self.sign_users_created),
-            'Number of Sign users deactivated': len(self.sign_users_deactivated),
+            'Number of directory selected for input': len(self.directory_user_by_user_key) - excluded_count,
+            'Number of directory users excluded': excluded_count,
         }
+        self.action_summary.update(self.org_action_summary(set(self.target_options)))
 
         pad = max(len(k) for k in self.action_summary)
         header = '------- Action Summary -------'
         self.logger.info('---------------------------' + header + '---------------------------')
         for description, count in self.action_summary.items():
             self.logger.info('  {}: {}'.format(description.rjust(pad, ' '), count))
+        if len(self.target_options) > 1:
+            for org_name in self.target_options:
+                self.logger.info('  {}'.format(self.org_string(org_name).rstrip(' -')))
+                for description, count in self.org_action_summary({org_name}).items():
+                    self.logger.info('  {}: {}'.format(description.rjust(pad, ' '), count))
 
-    def update_sign_users(self, directory_users, sign_connector: SignConnector, org_name):
+    def update_sign_users(self, directory_users, sign_connector: SignConnector, org_name, plan: SignOrgPlan):
         """
-        Updates user details or inserts new user
+        Plans user detail updates and new user inserts
         :param directory_groups:
         :param sign_connector:
         :param org_name:
+        :param plan: where the changes are added
         :return:
         """
-        # Fetch the list of active Sign users
-        sign_users = {user.email: user for user in sign_connector.get_users().values() if user.status != 'INACTIVE'}
-        inactive_sign_users = {user.email: user for user in sign_connector.get_users().values() if user.status == 'INACTIVE'}
-        sign_user_groups = sign_connector.get_user_groups()
-        self.sign_user_primary_groups[org_name] = {id: [g for g in groups if g.isPrimaryGroup][0] for id, groups in sign_user_groups.items()}
-        users_update_list = []
-        user_groups_update_list = []
-        dir_users_for_org = {}
-        self.total_sign_user_count += len(sign_users)
+        sign_user_index = sign_connector.get_user_index()
+        sign_users = sign_user_index.by_email
+        inactive_sign_users = sign_user_index.inactive_by_email
+        self.sign_user_primary_groups[org_name] = sign_user_index.primary_groups
+        users_update_list = plan.user_updates
+        user_groups_update_list = plan.user_group_updates
+        new_users = plan.new_users
+        # users are taken out as they are matched to directory users, leaving the sign-only users
+        sign_only_users = dict(sign_users)
         self.sign_users_by_org[org_name] = sign_users
         for directory_user_key, directory_user in directory_users.items():
 
             if not self.should_sync(directory_user, org_name):
                 continue
 
-            sign_user = sign_users.get(directory_user_key)
-            dir_users_for_org[directory_user_key] = directory_user
+            sign_user = sign_only_users.pop(directory_user_key, None)
             assignment_group = self.retrieve_assignment_group(directory_user)
 
             if assignment_group is None:
@@ -165,23 +466,14 @@ class SignSyncEngine:
                     inactive_user = inactive_sign_users.get(directory_user_key)
                     # if Standalone user is inactive, we need to reactivate instead of trying to create new account
                     if inactive_user is not None:
-                        try:
-                            state = UserStateInfo(
-                                state='ACTIVE',
-                                comment='Activated by User Sync Tool'
-                            )
-                            sign_connector.update_user_state(inactive_user.id, state)
-                            self.logger.info(f"Reactivated user '{inactive_user.email}")
-                        except ClientException as e:
-                            self.logger.error(f"Reactivation error for '{inactive_user.email}: "+format(e))
+                        plan.reactivations.append((inactive_user.id, inactive_user.email))
                     else:
                         # if user is totally new then create it
-                        self.insert_new_users(
-                            org_name, sign_connector, directory_user, user_roles, assignment_group)
+                        new_users.append(self.new_user_data(org_name, directory_user, user_roles, assignment_group))
                 else:
                     self.logger.info("{0}User {1} not present and will be skipped."
                                      .format(self.org_string(org_name), directory_user['email']))
-                    self.directory_users_excluded.add(directory_user['email'])
+                    self.directory_users_excluded.add((org_name, directory_user['email']))
                     continue
             else:
                 is_admin = 'ACCOUNT_ADMIN' in user_roles
@@ -192,12 +484,14 @@ class SignSyncEngine:
                         self.logger.info(f"Assigning account admin status to {sign_user.email}")
                     else:
                         self.logger.info(f"Removing account admin status from {sign_user.email}")
-                    user_data = DetailedUserInfo(**sign_user.__dict__)
-                    user_data.isAccountAdmin = is_admin
-                    self.sign_users_role_updates.add(sign_user.email)
-                    users_update_list.append(user_data)
+                    self.sign_users_role_updates.add((org_name, sign_user.email))
+                    users_update_list.append((sign_user.id, {'isAccountAdmin': is_admin}))
                 # manage primary group asssignment
-                current_group: UserGroupInfo = self.sign_user_primary_groups[org_name][sign_user.id]
+                current_group: UserGroupInfo = self.sign_user_primary_groups[org_name].get(sign_user.id)
+                if current_group is None:
+                    self.logger.warning(f"{self.org_string(org_name)}Groups of Sign user '{sign_user.email}' are "
+                                        f"unknown; its group and group admin status are left as they are")
+                    continue
                 should_be_group_admin = 'GROUP_ADMIN' in user_roles
                 is_group_admin = current_group.isGroupAdmin
 
@@ -217,26 +511,20 @@ class SignSyncEngine:
                     self.logger.info(f"Assigning primary group '{assignment_group}' to user {sign_user.email}")
                     group_to_assign.id = assignment_group_info.groupId
                     group_to_assign.name = assignment_group_info.groupName
-                    self.sign_users_group_updates.add(sign_user.email)
+                    self.sign_users_group_updates.add((org_name, sign_user.email))
                     updated_group_info=True
 
                 if is_group_admin != should_be_group_admin:
                     self.logger.info(f"Changing group Admin role for user '{sign_user.email}', status? {should_be_group_admin}")
                     group_to_assign.isGroupAdmin = should_be_group_admin
-                    self.sign_users_role_updates.add(sign_user.email)
+                    self.sign_users_role_updates.add((org_name, sign_user.email))
                     updated_group_info=True
 
                 if updated_group_info:
                     group_update_data = UserGroupsInfo(groupInfoList=[group_to_assign])
                     user_groups_update_list.append((sign_user.id, group_update_data))
-                
-        sign_connector.update_users(users_update_list)
-        sign_connector.update_user_groups(user_groups_update_list)
-        self.sign_only_users_by_org[org_name] = {}
-        for user, data in sign_users.items():
-            if user not in dir_users_for_org:
-                self.total_sign_only_user_count += 1
-                self.sign_only_users_by_org[org_name][user] = data
+
+        self.sign_only_users_by_org[org_name] = sign_only_users
 
     @staticmethod
     def roles_match(resolved_roles, sign_roles) -> bool:
@@ -286,6 +574,18 @@ class SignSyncEngine:
                     processed_groups.append(group_name)
         return processed_groups
 
+    def get_directory_request(self, mappings):
+        """
+        What read_desired_user_groups will ask the directory connector for
+        :param mappings: dict of directory group names to Sign group mappings
+        :return: groups, extended attributes, and whether all users are needed
+        """
+        directory_group_filter = self.options['directory_group_filter']
+        directory_groups = set(mappings.keys())
+        if directory_group_filter is not None:
+            directory_groups.update(directory_group_filter)
+        return directory_groups, [], directory_group_filter is None
+
     def read_desired_user_groups(self, mappings, directory_connector):
         """
         Reads and loads the users and group information from the identity source
@@ -301,13 +601,12 @@ class SignSyncEngine:
             directory_group_filter = set(directory_group_filter)
         directory_user_by_user_key = self.directory_user_by_user_key
 
-        directory_groups = set(mappings.keys())
-        if directory_group_filter is not None:
-            directory_groups.update(directory_group_filter)
+        directory_groups, extended_attributes, all_users = self.get_directory_request(mappings)
         directory_users = directory_connector.load_users_and_groups(groups=directory_groups,
-                                                                    extended_attributes=[],
-                                                                    all_users=directory_group_filter is None)
+                                                                    extended_attributes=extended_attributes,
+                                                                    all_users=all_users)
 
+        resolver = GroupMappingResolver(mappings)
         for directory_user in directory_users:
             if not self.is_directory_user_in_groups(directory_user, directory_group_filter):
                 continue
@@ -317,8 +616,7 @@ class SignSyncEngine:
                 self.logger.warning(
                     "Ignoring directory user with empty user key: %s", directory_user)
                 continue
-            sign_group = self.extract_mapped_group(directory_user['groups'], mappings)
-            directory_user['sign_group'] = sign_group
+            directory_user['sign_group'] = resolver.resolve(directory_user['groups'])
             directory_user_by_user_key[user_key] = directory_user
 
     def is_directory_user_in_groups(self, directory_user, groups):
@@ -345,41 +643,23 @@ class SignSyncEngine:
 
     @staticmethod
     def extract_mapped_group(directory_user_group, group_mapping) -> dict:
+        """
+        Finds the Sign group and roles for a single user.  To resolve many users against the same mapping,
+        use a GroupMappingResolver.
+        :param directory_user_group: the directory groups of a user
+        :param group_mapping:
+        :return: dict with the matched Sign group (or None) and a list of roles
+        """
+        return GroupMappingResolver(group_mapping).resolve(directory_user_group)
 
-        roles = set()
-        matched_group = None
-
-        matched_mappings = {g: m for g, m in group_mapping.items() if g in directory_user_group}
-        ordered_mappings = list(matched_mappings.values())
-        ordered_mappings.sort(key=lambda x: x['priority'])
-
-        if ordered_mappings is not None:
-            groups = []
-            for g in ordered_mappings:
-                roles |= g['roles']
-                if g['groups']:
-                    groups.extend(g['groups'])
-            if groups:
-                matched_group = groups[0]
-
-        # return roles as list instead of set
-        sign_group_mapping = {
-            'group': matched_group,
-            'roles': list(roles) if roles else ['NORMAL_USER']
-        }
-
-        # For illustration.  Just return line 322 instead.
-        return sign_group_mapping
-
-    def insert_new_users(self, org_name: str, sign_connector: SignConnector, directory_user: dict, user_roles, assignment_group):
+    def new_user_data(self, org_name: str, directory_user: dict, user_roles, assignment_group) -> tuple[DetailedUserInfo, UserGroupsInfo]:
         """
-        Constructs the data for insertion and inserts new user in the Sign Console
-        :param sign_connector:
+        Constructs the data for inserting a new user in the Sign Console, and for assigning its primary group
+        :param org_name:
         :param directory_user:
         :param user_roles:
-        :param group_id:
         :param assignment_group:
-        :return:
+        :return: (user, user groups)
         """
         new_user = DetailedUserInfo(
             accountType='GLOBAL', # ignored on POST
@@ -390,35 +670,47 @@ class SignSyncEngine:
             firstName=directory_user['firstname'],
             lastName=directory_user['lastname'],
         )
-        try:
-            user_id = sign_connector.insert_user(new_user)
-            self.sign_users_created.add(directory_user['email'])
-            self.logger.info(f"{self.org_string(sign_connector.console_org)}Inserted sign user '{new_user.email}', admin?: {new_user.isAccountAdmin}")
-
-            group_to_assign: GroupInfo = self.sign_groups[org_name][assignment_group.lower()]
-
-            is_group_admin = 'GROUP_ADMIN' in user_roles
-            group_update_data = UserGroupsInfo(groupInfoList=[UserGroupInfo(
-                id=group_to_assign.groupId,
-                name=group_to_assign.groupName,
-                isGroupAdmin=is_group_admin,
-                isPrimaryGroup=True,
-                status='ACTIVE',
-            )])
+        group_to_assign: GroupInfo = self.sign_groups[org_name][assignment_group.lower()]
+        group_update_data = UserGroupsInfo(groupInfoList=[UserGroupInfo(
+            id=group_to_assign.groupId,
+            name=group_to_assign.groupName,
+            isGroupAdmin='GROUP_ADMIN' in user_roles,
+            isPrimaryGroup=True,
+            status='ACTIVE',
+        )])
+        return new_user, group_update_data
 
-            sign_connector.update_user_group_single(user_id, group_update_data)
-            self.logger.info(f"{self.org_string(sign_connector.console_org)}Assigned '{new_user.email}' to group '{group_to_assign.groupName}', group admin?: {is_group_admin}")
-        except ClientException as e:
-            self.logger.error(format(e))
+    def insert_new_users(self, org_name: str, sign_connector: SignConnector, new_users: list[tuple[DetailedUserInfo, UserGroupsInfo]]):
+        """
+        Inserts new users in the Sign Console and assigns their primary groups.  The users are inserted
+        concurrently, and each user's outcome is reported separately.
+        :param org_name:
+        :param sign_connector:
+        :param new_users: list of (user, user groups) from new_user_data()
+        :return:
+        """
+        if not new_users:
+            return
+        self.logger.info(f"{self.org_string(org_name)}Inserting {len(new_users)} new Sign users")
+        groups_by_email = {user.email: groups.groupInfoList[0] for user, groups in new_users}
+        for result in sign_connector.insert_users(new_users):
+            new_user = result.user
+            # in test mode nothing is inserted, so there is no user id
+            if result.user_id is not None or result.error is None:
+                self.sign_users_created.add((org_name, new_user.email))
+                self.logger.info(f"{self.org_string(org_name)}Inserted sign user '{new_user.email}', admin?: {new_user.isAccountAdmin}")
+            if result.error is not None:
+                self.logger.error(f"{self.org_string(org_name)}{result.error}")
+                continue
+            group = groups_by_email[new_user.email]
+            self.logger.info(f"{self.org_string(org_name)}Assigned '{new_user.email}' to group '{group.name}', group admin?: {group.isGroupAdmin}")
 
-    def handle_sign_only_users(self, sign_connector: SignConnector, org_name: str):
+    def handle_sign_only_users(self, sign_connector: SignConnector, org_name: str, plan: SignOrgPlan):
         """
-        Searches users to set to default group in GPS and deactivate in the Sign Neptune console
-        :param directory_users:
+        Plans setting sign-only users to the default group, or deactivating them in the Sign Neptune console
         :param sign_connector:
-        :param sign_user:
         :param org_name:
-        :param default_group:
+        :param plan: where the changes are added
         :return:
         """
 
@@ -427,36 +719,32 @@ class SignSyncEngine:
             return
 
         sign_only_user_action = self.options['user_sync']['sign_only_user_action']
-        users_update_list = []
-        groups_update_list = []
-        for user in self.sign_only_users_by_org[org_name].values():
+        sign_only_users = self.sign_only_users_by_org[org_name].values()
+        users_update_list = plan.user_updates
+        groups_update_list = plan.user_group_updates
+        if sign_connector.deactivate_users and sign_only_user_action == 'deactivate':
+            plan.deactivations.extend((user.id, user.email) for user in sign_only_users)
+        for user in sign_only_users:
             if sign_only_user_action == 'exclude':
                 self.logger.debug(
                     f"Sign user '{user.email}' was excluded from sync. sign_only_user_action: set to '{sign_only_user_action}'")
                 continue
-            elif sign_connector.deactivate_users and sign_only_user_action == 'deactivate':
-                try:
-                    state = UserStateInfo(
-                        state='INACTIVE',
-                        comment='Deactivated by User Sync Tool'
-                    )
-                    sign_connector.update_user_state(user.id, state)
-                    self.sign_users_deactivated.add(user.email)
-                    self.logger.info(f"{self.org_string(org_name)}Deactivated sign user '{user.email}'")
-                except ClientException as e:
-                    self.logger.error(format(e))
-                    continue
 
-            in_default_group = self.sign_user_primary_groups[org_name][user.id].id == self.default_groups[org_name].groupId
-            is_group_admin = self.sign_user_primary_groups[org_name][user.id].isGroupAdmin
+            current_group: UserGroupInfo = self.sign_user_primary_groups[org_name].get(user.id)
+            if current_group is None:
+                self.logger.warning(f"{self.org_string(org_name)}Groups of Sign user '{user.email}' are unknown; "
+                                    f"it is left as it is")
+                continue
+            in_default_group = current_group.id == self.default_groups[org_name].groupId
+            is_group_admin = current_group.isGroupAdmin
 
             if in_default_group and not is_group_admin and not user.isAccountAdmin:
                 continue
 
             # set up group update in case we end up making one
             new_user_group = UserGroupInfo(
-                id=self.sign_user_primary_groups[org_name][user.id].id,
-                isGroupAdmin=self.sign_user_primary_groups[org_name][user.id].isGroupAdmin,
+                id=current_group.id,
+                isGroupAdmin=current_group.isGroupAdmin,
                 isPrimaryGroup=True,
                 status='ACTIVE',
             )
@@ -476,19 +764,15 @@ class SignSyncEngine:
 
             # remove admin status if needed
             if sign_only_user_action in ['remove_roles', 'reset'] and user.isAccountAdmin:
-                    user_update = DetailedUserInfo(**user.__dict__)
-                    user_update.isAccountAdmin = False
                     self.logger.info(f"{self.org_string(org_name)}Removing account admin status for user '{user.email}'")
-                    users_update_list.append(user_update)
-
-        sign_connector.update_users(users_update_list)
-        sign_connector.update_user_groups(groups_update_list)
+                    users_update_list.append((user.id, {'isAccountAdmin': False}))
 
     def check_sign_max_limit(self, org_name):
         stray_count = len(self.sign_only_users_by_org[org_name])
         sign_only_limit = self.options['user_sync']['sign_only_limit']
-        return check_max_limit(stray_count, sign_only_limit, self.total_sign_user_count, 0, 'Sign', self.logger,
+        sign_user_count = len(self.sign_users_by_org.get(org_name, ()))
+        return check_max_limit(stray_count, sign_only_limit, sign_user_count, 0, 'Sign', self.logger,
                                self.org_string(org_name))
 
     def org_string(self, org):
-        return "Org: {} - ".format(org.capitalize()) if len(self.connectors) > 1 else ""
+        return "Org: {} - ".format(org.capitalize()) if len(self.target_options) > 1 else ""
@@ -352,6 +352,18 @@ class RuleProcessor(object):
             umapi_info = self.get_umapi_info(adobe_group.get_umapi_name())
             umapi_info.add_mapped_group(adobe_group.get_group_name())
 
+    def get_directory_request(self, mappings):
+        """
+        What read_desired_user_groups will ask the directory connector for
+        :type mappings: dict(str, list(AdobeGroup))
+        :rtype tuple(set(str), list(str), bool): groups, extended attributes, and whether all users are needed
+        """
+        directory_group_filter = self.options['directory_group_filter']
+        directory_groups = set(mappings.keys()) if self.will_process_groups() else set()
+        if directory_group_filter is not None:
+            directory_groups.update(directory_group_filter)
+        return directory_groups, self.options.get('extended_attributes'), directory_group_filter is None
+
     def read_desired_user_groups(self, mappings, directory_connector):
         """
         :type mappings: dict(str, list(AdobeGroup))
@@ -363,14 +375,11 @@ class RuleProcessor(object):
         directory_group_filter = options['directory_group_filter']
         if directory_group_filter is not None:
             directory_group_filter = set(directory_group_filter)
-        extended_attributes = options.get('extended_attributes')
 
-        directory_groups = set(mappings.keys()) if self.will_process_groups() else set()
-        if directory_group_filter is not None:
-            directory_groups.update(directory_group_filter)
+        directory_groups, extended_attributes, all_users = self.get_directory_request(mappings)
         directory_users = directory_connector.load_users_and_groups(groups=directory_groups,
                                                                     extended_attributes=extended_attributes,
-                                                                    all_users=directory_group_filter is None)
+                                                                    all_users=all_users)
 
         for directory_user in directory_users:
             user_key = self.get_directory_user_key(directory_user)
@@ -18,10 +18,14 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import bz2
 import csv
 import datetime
+import gzip
+import lzma
 import os
 import sys
+from operator import itemgetter
 
 from user_sync.error import AssertionException
 
@@ -52,8 +56,18 @@ class CSVAdapter:
     """
     Read and write CSV files to and from lists of dictionaries
     """
-    @staticmethod
-    def open_csv_file(name, mode, encoding=None):
+    # input files can have millions of rows, so read them in large chunks rather than line by line
+    read_buffer_size = 1024 * 1024
+
+    # compressed input files are decompressed transparently, based on their extension
+    compression_openers = {
+        '.gz': gzip.open,
+        '.bz2': bz2.open,
+        '.xz': lzma.open,
+    }
+
+    @classmethod
+    def open_csv_file(cls, name, mode, encoding=None):
         """
         :type name: str
         :type mode: str
@@ -61,11 +75,14 @@ class CSVAdapter:
         :rtype file
         """
         try:
+            opener = cls.compression_openers.get(normalize_string(os.path.splitext(str(name))[1]))
+            if mode == 'r' and opener is not None:
+                return opener(str(name), 'rt', newline='', encoding=encoding)
             if mode == 'r':
                 if is_py2():
-                    return open(str(name), 'rb', buffering=1)
+                    return open(str(name), 'rb', buffering=cls.read_buffer_size)
                 else:
-                    kwargs = dict(buffering=1, newline='', encoding=encoding)
+                    kwargs = dict(buffering=cls.read_buffer_size, newline='', encoding=encoding)
                     return open(str(name), 'r', **kwargs)
             elif mode == 'w':
                 if is_py2():
@@ -78,13 +95,16 @@ class CSVAdapter:
         except IOError as e:
             raise AssertionException("Can't open file '%s': %s" % (name, e))
 
-    @staticmethod
-    def guess_delimiter_from_filename(filename):
+    @classmethod
+    def guess_delimiter_from_filename(cls, filename):
         """
         :type filename
         :rtype str
         """
         _base_name, extension = os.path.splitext(filename)
+        if normalize_string(extension) in cls.compression_openers:
+            # look at the extension under the compression suffix, e.g. '.csv' for 'users.csv.gz'
+            _base_name, extension = os.path.splitext(_base_name)
         normalized_extension = normalize_string(extension)
         if normalized_extension == '.csv':
             return ','
@@ -129,6 +149,62 @@ class CSVAdapter:
             except UnicodeError as e:
                 raise AssertionException("Encoding error in file '%s': %s" % (file_path, e))
 
+    @classmethod
+    def read_csv_columns(cls, file_path, column_names, logger=None, encoding='utf8', delimiter=None):
+        """
+        Faster alternative to read_csv_rows for large files.  Column positions are resolved once from
+        the header row, and each row is yielded as a tuple of values in the order of column_names.
+        Columns missing from the file or the row, and empty values, are returned as None.
+        :type file_path: str
+        :type column_names: list(str)
+        :type logger: logging.Logger
+        :type encoding: str
+        :type delimiter: str
+        :rtype iterable(tuple)
+        """
+        with cls.open_csv_file(file_path, 'r', encoding) as input_file:
+            if delimiter is None:
+                delimiter = cls.guess_delimiter_from_filename(file_path)
+            try:
+                reader = csv.reader(input_file, delimiter=delimiter)
+                header = next(reader, None)
+                if header is None:
+                    return
+                unrecognized_column_names = [column_name for column_name in header
+                                             if column_name not in column_names]
+                if len(unrecognized_column_names) > 0 and logger is not None:
+                    logger.warning("In file '%s': unrecognized column names: %s", file_path, unrecognized_column_names)
+
+                # as with csv.DictReader, the last of any duplicated header names wins
+                width = len(header)
+                position_by_name = {name: i for i, name in enumerate(header)}
+                # columns that aren't in the file read from a blank cell appended to every row
+                positions = [position_by_name.get(name, width) for name in column_names]
+                if not positions:
+                    return
+                get_values = itemgetter(*positions)
+                padding = [''] * (width + 1)
+                single = len(positions) == 1
+                for row in reader:
+                    if not row:
+                        continue
+                    row_width = len(row)
+                    if row_width > width:
+                        del row[width:]
+                        row.append('')
+                    else:
+                        row.extend(padding[row_width:])
+                    values = get_values(row)
+                    if single:
+                        yield (values or None,)
+                    else:
+                        yield tuple([v or None for v in values])
+            except UnicodeError as e:
+                raise AssertionException("Encoding error in file '%s': %s" % (file_path, e))
+            except (OSError, EOFError, lzma.LZMAError) as e:
+                # truncated or corrupt compressed input only shows up once reading starts
+                raise AssertionException("Error reading file '%s': %s" % (file_path, e))
+
     @classmethod
     def write_csv_rows(cls, file_path, field_names, rows, encoding='utf8', delimiter=None):
         """
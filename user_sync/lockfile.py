@@ -39,20 +39,37 @@ class ProcessLock(object):
             return False
 
         lock_pid = int(lock_pid)
-        
+
         if psutil.pid_exists(lock_pid):
             return True
         else:
             return False
 
     def set_lock(self):
-        success = False
-        if not self.is_locked():
-            pid = os.getpid()
-            with open(self.path, 'w') as f:
-                f.write(str(pid))
-            success = True
-        return success 
+        pid = str(os.getpid()).encode()
+        try:
+            # create the file only if it doesn't exist, so two processes can't both take the lock
+            fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            # an empty lock file has just been created by another process, which hasn't written its pid yet
+            if self.is_locked() or not self.lock_pid_written():
+                return False
+            # the lock was left by a process that is gone; take it over, unless another process just did
+            try:
+                os.remove(self.path)
+                fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except (FileNotFoundError, FileExistsError):
+                return False
+        with os.fdopen(fd, 'wb') as f:
+            f.write(pid)
+        return True
+
+    def lock_pid_written(self):
+        try:
+            return os.path.getsize(self.path) > 0
+        except FileNotFoundError:
+            return True
 
     def unlock(self):
-        os.remove(self.path)
+        if os.path.exists(self.path):
+            os.remove(self.path)